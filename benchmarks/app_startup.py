@@ -0,0 +1,82 @@
+"""Cold-start and rerun latency of each page of the Streamlit app, headless
+
+Every page is run in a fresh interpreter (so imports are cold) against a
+temporary directory of synthetic ledgers, using Streamlit's AppTest:
+
+    python benchmarks/app_startup.py [--script cashflow-app.py] [--rows 10000] [--repeat 5]
+
+Pass an older copy of the script with --script to compare before/after.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGES = ["📊 Dashboard", "📈 Pemasukan", "📉 Pengeluaran", "💎 Investasi"]
+
+
+def child(script, menu, rows, repeat):
+    """Time one page in this (fresh) process and print the result as JSON"""
+    start = time.perf_counter()
+    import synthetic
+    from cashflow import ledger
+    from streamlit.testing.v1 import AppTest
+    baseline = time.perf_counter() - start
+
+    os.chdir(tempfile.mkdtemp(prefix='cashflow-app-'))
+    for tipe, frame in synthetic.ledgers(rows).items():
+        ledger.get_backend().write(ledger.LEDGERS[tipe], frame)
+
+    app = AppTest.from_file(os.path.abspath(script), default_timeout=120)
+    app.session_state['menu'] = menu
+    start = time.perf_counter()
+    app.run()
+    cold = time.perf_counter() - start
+    if app.exception:
+        raise SystemExit(f'{menu}: {app.exception[0].message}')
+
+    reruns = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        app.run()
+        reruns.append(time.perf_counter() - start)
+    reruns.sort()
+    print(json.dumps({
+        'import_ms': baseline * 1000,
+        'cold_ms': cold * 1000,
+        'rerun_ms': reruns[len(reruns) // 2] * 1000,
+        'plotly_express': 'plotly.express' in sys.modules,
+    }))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure cold start and rerun latency per page')
+    parser.add_argument('--script', default=os.path.join(ROOT, 'cashflow-app.py'))
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        child(args.script, args.child, args.rows, args.repeat)
+        return
+
+    print(f'{os.path.relpath(args.script)} · {args.rows:,} baris')
+    print(f'  {"halaman":<16}{"cold start (ms)":>17}{"rerun (ms)":>12}  plotly.express')
+    for menu in PAGES:
+        output = subprocess.run(
+            [sys.executable, __file__, '--child', menu, '--script', args.script,
+             '--rows', str(args.rows), '--repeat', str(args.repeat)],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f'  {menu:<16}{result["cold_ms"]:>17.1f}{result["rerun_ms"]:>12.1f}  '
+              f'{"ya" if result["plotly_express"] else "tidak"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Compare month filtering by strftime strings with integer month keys
+
+Usage: python benchmarks/month_filter.py [rows ...]   (default 100000 1000000)
+"""
+import sys
+import time
+
+import synthetic  # also puts the repository root on sys.path
+from cashflow.query import MonthIndex, month_code, month_codes
+
+
+def best_of(func, repeat=5):
+    """Fastest of repeat runs of func, in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def run(rows):
+    df = synthetic.ledger('Pengeluaran', rows)
+    month = '2023-06'
+    code = month_code(month)
+    codes = month_codes(df['Tanggal'])
+    index = MonthIndex(df)
+
+    expected = df[df['Tanggal'].dt.strftime('%Y-%m') == month]
+    assert index.slice(df, month).equals(expected)
+    assert df[codes == code].equals(expected)
+
+    results = {
+        'strftime ==': best_of(lambda: df[df['Tanggal'].dt.strftime('%Y-%m') == month]),
+        'month key ==': best_of(lambda: df[month_codes(df['Tanggal']) == code]),
+        'build index': best_of(lambda: MonthIndex(df)),
+        'searchsorted': best_of(lambda: index.slice(df, month)),
+    }
+    baseline = results['strftime ==']
+    print(f'{rows:,} baris, bulan {month} ({len(expected):,} baris)')
+    for name, ms in results.items():
+        print(f'  {name:<14}{ms:10.3f} ms  {baseline / ms:8.1f}x')
+
+
+if __name__ == '__main__':
+    for rows in [int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000]:
+        run(rows)
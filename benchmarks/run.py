@@ -0,0 +1,157 @@
+"""Headless benchmark of the ledger data paths used by the app
+
+Generates synthetic ledgers, stores them in a temporary directory with the
+chosen backend and reports wall time (best of --repeat runs) and peak traced
+memory for each operation:
+
+    python benchmarks/run.py --rows 10000 100000 1000000 --backend csv
+    python benchmarks/run.py --json results.json
+    python benchmarks/run.py --baseline results.json   # exit 1 on regressions
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic  # noqa: E402
+from cashflow import aggregates, combined, export, ledger, storage  # noqa: E402
+from cashflow.query import MonthIndex  # noqa: E402
+
+# Slowdowns below this many milliseconds are treated as noise by --baseline
+NOISE_MS = 2.0
+
+
+def measure(func, repeat, setup=None):
+    """(best wall time in ms, peak traced memory in MB) of func()
+
+    Memory is traced on a separate first run, since tracing slows the timed ones.
+    """
+    if setup:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000, peak / 2**20
+
+
+def make_backend(name, directory):
+    if name == 'sqlite':
+        return storage.SqliteBackend(os.path.join(directory, 'cashflow.db'))
+    return storage.BACKENDS[name]()
+
+
+def bench(rows, backend_name, repeat):
+    """Results {operation: {'ms': ..., 'mb': ...}} for one ledger size"""
+    directory = tempfile.mkdtemp(prefix='cashflow-bench-')
+    try:
+        ledgers = {tipe: os.path.join(directory, name) for tipe, name in ledger.LEDGERS.items()}
+        frames = synthetic.ledgers(rows)
+        backend = ledger.set_backend(make_backend(backend_name, directory))
+        for tipe, filename in ledgers.items():
+            backend.init(filename, migrate=False)
+            backend.write(filename, frames[tipe])
+
+        filename = ledgers['Pengeluaran']
+        df = ledger.load_data(filename)
+        month = MonthIndex(df).months()[0]
+        row = {'Tanggal': month + '-15', 'Kategori': 'Makan', 'Jumlah': 25_000, 'Keterangan': 'benchmark'}
+        victims = iter(df['ID'].sample(repeat + 1, random_state=0).tolist())
+
+        def rebuild_combined():
+            return combined.CombinedLedger({tipe: ledger.load_data(name) for tipe, name in ledgers.items()})
+
+        def export_all():
+            with open(os.devnull, 'wb') as f:
+                export.write(f, ledgers=ledgers)
+
+        def aggregate():
+            agg = aggregates.LedgerAggregates(ledger.load_data(filename))
+            return agg.total(month), agg.by_kategori(month), agg.daily(month)
+
+        operations = {
+            'load_data (cold)': (lambda: ledger.load_data(filename), lambda: ledger.invalidate(filename)),
+            'load_data (cached)': (lambda: ledger.load_data(filename), None),
+            'save_data + reload': (lambda: (ledger.save_data(filename, row), ledger.load_data(filename)), None),
+            'delete_row + reload': (lambda: (ledger.delete_row(filename, next(victims)), ledger.load_data(filename)), None),
+            'month index build': (lambda: MonthIndex(ledger.load_data(filename)), None),
+            'month filter': (lambda: ledger.load_month(filename, month), None),
+            'aggregates build': (aggregate, None),
+            'aggregates (cached)': (lambda: aggregates.get(filename).by_kategori(month), None),
+            'combined rebuild': (rebuild_combined, None),
+            'combined CSV export': (export_all, None),
+        }
+        results = {}
+        for name, (func, setup) in operations.items():
+            ms, mb = measure(func, repeat, setup)
+            results[name] = {'ms': round(ms, 3), 'mb': round(mb, 2)}
+        return results
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def report(rows, backend_name, results):
+    print(f'\n{rows:,} baris · backend {backend_name}')
+    print(f'  {"operasi":<22}{"waktu (ms)":>12}{"memori (MB)":>14}')
+    for name, result in results.items():
+        print(f'  {name:<22}{result["ms"]:>12.2f}{result["mb"]:>14.2f}')
+
+
+def regressions(results, baseline, tolerance):
+    """Lines describing operations slower than tolerance x their baseline time"""
+    found = []
+    for key, ops in results.items():
+        for name, result in ops.items():
+            before = baseline.get(key, {}).get(name)
+            if before and result['ms'] > before['ms'] * tolerance + NOISE_MS:
+                found.append(f'{key} {name}: {before["ms"]:.2f} -> {result["ms"]:.2f} ms')
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the ledger data paths on synthetic data')
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help='total transactions across the three ledgers (e.g. 10000 ... 5000000)')
+    parser.add_argument('--backend', choices=sorted(storage.BACKENDS), default='csv')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='compare with a --json file and exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=1.5, help='allowed slowdown factor (default 1.5)')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for rows in args.rows:
+        key = f'{args.backend}/{rows}'
+        results[key] = bench(rows, args.backend, args.repeat)
+        report(rows, args.backend, results[key])
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for line in slower:
+            print(f'REGRESI {line}')
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
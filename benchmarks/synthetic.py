@@ -0,0 +1,75 @@
+"""Synthetic ledgers with realistic categories, amounts and multi-year dates"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cashflow.storage import typed_frame  # noqa: E402
+
+# Per type: share of all transactions and {kategori: (weight, median Jumlah)}
+PROFILES = {
+    'Pemasukan': (0.08, {
+        'Gaji Pokok': (0.45, 8_000_000),
+        'Tunjangan Kinerja': (0.25, 3_000_000),
+        'Uang Perjalanan Dinas': (0.15, 1_500_000),
+        'Bonus': (0.05, 5_000_000),
+        'Lain-lain': (0.10, 500_000),
+    }),
+    'Pengeluaran': (0.80, {
+        'Makan': (0.30, 35_000),
+        'Minum': (0.12, 15_000),
+        'Transportasi': (0.18, 25_000),
+        'Belanja': (0.12, 150_000),
+        'Hiburan': (0.06, 100_000),
+        'Pulsa': (0.04, 50_000),
+        'Kuota Internet': (0.04, 100_000),
+        'Listrik': (0.03, 300_000),
+        'Persembahan': (0.04, 100_000),
+        'Kasih Ortu': (0.02, 1_000_000),
+        'Lain-lain': (0.05, 75_000),
+    }),
+    'Investasi': (0.12, {
+        'Reksadana': (0.35, 500_000),
+        'BBRI': (0.15, 1_000_000),
+        'BBCA': (0.15, 1_500_000),
+        'BMRI': (0.08, 1_000_000),
+        'BBNI': (0.07, 800_000),
+        'Gold': (0.10, 2_000_000),
+        'GOOG': (0.04, 2_500_000),
+        'MSFT': (0.03, 2_500_000),
+        'APPL': (0.02, 2_500_000),
+        'TSLA': (0.01, 2_500_000),
+    }),
+}
+
+
+def ledger(tipe, rows, years=5, end='2026-10-31', seed=0):
+    """Typed ledger of rows transactions of one type over the last `years` years, in date order"""
+    rng = np.random.default_rng([seed, list(PROFILES).index(tipe)])
+    kategori, weights, medians = zip(*((name, w, m) for name, (w, m) in PROFILES[tipe][1].items()))
+    weights = np.array(weights) / sum(weights)
+
+    picks = rng.choice(len(kategori), size=rows, p=weights)
+    # Log-normal amounts around each category's median, rounded to Rp 500
+    amounts = np.array(medians)[picks] * rng.lognormal(0, 0.5, rows)
+    amounts = np.maximum(500, np.round(amounts / 500) * 500).astype('int64')
+    days = np.sort(rng.integers(0, years * 365, rows))
+
+    return typed_frame(pd.DataFrame({
+        'Tanggal': pd.Timestamp(end) - pd.to_timedelta(years * 365 - 1 - days, unit='D'),
+        'Kategori': pd.Categorical.from_codes(picks, categories=list(kategori)),
+        'Jumlah': amounts,
+        'Keterangan': '',
+        'ID': [f'{seed:08x}{tipe[:3].lower()}{i:021x}' for i in range(rows)],
+    }))
+
+
+def ledgers(rows, seed=0, **kwargs):
+    """{tipe: ledger} with about `rows` transactions in total, split by PROFILES shares"""
+    return {
+        tipe: ledger(tipe, max(1, round(rows * share)), seed=seed, **kwargs)
+        for tipe, (share, _) in PROFILES.items()
+    }
@@ -1,9 +1,12 @@
+import os
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
-import os
+from datetime import date, datetime
+
+from cashflow import aggregates, budgets, categories, combined, export, importer, portfolio, recurring, tenants, trace, worker
+from cashflow.ledger import save_data, delete_rows
+from cashflow.lru import LRUCache
+from cashflow.query import filter_ledger, page, page_count
 
 # Set page config
 st.set_page_config(
@@ -13,6 +16,13 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Hidden debug panel, opened with ?debug=1 in the URL
+DEBUG = st.query_params.get("debug") == "1"
+
+# Time the data and render phases of this rerun (CASHFLOW_TRACE=1 traces every rerun)
+if trace.ENABLED or DEBUG:
+    trace.start("rerun")
+
 # Custom CSS for better UI
 st.markdown("""
 <style>
@@ -117,147 +127,242 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Initialize CSV files
-PEMASUKAN_FILE = 'pemasukan.csv'
-PENGELUARAN_FILE = 'pengeluaran.csv'
-INVESTASI_FILE = 'investasi.csv'
-
-# Kategori default
-KATEGORI_PEMASUKAN = ['Gaji Pokok', 'Tunjangan Kinerja', 'Uang Perjalanan Dinas', 'Bonus', 'Lain-lain']
-KATEGORI_PENGELUARAN = ['Listrik', 'Makan', 'Minum', 'Transportasi', 'Pulsa', 'Kuota Internet', 'Persembahan', 'Kasih Ortu', 'Belanja', 'Hiburan', 'Lain-lain']
-KATEGORI_INVESTASI = ['Reksadana', 'BBRI', 'BBCA', 'BBNI', 'BMRI', 'Gold', 'APPL', 'GOOG', 'MSFT', 'TSLA']
-
-# Initialize session state for custom categories
-if 'custom_pemasukan' not in st.session_state:
-    st.session_state.custom_pemasukan = []
-if 'custom_pengeluaran' not in st.session_state:
-    st.session_state.custom_pengeluaran = []
-if 'custom_investasi' not in st.session_state:
-    st.session_state.custom_investasi = []
-
-# Functions to handle CSV
-def init_csv(filename, columns):
-    """Initialize CSV file if it doesn't exist"""
-    if not os.path.exists(filename):
-        df = pd.DataFrame(columns=columns)
-        df.to_csv(filename, index=False)
-
-def load_data(filename):
-    """Load data from CSV file"""
-    if os.path.exists(filename):
-        df = pd.read_csv(filename)
-        if not df.empty:
-            return df
-    return pd.DataFrame()
-
-def save_data(filename, data):
-    """Save data to CSV file"""
-    df = pd.DataFrame([data])
-    if os.path.exists(filename) and os.path.getsize(filename) > 0:
-        df.to_csv(filename, mode='a', header=False, index=False)
-    else:
-        df.to_csv(filename, index=False)
+# Page settings per transaction type; the ledger files are in LEDGERS
+TIPE_CONFIG = {
+    'Pemasukan': {
+        'key': 'pemasukan',
+        'menu': "📈 Pemasukan",
+        'title': "📈 Catat Pemasukan",
+        'tagline': "*Transparansi keuangan dimulai dari pencatatan yang baik*",
+        'item': "Kategori",
+        'kategori_label': "🏷️ Kategori",
+        'step': 10000,
+        'keterangan_placeholder': None,
+        'new_placeholder': "Contoh: Freelance, Bonus, dll",
+        'balloons': True,
+        'portfolio': False,
+        'budget': False,
+        'empty': "📝 Belum ada data pemasukan. Yuk mulai catat pemasukan pertamamu!",
+        'card': ("💰 Total Pemasukan", "#667eea", "#764ba2"),
+        'pie': ("#### 💰 Pemasukan", 'Greens_r'),
+    },
+    'Pengeluaran': {
+        'key': 'pengeluaran',
+        'menu': "📉 Pengeluaran",
+        'title': "📉 Catat Pengeluaran",
+        'tagline': "*Pantau setiap rupiah yang keluar dari kantong*",
+        'item': "Kategori",
+        'kategori_label': "🏷️ Kategori",
+        'step': 5000,
+        'keterangan_placeholder': None,
+        'new_placeholder': "Contoh: Gym, Skincare, dll",
+        'balloons': False,
+        'portfolio': False,
+        'budget': True,
+        'empty': "📝 Belum ada data pengeluaran. Mulai tracking pengeluaranmu!",
+        'card': ("💸 Total Pengeluaran", "#f093fb", "#f5576c"),
+        'pie': ("#### 💸 Pengeluaran", 'Reds_r'),
+    },
+    'Investasi': {
+        'key': 'investasi',
+        'menu': "💎 Investasi",
+        'title': "💎 Catat Investasi",
+        'tagline': "*Investasi adalah kunci kebebasan finansial*",
+        'item': "Instrumen",
+        'kategori_label': "🏷️ Instrumen Investasi",
+        'step': 50000,
+        'keterangan_placeholder': "Contoh: Beli 10 lot, DCA bulan ini",
+        'new_placeholder': "Contoh: TLKM, UNVR, Bitcoin, ETF",
+        'balloons': True,
+        'portfolio': True,
+        'budget': False,
+        'empty': "📝 Belum ada data investasi. Mulai investasi untuk masa depan!",
+        'card': ("📈 Total Investasi", "#4facfe", "#00f2fe"),
+        'pie': ("#### 📈 Investasi", 'Blues_r'),
+    },
+}
+
+# Header with the signed-in user, set by an authenticating reverse proxy
+USER_HEADER = os.environ.get('CASHFLOW_USER_HEADER')
+
+def current_tenant():
+    """Ledgers of the signed-in user (each user's own with CASHFLOW_DATA_DIR, else the shared ones)"""
+    if tenants.DATA_DIR is None:
+        return tenants.get()
+    user = None
+    if st.user.get('is_logged_in') is not False:
+        user = st.user.get('email') or st.user.get('sub')
+    if not user and USER_HEADER:
+        user = st.context.headers.get(USER_HEADER)
+    if not user:
+        st.title("💰 Cashflow Tracker Pro")
+        st.info("🔐 Silakan masuk untuk melihat catatan keuanganmu.")
+        if not USER_HEADER and st.button("Masuk", key="login"):
+            st.login()
+        st.stop()
+    return tenants.get(tenants.tenant_id(user))
 
-def delete_row(filename, index):
-    """Delete a row from CSV file"""
-    df = load_data(filename)
-    if not df.empty:
-        df = df.drop(index)
-        df.reset_index(drop=True, inplace=True)
-        df.to_csv(filename, index=False)
+TENANT = current_tenant()
+# Ledger file of each transaction type for this user
+LEDGERS = TENANT.ledgers
 
-# Initialize CSV files
-init_csv(PEMASUKAN_FILE, ['Tanggal', 'Kategori', 'Jumlah', 'Keterangan'])
-init_csv(PENGELUARAN_FILE, ['Tanggal', 'Kategori', 'Jumlah', 'Keterangan'])
-init_csv(INVESTASI_FILE, ['Tanggal', 'Kategori', 'Jumlah', 'Keterangan'])
+# Initialize the ledger files, and unload idle users if memory is over budget
+TENANT.init()
+tenants.touch(TENANT)
+# Compaction and aggregate refreshes run in a background thread, off the request path
+worker.watch(LEDGERS)
+# Write the recurring transactions that fell due since the last visit (one append per ledger)
+recurring.materialize(LEDGERS)
 
 # Helper function to format currency
 def format_currency(amount):
     """Format number to Indonesian Rupiah"""
     return f"Rp {amount:,.0f}".replace(",", ".")
 
-# Sidebar navigation with icons
-st.sidebar.markdown("""
-    <div style='text-align: center; padding: 20px;'>
-        <h1 style='color: white; font-size: 2.5em;'>💰</h1>
-        <h2 style='color: white; margin: 0;'>Cashflow Tracker</h2>
-        <p style='color: #b8c6db; margin-top: 5px;'>Kelola Keuangan Lebih Mudah</p>
-    </div>
-""", unsafe_allow_html=True)
+def format_units(units):
+    """Number of units with up to 4 decimals, e.g. 1.500 or 2,5"""
+    text = f"{units:,.4f}".rstrip("0").rstrip(".")
+    return text.replace(",", "_").replace(".", ",").replace("_", ".")
 
-st.sidebar.markdown("---")
-
-# Initialize session state for menu
-if 'menu' not in st.session_state:
-    st.session_state.menu = "📊 Dashboard"
+def format_percent(value):
+    """Percentage with 2 decimals, or '-' if unknown"""
+    return f"{value:.2f}%".replace(".", ",") if pd.notna(value) else "-"
 
-# Custom styled navigation buttons
-st.sidebar.markdown("<h3 style='color: white; text-align: center; margin-bottom: 20px;'>📍 NAVIGASI</h3>", unsafe_allow_html=True)
+# Labels of the recurring rule frequencies, and the unit of their interval
+FREQUENCY_LABELS = {'monthly': "Bulanan", 'weekly': "Mingguan", 'daily': "Harian"}
+FREQUENCY_UNITS = {'monthly': "bulan", 'weekly': "minggu", 'daily': "hari"}
 
-# Dashboard button
-if st.sidebar.button("📊", key="nav_dashboard", use_container_width=True):
-    st.session_state.menu = "📊 Dashboard"
-st.sidebar.markdown("""
-<div style='margin-top: -10px; margin-bottom: 15px;'>
-    <p style='color: {}; text-align: center; font-size: 14px; font-weight: bold;'>Dashboard</p>
-</div>
-""".format('#4facfe' if st.session_state.menu == "📊 Dashboard" else '#b8c6db'), unsafe_allow_html=True)
+def format_schedule(frequency, interval):
+    """Schedule of a recurring rule, e.g. Bulanan or Setiap 3 bulan"""
+    return FREQUENCY_LABELS[frequency] if interval == 1 else f"Setiap {interval} {FREQUENCY_UNITS[frequency]}"
 
-# Pemasukan button
-if st.sidebar.button("📈", key="nav_pemasukan", use_container_width=True):
-    st.session_state.menu = "📈 Pemasukan"
-st.sidebar.markdown("""
-<div style='margin-top: -10px; margin-bottom: 15px;'>
-    <p style='color: {}; text-align: center; font-size: 14px; font-weight: bold;'>Pemasukan</p>
-</div>
-""".format('#4facfe' if st.session_state.menu == "📈 Pemasukan" else '#b8c6db'), unsafe_allow_html=True)
+def format_day(day):
+    return day.strftime('%d/%m/%Y') if pd.notna(day) else "-"
 
-# Pengeluaran button
-if st.sidebar.button("📉", key="nav_pengeluaran", use_container_width=True):
-    st.session_state.menu = "📉 Pengeluaran"
-st.sidebar.markdown("""
-<div style='margin-top: -10px; margin-bottom: 15px;'>
-    <p style='color: {}; text-align: center; font-size: 14px; font-weight: bold;'>Pengeluaran</p>
-</div>
-""".format('#4facfe' if st.session_state.menu == "📉 Pengeluaran" else '#b8c6db'), unsafe_allow_html=True)
+# Labels of the export formats
+EXPORT_LABELS = {'csv': "CSV", 'csv.gz': "CSV (gzip)", 'parquet': "Parquet"}
 
-# Investasi button
-if st.sidebar.button("💎", key="nav_investasi", use_container_width=True):
-    st.session_state.menu = "💎 Investasi"
-st.sidebar.markdown("""
-<div style='margin-top: -10px; margin-bottom: 15px;'>
-    <p style='color: {}; text-align: center; font-size: 14px; font-weight: bold;'>Investasi</p>
-</div>
-""".format('#4facfe' if st.session_state.menu == "💎 Investasi" else '#b8c6db'), unsafe_allow_html=True)
+# Sort options for the history tables: label -> (column, ascending)
+SORT_OPTIONS = {
+    "Tanggal terbaru": ('Tanggal', False),
+    "Tanggal terlama": ('Tanggal', True),
+    "Jumlah terbesar": ('Jumlah', False),
+    "Jumlah terkecil": ('Jumlah', True),
+}
 
-menu = st.session_state.menu
+def render_history(tipe):
+    """Render a filtered, sorted and paginated history table for a transaction type"""
+    config = TIPE_CONFIG[tipe]
+    key = config['key']
+    df = combined.load(LEDGERS).view(tipe)
+    if df.empty:
+        st.info(config['empty'])
+        return
+    
+    col_h1, col_h2 = st.columns([3, 1])
+    with col_h1:
+        st.markdown(f"### 📋 Riwayat {tipe}")
+    with col_h2:
+        st.metric("Total", format_currency(df['Jumlah'].sum()))
+    
+    # A keyed date_input keeps its first value, so the range is reset to the
+    # data's first and last date whenever they move; new rows stay visible
+    bounds = (df['Tanggal'].min().date(), df['Tanggal'].max().date())
+    if st.session_state.get(f"range_bounds_{key}") != bounds:
+        st.session_state[f"range_bounds_{key}"] = bounds
+        st.session_state[f"range_{key}"] = bounds
+    
+    col1, col2, col3, col4 = st.columns([3, 3, 2, 2])
+    with col1:
+        date_range = st.date_input("📅 Rentang Tanggal", key=f"range_{key}")
+    with col2:
+        kategori = st.multiselect("🏷️ Kategori", options=sorted(df['Kategori'].unique().astype(str)), key=f"kategori_{key}")
+    with col3:
+        sort_label = st.selectbox("↕️ Urutkan", options=list(SORT_OPTIONS), key=f"sort_{key}")
+    with col4:
+        page_size = st.selectbox("📄 Per Halaman", options=[10, 25, 50, 100], key=f"page_size_{key}")
+    
+    start = date_range[0] if len(date_range) > 0 else None
+    end = date_range[1] if len(date_range) > 1 else None
+    filtered = filter_ledger(df, start, end, kategori)
+    pages = page_count(len(filtered), page_size)
+    if st.session_state.get(f"page_{key}", 1) > pages:
+        st.session_state[f"page_{key}"] = pages
+    
+    sort_by, ascending = SORT_OPTIONS[sort_label]
+    page_number = st.session_state.get(f"page_{key}", 1)
+    rows = page(filtered, page_number, page_size, sort_by, ascending)
+    
+    table = pd.DataFrame({
+        'Tanggal': rows['Tanggal'].dt.strftime('%d/%m/%Y'),
+        'Kategori': rows['Kategori'].astype(str),
+        'Jumlah': rows['Jumlah'].map(format_currency),
+        'Keterangan': rows['Keterangan'].replace('', '-'),
+    })
+    # The selection holds row positions, so the table gets a new key (and an
+    # empty selection) whenever the filters, order, page or rows shown change
+    view = hash((start, end, tuple(kategori), sort_label, page_size, page_number, tuple(rows['ID'])))
+    event = st.dataframe(
+        table,
+        hide_index=True,
+        use_container_width=True,
+        on_select="rerun",
+        selection_mode="multi-row",
+        key=f"table_{key}_{view}"
+    )
+    selected_ids = rows['ID'].iloc[event.selection.rows].tolist()
+    
+    col1, col2, col3 = st.columns([2, 2, 2])
+    with col1:
+        st.number_input("Halaman", min_value=1, max_value=pages, step=1, key=f"page_{key}")
+    with col2:
+        st.markdown("<br>", unsafe_allow_html=True)
+        st.caption(f"Menampilkan {len(rows)} dari {len(filtered)} data · {pages} halaman")
+    with col3:
+        st.markdown("<br>", unsafe_allow_html=True)
+        if st.button(f"🗑️ Hapus Terpilih ({len(selected_ids)})", key=f"del_{key}", disabled=not selected_ids, use_container_width=True):
+            delete_rows(LEDGERS[tipe], selected_ids)
+            st.success(f"✅ {len(selected_ids)} data berhasil dihapus!")
+            st.rerun()
 
-# PEMASUKAN PAGE
-if menu == "📈 Pemasukan":
+def render_entry_page(tipe):
+    """Render the input form, custom category box and history of a transaction type"""
+    config = TIPE_CONFIG[tipe]
+    key = config['key']
+    item = config['item']
+    registry = categories.get(LEDGERS[tipe], tipe)
+    
     col_title1, col_title2 = st.columns([3, 1])
     with col_title1:
-        st.title("📈 Catat Pemasukan")
-        st.markdown("*Transparansi keuangan dimulai dari pencatatan yang baik*")
+        st.title(config['title'])
+        st.markdown(config['tagline'])
     
     st.markdown("<br>", unsafe_allow_html=True)
     
-    with st.form("form_pemasukan", clear_on_submit=True):
-        st.markdown("### 📝 Form Input Pemasukan")
+    alert = st.session_state.pop(f"budget_alert_{key}", None)
+    if alert is not None:
+        level, message = alert
+        getattr(st, level)(message)
+    
+    with st.form(f"form_{key}", clear_on_submit=True):
+        st.markdown(f"### 📝 Form Input {tipe}")
         
         col1, col2 = st.columns(2)
         
         with col1:
             tanggal = st.date_input("📅 Tanggal", datetime.now())
-            kategori_list = KATEGORI_PEMASUKAN + st.session_state.custom_pemasukan
-            kategori = st.selectbox("🏷️ Kategori", kategori_list)
+            kategori = st.selectbox(config['kategori_label'], registry.names())
             
         with col2:
-            jumlah = st.number_input("💵 Jumlah (Rp)", min_value=0, step=10000, format="%d")
-            keterangan = st.text_area("📋 Keterangan (Opsional)", height=100)
+            jumlah = st.number_input("💵 Jumlah (Rp)", min_value=0, step=config['step'], format="%d")
+            if config['portfolio']:
+                unit = st.number_input("📦 Jumlah Unit (Opsional)", min_value=0.0, step=1.0, format="%.4f",
+                                       help="Lembar saham, unit reksadana, gram emas, dst. Kosongkan untuk memakai harga penutupan hari itu.")
+            keterangan = st.text_area("📋 Keterangan (Opsional)", height=100, placeholder=config['keterangan_placeholder'])
         
         col_btn1, col_btn2, col_btn3 = st.columns([2, 2, 1])
         with col_btn1:
-            submitted = st.form_submit_button("💾 Simpan Pemasukan", use_container_width=True, type="primary")
+            submitted = st.form_submit_button(f"💾 Simpan {tipe}", use_container_width=True, type="primary")
         
         if submitted:
             if jumlah > 0:
@@ -267,464 +372,488 @@ if menu == "📈 Pemasukan":
                     'Jumlah': jumlah,
                     'Keterangan': keterangan
                 }
-                save_data(PEMASUKAN_FILE, data)
-                st.success("✅ Pemasukan berhasil disimpan!")
-                st.balloons()
+                row_id = save_data(LEDGERS[tipe], data)
+                if config['portfolio'] and unit > 0:
+                    portfolio.record_units(LEDGERS[tipe], {row_id: unit})
+                if config['budget']:
+                    # Shown after the rerun, above the form
+                    st.session_state[f"budget_alert_{key}"] = budget_alert(tipe, kategori, tanggal)
+                st.success(f"✅ {tipe} berhasil disimpan!")
+                if config['balloons']:
+                    st.balloons()
                 st.rerun()
             else:
                 st.error("⚠️ Jumlah harus lebih dari 0!")
     
     # Add custom category
-    with st.expander("➕ Tambah Kategori Pemasukan Baru"):
+    with st.expander(f"➕ Tambah {item} {tipe} Baru"):
         col1, col2 = st.columns([3, 1])
         with col1:
-            new_kategori = st.text_input("Nama Kategori Baru", key="new_pemasukan", placeholder="Contoh: Freelance, Bonus, dll")
+            new_kategori = st.text_input(f"Nama {item} Baru", key=f"new_{key}", placeholder=config['new_placeholder'])
         with col2:
             st.markdown("<br>", unsafe_allow_html=True)
-            if st.button("Tambah", key="btn_add_pemasukan", use_container_width=True):
-                kategori_list = KATEGORI_PEMASUKAN + st.session_state.custom_pemasukan
+            if st.button("Tambah", key=f"btn_add_{key}", use_container_width=True):
                 if new_kategori and new_kategori.strip() != "":
-                    if new_kategori not in kategori_list:
-                        st.session_state.custom_pemasukan.append(new_kategori)
-                        st.success(f"✅ Kategori '{new_kategori}' berhasil ditambahkan!")
+                    if new_kategori not in registry:
+                        registry.add(new_kategori)
+                        st.success(f"✅ {item} '{new_kategori}' berhasil ditambahkan!")
                         st.rerun()
                     else:
-                        st.warning("⚠️ Kategori sudah ada!")
+                        st.warning(f"⚠️ {item} sudah ada!")
                 else:
-                    st.error("⚠️ Nama kategori tidak boleh kosong!")
+                    st.error(f"⚠️ Nama {item.lower()} tidak boleh kosong!")
     
-    st.markdown("---")
-    
-    # Display data with better styling
-    df_pemasukan = load_data(PEMASUKAN_FILE)
-    if not df_pemasukan.empty:
-        col_h1, col_h2 = st.columns([3, 1])
-        with col_h1:
-            st.markdown("### 📋 Riwayat Pemasukan")
-        with col_h2:
-            total = df_pemasukan['Jumlah'].sum()
-            st.metric("Total", format_currency(total))
-        
-        df_pemasukan['Tanggal'] = pd.to_datetime(df_pemasukan['Tanggal'])
-        df_pemasukan = df_pemasukan.sort_values('Tanggal', ascending=False)
-        
-        for idx, row in df_pemasukan.iterrows():
-            with st.container():
-                col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 3, 1])
-                col1.markdown(f"**📅** {row['Tanggal'].strftime('%d/%m/%Y')}")
-                col2.markdown(f"**🏷️** {row['Kategori']}")
-                col3.markdown(f"**💰** {format_currency(row['Jumlah'])}")
-                col4.markdown(f"**📝** {row['Keterangan'] if pd.notna(row['Keterangan']) and row['Keterangan'] != '' else '-'}")
-                if col5.button("🗑️", key=f"del_pemasukan_{idx}"):
-                    delete_row(PEMASUKAN_FILE, idx)
-                    st.success("✅ Data berhasil dihapus!")
+    # Rename or merge categories; transactions follow without being rewritten
+    with st.expander(f"✏️ Ubah Nama / Gabungkan {item}"):
+        col1, col2, col3 = st.columns([2, 2, 1])
+        with col1:
+            current = st.selectbox(item, registry.names(), key=f"rename_from_{key}")
+        with col2:
+            new_name = st.text_input("Nama Baru", key=f"rename_to_{key}")
+        with col3:
+            st.markdown("<br>", unsafe_allow_html=True)
+            if st.button("Ubah", key=f"btn_rename_{key}", use_container_width=True):
+                try:
+                    registry.rename(current, new_name)
+                except ValueError as e:
+                    st.error(f"⚠️ {e}")
+                else:
                     st.rerun()
-                st.markdown("<hr style='margin: 5px 0; opacity: 0.2;'>", unsafe_allow_html=True)
-    else:
-        st.info("📝 Belum ada data pemasukan. Yuk mulai catat pemasukan pertamamu!")
-
-# PENGELUARAN PAGE
-elif menu == "📉 Pengeluaran":
-    col_title1, col_title2 = st.columns([3, 1])
-    with col_title1:
-        st.title("📉 Catat Pengeluaran")
-        st.markdown("*Pantau setiap rupiah yang keluar dari kantong*")
-    
-    st.markdown("<br>", unsafe_allow_html=True)
-    
-    with st.form("form_pengeluaran", clear_on_submit=True):
-        st.markdown("### 📝 Form Input Pengeluaran")
-        
-        col1, col2 = st.columns(2)
-        
+        col1, col2, col3 = st.columns([2, 2, 1])
         with col1:
-            tanggal = st.date_input("📅 Tanggal", datetime.now())
-            kategori_list = KATEGORI_PENGELUARAN + st.session_state.custom_pengeluaran
-            kategori = st.selectbox("🏷️ Kategori", kategori_list)
-            
+            source = st.selectbox(f"Gabungkan {item}", registry.names(), key=f"merge_from_{key}")
         with col2:
-            jumlah = st.number_input("💵 Jumlah (Rp)", min_value=0, step=5000, format="%d")
-            keterangan = st.text_area("📋 Keterangan (Opsional)", height=100)
-        
-        col_btn1, col_btn2, col_btn3 = st.columns([2, 2, 1])
-        with col_btn1:
-            submitted = st.form_submit_button("💾 Simpan Pengeluaran", use_container_width=True, type="primary")
-        
-        if submitted:
-            if jumlah > 0:
-                data = {
-                    'Tanggal': tanggal.strftime('%Y-%m-%d'),
-                    'Kategori': kategori,
-                    'Jumlah': jumlah,
-                    'Keterangan': keterangan
-                }
-                save_data(PENGELUARAN_FILE, data)
-                st.success("✅ Pengeluaran berhasil disimpan!")
+            target = st.selectbox("Ke", [name for name in registry.names() if name != source], key=f"merge_to_{key}")
+        with col3:
+            st.markdown("<br>", unsafe_allow_html=True)
+            if st.button("Gabungkan", key=f"btn_merge_{key}", use_container_width=True, disabled=target is None):
+                registry.merge(source, target)
                 st.rerun()
+    
+    # Bulk import
+    with st.expander(f"📤 Impor {tipe} dari CSV / Mutasi Rekening"):
+        st.caption("Kolom wajib: Tanggal dan Jumlah. Kategori dan Keterangan opsional; transaksi yang sudah ada dilewati.")
+        uploaded = st.file_uploader("File CSV", type=["csv", "txt"], key=f"import_{key}")
+        sep = st.selectbox("Pemisah kolom", [",", ";", "\t"], key=f"import_sep_{key}",
+                           format_func=lambda s: {",": "Koma (,)", ";": "Titik koma (;)", "\t": "Tab"}[s])
+        if uploaded is not None and st.button("📥 Impor", key=f"btn_import_{key}", use_container_width=True):
+            try:
+                result = importer.import_csv(uploaded, LEDGERS[tipe], tipe=tipe, sep=sep)
+            except ValueError as e:
+                st.error(f"⚠️ File tidak bisa dibaca: {e}")
             else:
-                st.error("⚠️ Jumlah harus lebih dari 0!")
+                st.success(
+                    f"✅ {result.imported:,} transaksi diimpor dari {result.read:,} baris "
+                    f"({result.rows_per_second:,.0f} baris/detik)".replace(',', '.')
+                )
+                if result.duplicates:
+                    st.info(f"ℹ️ {result.duplicates:,} transaksi sudah ada dan dilewati".replace(',', '.'))
+                if result.skipped:
+                    st.info(
+                        f"ℹ️ {result.skipped:,} baris {'debet' if importer.STATEMENT_SIDES[tipe] == 'Kredit' else 'kredit'} "
+                        f"dilewati, impor file yang sama di halaman "
+                        f"{'Pengeluaran' if importer.STATEMENT_SIDES[tipe] == 'Kredit' else 'Pemasukan'}".replace(',', '.')
+                    )
+                if result.rejected:
+                    st.warning(f"⚠️ {result.rejected:,} baris ditolak".replace(',', '.'))
+                    st.dataframe(result.errors, hide_index=True, use_container_width=True)
     
-    # Add custom category
-    with st.expander("➕ Tambah Kategori Pengeluaran Baru"):
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            new_kategori = st.text_input("Nama Kategori Baru", key="new_pengeluaran", placeholder="Contoh: Gym, Skincare, dll")
-        with col2:
-            st.markdown("<br>", unsafe_allow_html=True)
-            if st.button("Tambah", key="btn_add_pengeluaran", use_container_width=True):
-                kategori_list = KATEGORI_PENGELUARAN + st.session_state.custom_pengeluaran
-                if new_kategori and new_kategori.strip() != "":
-                    if new_kategori not in kategori_list:
-                        st.session_state.custom_pengeluaran.append(new_kategori)
-                        st.success(f"✅ Kategori '{new_kategori}' berhasil ditambahkan!")
-                        st.rerun()
-                    else:
-                        st.warning("⚠️ Kategori sudah ada!")
-                else:
-                    st.error("⚠️ Nama kategori tidak boleh kosong!")
+    render_recurring(tipe)
+    
+    if config['budget']:
+        render_budget_editor(tipe)
     
     st.markdown("---")
     
+    if config['portfolio']:
+        render_portfolio(tipe)
+        st.markdown("---")
+    
     # Display data
-    df_pengeluaran = load_data(PENGELUARAN_FILE)
-    if not df_pengeluaran.empty:
-        col_h1, col_h2 = st.columns([3, 1])
-        with col_h1:
-            st.markdown("### 📋 Riwayat Pengeluaran")
-        with col_h2:
-            total = df_pengeluaran['Jumlah'].sum()
-            st.metric("Total", format_currency(total))
-        
-        df_pengeluaran['Tanggal'] = pd.to_datetime(df_pengeluaran['Tanggal'])
-        df_pengeluaran = df_pengeluaran.sort_values('Tanggal', ascending=False)
-        
-        for idx, row in df_pengeluaran.iterrows():
-            with st.container():
-                col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 3, 1])
-                col1.markdown(f"**📅** {row['Tanggal'].strftime('%d/%m/%Y')}")
-                col2.markdown(f"**🏷️** {row['Kategori']}")
-                col3.markdown(f"**💸** {format_currency(row['Jumlah'])}")
-                col4.markdown(f"**📝** {row['Keterangan'] if pd.notna(row['Keterangan']) and row['Keterangan'] != '' else '-'}")
-                if col5.button("🗑️", key=f"del_pengeluaran_{idx}"):
-                    delete_row(PENGELUARAN_FILE, idx)
-                    st.success("✅ Data berhasil dihapus!")
-                    st.rerun()
-                st.markdown("<hr style='margin: 5px 0; opacity: 0.2;'>", unsafe_allow_html=True)
-    else:
-        st.info("📝 Belum ada data pengeluaran. Mulai tracking pengeluaranmu!")
+    render_history(tipe)
 
-# INVESTASI PAGE
-elif menu == "💎 Investasi":
-    col_title1, col_title2 = st.columns([3, 1])
-    with col_title1:
-        st.title("💎 Catat Investasi")
-        st.markdown("*Investasi adalah kunci kebebasan finansial*")
+def budget_alert(tipe, kategori, day):
+    """(level, message) on a category's budget in the month of day, or None if it has no budget"""
+    budget, spent = budgets.check(LEDGERS[tipe], kategori, f"{day:%Y-%m}")
+    if budget is None:
+        return None
+    percent = spent / budget * 100
+    if spent > budget:
+        return ("error", f"🚨 Anggaran {kategori} bulan {day:%m/%Y} terlampaui {format_currency(spent - budget)} "
+                         f"({format_currency(spent)} dari {format_currency(budget)})")
+    if percent >= budgets.WARNING:
+        return ("warning", f"⚠️ Anggaran {kategori} bulan {day:%m/%Y} tinggal {format_currency(budget - spent)} "
+                           f"({percent:.0f}% terpakai)")
+    return ("info", f"🎯 Sisa anggaran {kategori} bulan {day:%m/%Y}: {format_currency(budget - spent)} "
+                    f"({percent:.0f}% terpakai)")
+
+def budget_label(percent):
+    """Status of a budget from the share used"""
+    if percent > 100:
+        return "🚨 Terlampaui"
+    if percent >= budgets.WARNING:
+        return "⚠️ Hampir habis"
+    return "✅ Aman"
+
+def render_budget_editor(tipe):
+    """Render the monthly budget of every category, editable, with this month's spend"""
+    config = TIPE_CONFIG[tipe]
+    key = config['key']
+    item = config['item']
+    store = budgets.get(LEDGERS[tipe])
     
-    st.markdown("<br>", unsafe_allow_html=True)
+    with st.expander(f"🎯 Anggaran Bulanan per {item}"):
+        st.caption("Isi 0 untuk kategori tanpa anggaran. Sisa anggaran ditampilkan setiap kali transaksi disimpan.")
+        amounts = store.amounts()
+        spent = aggregates.get(LEDGERS[tipe]).kategori_totals(f"{datetime.now():%Y-%m}")
+        names = store.registry.names()
+        edited = st.data_editor(pd.DataFrame({
+            item: names,
+            'Anggaran': [amounts.get(name, 0) for name in names],
+            'Terpakai Bulan Ini': [format_currency(spent.get(name, 0)) for name in names],
+        }), column_config={
+            'Anggaran': st.column_config.NumberColumn("Anggaran (Rp)", min_value=0, step=config['step'], format="%d"),
+        }, disabled=[item, 'Terpakai Bulan Ini'], hide_index=True, use_container_width=True, key=f"anggaran_{key}")
+        if st.button("💾 Simpan Anggaran", key=f"btn_anggaran_{key}", use_container_width=True):
+            try:
+                store.update(dict(zip(edited[item], edited['Anggaran'].fillna(0))))
+            except ValueError as e:
+                st.error(f"⚠️ {e}")
+            else:
+                st.rerun()
+
+def render_recurring(tipe):
+    """Render the recurring rules of a transaction type, with a form to add one"""
+    config = TIPE_CONFIG[tipe]
+    key = config['key']
+    rules = recurring.get(LEDGERS)
     
-    with st.form("form_investasi", clear_on_submit=True):
-        st.markdown("### 📝 Form Input Investasi")
+    with st.expander(f"🔁 {tipe} Rutin"):
+        st.caption("Transaksi rutin dicatat otomatis ke riwayat saat jatuh tempo, sekali untuk setiap tanggal. Transaksi yang sudah dicatat lalu dihapus tidak dicatat ulang.")
+        with st.form(f"form_rutin_{key}", clear_on_submit=True):
+            col1, col2 = st.columns(2)
+            with col1:
+                kategori = st.selectbox(config['kategori_label'], categories.get(LEDGERS[tipe], tipe).names(), key=f"rutin_kategori_{key}")
+                jumlah = st.number_input("💵 Jumlah (Rp)", min_value=0, step=config['step'], format="%d", key=f"rutin_jumlah_{key}")
+                keterangan = st.text_input("📋 Keterangan (Opsional)", key=f"rutin_keterangan_{key}")
+            with col2:
+                frequency = st.selectbox("🔁 Frekuensi", list(FREQUENCY_LABELS), format_func=FREQUENCY_LABELS.get, key=f"rutin_frekuensi_{key}")
+                interval = st.number_input("Setiap", min_value=1, value=1, step=1, key=f"rutin_interval_{key}",
+                                           help="Mis. 3 dengan frekuensi Bulanan berarti setiap 3 bulan")
+                start = st.date_input("📅 Mulai", datetime.now(), key=f"rutin_mulai_{key}")
+                end = st.date_input("🏁 Sampai (Opsional)", value=None, key=f"rutin_sampai_{key}")
+            if st.form_submit_button("➕ Tambah Transaksi Rutin", use_container_width=True):
+                try:
+                    rules.add(tipe, kategori, jumlah, start, frequency, interval, end, keterangan)
+                except ValueError as e:
+                    st.error(f"⚠️ {e}")
+                else:
+                    written = recurring.materialize(LEDGERS).get(tipe, 0)
+                    st.success(f"✅ Transaksi rutin ditambahkan; {written} transaksi yang sudah jatuh tempo dicatat")
+                    st.rerun()
         
-        col1, col2 = st.columns(2)
+        table = rules.frame(tipe)
+        if table.empty:
+            return
+        st.dataframe(pd.DataFrame({
+            config['item']: table['Kategori'],
+            'Jumlah': table['Jumlah'].map(format_currency),
+            'Jadwal': [format_schedule(f, i) for f, i in zip(table['Frekuensi'], table['Interval'])],
+            'Mulai': table['Mulai'].map(format_day),
+            'Sampai': table['Sampai'].map(format_day),
+            'Berikutnya': table['Berikutnya'].map(format_day),
+            'Status': table['Aktif'].map({True: "Aktif", False: "Dijeda"}),
+            'Keterangan': table['Keterangan'],
+        }), hide_index=True, use_container_width=True)
         
+        col1, col2, col3 = st.columns([3, 1, 1])
         with col1:
-            tanggal = st.date_input("📅 Tanggal", datetime.now())
-            kategori_list = KATEGORI_INVESTASI + st.session_state.custom_investasi
-            kategori = st.selectbox("🏷️ Instrumen Investasi", kategori_list)
-            
+            position = st.selectbox("Transaksi Rutin", range(len(table)), key=f"rutin_pilih_{key}",
+                                    format_func=lambda i: f"{table['Kategori'][i]} · {format_currency(table['Jumlah'][i])} · "
+                                                          f"{format_schedule(table['Frekuensi'][i], table['Interval'][i])}")
+        rule_id, active = table['ID'][position], table['Aktif'][position]
         with col2:
-            jumlah = st.number_input("💵 Jumlah (Rp)", min_value=0, step=50000, format="%d")
-            keterangan = st.text_area("📋 Keterangan (Opsional)", height=100, placeholder="Contoh: Beli 10 lot, DCA bulan ini")
-        
-        col_btn1, col_btn2, col_btn3 = st.columns([2, 2, 1])
-        with col_btn1:
-            submitted = st.form_submit_button("💾 Simpan Investasi", use_container_width=True, type="primary")
-        
-        if submitted:
-            if jumlah > 0:
-                data = {
-                    'Tanggal': tanggal.strftime('%Y-%m-%d'),
-                    'Kategori': kategori,
-                    'Jumlah': jumlah,
-                    'Keterangan': keterangan
-                }
-                save_data(INVESTASI_FILE, data)
-                st.success("✅ Investasi berhasil disimpan!")
-                st.balloons()
+            st.markdown("<br>", unsafe_allow_html=True)
+            if st.button("⏸️ Jeda" if active else "▶️ Lanjutkan", key=f"btn_rutin_jeda_{key}", use_container_width=True):
+                rules.set_active(rule_id, not active)
                 st.rerun()
+        with col3:
+            st.markdown("<br>", unsafe_allow_html=True)
+            if st.button("🗑️ Hapus", key=f"btn_rutin_hapus_{key}", use_container_width=True):
+                rules.remove(rule_id)
+                st.rerun()
+
+def render_portfolio(tipe):
+    """Render the value, cost basis and returns of the holdings in an investment ledger"""
+    filename = LEDGERS[tipe]
+    store = portfolio.price_store(filename)
+    
+    st.markdown("### 💼 Portofolio")
+    with st.expander("📈 Impor Riwayat Harga Penutupan"):
+        st.caption("CSV atau Parquet berisi kolom Tanggal, Instrumen dan Harga, atau kolom Tanggal dan satu kolom per instrumen. Harga dalam Rupiah per unit.")
+        uploaded = st.file_uploader("File Harga", type=["csv", "parquet"], key="import_harga")
+        if uploaded is not None and st.button("📥 Impor Harga", key="btn_import_harga", use_container_width=True):
+            try:
+                prices = portfolio.read_prices(uploaded)
+            except ValueError as e:
+                st.error(f"⚠️ File tidak bisa dibaca: {e}")
             else:
-                st.error("⚠️ Jumlah harus lebih dari 0!")
+                store.update(prices)
+                st.success(f"✅ {len(prices):,} harga untuk {prices['Instrumen'].nunique()} instrumen diimpor".replace(',', '.'))
     
-    # Add custom category
-    with st.expander("➕ Tambah Instrumen Investasi Baru"):
-        col1, col2 = st.columns([3, 1])
-        with col1:
-            new_kategori = st.text_input("Nama Instrumen Baru", key="new_investasi", placeholder="Contoh: TLKM, UNVR, Bitcoin, ETF")
-        with col2:
-            st.markdown("<br>", unsafe_allow_html=True)
-            if st.button("Tambah", key="btn_add_investasi", use_container_width=True):
-                kategori_list = KATEGORI_INVESTASI + st.session_state.custom_investasi
-                if new_kategori and new_kategori.strip() != "":
-                    if new_kategori not in kategori_list:
-                        st.session_state.custom_investasi.append(new_kategori)
-                        st.success(f"✅ Instrumen '{new_kategori}' berhasil ditambahkan!")
-                        st.rerun()
-                    else:
-                        st.warning("⚠️ Instrumen sudah ada!")
-                else:
-                    st.error("⚠️ Nama instrumen tidak boleh kosong!")
+    valuation = portfolio.get(filename)
+    positions = valuation.positions()
+    if positions.empty:
+        return
+    bounds = store.bounds()
+    if bounds is None:
+        st.caption("ℹ️ Belum ada riwayat harga, jadi nilai investasi dihitung dari harga belinya.")
+    else:
+        st.caption(f"Harga penutupan {bounds[0]:%d/%m/%Y} – {bounds[1]:%d/%m/%Y}")
     
-    st.markdown("---")
+    modal, nilai = positions['Modal'].sum(), positions['Nilai'].sum()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Modal", format_currency(modal))
+    col2.metric("Nilai Saat Ini", format_currency(nilai))
+    col3.metric("Laba / Rugi", format_signed(nilai - modal), format_change(nilai, modal) or None)
+    col4.metric("Time-Weighted Return", format_percent(valuation.twr()))
     
-    # Display data
-    df_investasi = load_data(INVESTASI_FILE)
-    if not df_investasi.empty:
-        col_h1, col_h2 = st.columns([3, 1])
-        with col_h1:
-            st.markdown("### 📋 Riwayat Investasi")
-        with col_h2:
-            total = df_investasi['Jumlah'].sum()
-            st.metric("Total", format_currency(total))
-        
-        df_investasi['Tanggal'] = pd.to_datetime(df_investasi['Tanggal'])
-        df_investasi = df_investasi.sort_values('Tanggal', ascending=False)
-        
-        for idx, row in df_investasi.iterrows():
-            with st.container():
-                col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 3, 1])
-                col1.markdown(f"**📅** {row['Tanggal'].strftime('%d/%m/%Y')}")
-                col2.markdown(f"**🏷️** {row['Kategori']}")
-                col3.markdown(f"**📈** {format_currency(row['Jumlah'])}")
-                col4.markdown(f"**📝** {row['Keterangan'] if pd.notna(row['Keterangan']) and row['Keterangan'] != '' else '-'}")
-                if col5.button("🗑️", key=f"del_investasi_{idx}"):
-                    delete_row(INVESTASI_FILE, idx)
-                    st.success("✅ Data berhasil dihapus!")
-                    st.rerun()
-                st.markdown("<hr style='margin: 5px 0; opacity: 0.2;'>", unsafe_allow_html=True)
+    st.dataframe(pd.DataFrame({
+        'Instrumen': positions['Instrumen'],
+        'Unit': positions['Unit'].map(lambda u: format_units(u) if u else "-"),
+        'Harga Terakhir': positions['Harga'].map(lambda p: format_currency(p) if pd.notna(p) else "-"),
+        'Modal': positions['Modal'].map(format_currency),
+        'Nilai': positions['Nilai'].map(format_currency),
+        'Laba / Rugi': positions['Laba'].map(format_signed),
+        'Return': positions['Return'].map(format_percent),
+        'TWR': positions['TWR'].map(format_percent),
+    }), hide_index=True, use_container_width=True)
+    
+    with trace.span("figure", "portfolio"):
+        fig = portfolio_figure(valuation.history())
+    with trace.span("plotly_chart", "portfolio"):
+        st.plotly_chart(fig, use_container_width=True)
+
+@st.cache_resource
+def figure_cache():
+    """Dashboard figures shared by all sessions, keyed by (chart, user, month, data version)"""
+    max_mb = float(os.environ.get('CASHFLOW_FIGURE_CACHE_MB', 32))
+    return LRUCache(int(max_mb * 2**20), sizeof=lambda fig: len(fig.to_json(validate=False)))
+
+# plotly is only imported by the chart builders, so the other pages never pay for it
+def pie_figure(by_kategori, colors):
+    """Donut chart of Jumlah per Kategori"""
+    import plotly.express as px
+    
+    fig = px.pie(
+        by_kategori, 
+        values='Jumlah', 
+        names='Kategori',
+        hole=0.5,
+        color_discrete_sequence=getattr(px.colors.sequential, colors)
+    )
+    fig.update_traces(
+        textposition='inside', 
+        textinfo='percent+label',
+        hovertemplate='<b>%{label}</b><br>Jumlah: Rp %{value:,.0f}<br>Persentase: %{percent}<extra></extra>'
+    )
+    fig.update_layout(
+        height=350, 
+        showlegend=False,
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='white', size=12)
+    )
+    return fig
+
+def trend_figure(daily_expenses):
+    """Line chart of daily expenses"""
+    import plotly.graph_objects as go
+    
+    fig_line = go.Figure()
+    fig_line.add_trace(go.Scatter(
+        x=daily_expenses['Tanggal'],
+        y=daily_expenses['Jumlah'],
+        mode='lines+markers',
+        name='Pengeluaran',
+        line=dict(color='#FF6B6B', width=4),
+        marker=dict(size=10, color='#FF6B6B', line=dict(color='white', width=2)),
+        fill='tozeroy',
+        fillcolor='rgba(255, 107, 107, 0.3)',
+        hovertemplate='<b>Tanggal:</b> %{x|%d/%m/%Y}<br><b>Pengeluaran:</b> Rp %{y:,.0f}<extra></extra>'
+    ))
+    
+    fig_line.update_layout(
+        height=400,
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(255,255,255,0.1)',
+        font=dict(color='white', size=12),
+        xaxis=dict(
+            title="Tanggal",
+            showgrid=True,
+            gridcolor='rgba(255,255,255,0.1)'
+        ),
+        yaxis=dict(
+            title="Jumlah (Rp)",
+            showgrid=True,
+            gridcolor='rgba(255,255,255,0.1)'
+        ),
+        hovermode='x unified'
+    )
+    return fig_line
+
+def portfolio_figure(history):
+    """Line chart of the portfolio's value against its cost basis"""
+    import plotly.graph_objects as go
+    
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=history['Tanggal'], y=history['Modal'], name='Modal', mode='lines',
+        line=dict(color='#b8c6db', width=2, dash='dash'),
+        hovertemplate='<b>Modal:</b> Rp %{y:,.0f}<extra></extra>'
+    ))
+    fig.add_trace(go.Scatter(
+        x=history['Tanggal'], y=history['Nilai'], name='Nilai', mode='lines',
+        line=dict(color='#4facfe', width=3), fill='tonexty', fillcolor='rgba(79, 172, 254, 0.2)',
+        hovertemplate='<b>Nilai:</b> Rp %{y:,.0f}<extra></extra>'
+    ))
+    fig.update_layout(
+        height=350,
+        paper_bgcolor='rgba(0,0,0,0)',
+        plot_bgcolor='rgba(255,255,255,0.1)',
+        font=dict(color='white', size=12),
+        yaxis=dict(title="Jumlah (Rp)", gridcolor='rgba(255,255,255,0.1)'),
+        hovermode='x unified'
+    )
+    return fig
+
+# Dashboard period modes
+PERIOD_MODES = ["📅 Bulanan", "📆 Rentang Tanggal", "🗓️ Tahun Berjalan", "⏮️ N Bulan Terakhir"]
+
+def select_period(months):
+    """Period picked on the Dashboard and the one it is compared with: (start, end, previous_start, previous_end)"""
+    mode = st.radio("🗓️ Periode", options=PERIOD_MODES, horizontal=True, key="period_mode")
+    col1, col2, col3 = st.columns([2, 2, 2])
+    if mode == PERIOD_MODES[1]:
+        with col1:
+            picked = st.date_input("📅 Rentang Tanggal", value=aggregates.month_range(months[0]), key="period_range")
+        # Halfway through picking a range only the first date is set
+        start, end = (picked[0], picked[-1]) if picked else aggregates.month_range(months[0])
+        previous = aggregates.previous_range(start, end)
+    elif mode == PERIOD_MODES[2]:
+        with col1:
+            year = int(st.selectbox("📆 Tahun", options=sorted({month[:4] for month in months}, reverse=True), key="period_year"))
+        today = datetime.now().date()
+        start, end = aggregates.year_to_date(today if year == today.year else date(year, 12, 31))
+        previous = aggregates.previous_range(start, end, months=12)
+    elif mode == PERIOD_MODES[3]:
+        with col1:
+            count = st.selectbox("🔢 Jumlah Bulan", options=[3, 6, 12], key="period_count")
+        with col2:
+            month = st.selectbox("🗓️ Sampai Bulan", options=months, key="period_until")
+        start, end = aggregates.trailing_range(month, count)
+        previous = aggregates.previous_range(start, end, months=count)
     else:
-        st.info("📝 Belum ada data investasi. Mulai investasi untuk masa depan!")
+        with col1:
+            month = st.selectbox("🗓️ Filter Bulan", options=months, index=0)
+        start, end = aggregates.month_range(month)
+        previous = aggregates.previous_range(start, end, months=1)
+    return (start, end) + tuple(previous)
+
+def format_change(amount, previous):
+    """Change against the previous period, e.g. '▲ 12,5%', or '' if there is nothing to compare with"""
+    if not previous:
+        return ""
+    percent = (amount - previous) / abs(previous) * 100
+    arrow = "▲" if percent > 0 else "▼" if percent < 0 else "●"
+    return f"{arrow} {abs(percent):.1f}%".replace(".", ",")
 
-# DASHBOARD PAGE
-elif menu == "📊 Dashboard":
+def format_signed(amount):
+    """Rupiah amount with an explicit sign"""
+    return ("+" if amount > 0 else "-" if amount < 0 else "") + format_currency(abs(amount))
+
+def render_dashboard():
+    """Render the summary of the selected period, charts, changes per category and exports"""
+    # Built figures are reused until the period's data changes
+    figures = figure_cache()
+    
     st.title("📊 Dashboard Keuangan")
     st.markdown("*Visualisasi lengkap kondisi keuangan Anda*")
     
     st.markdown("<br>", unsafe_allow_html=True)
     
-    # Load all data
-    df_pemasukan = load_data(PEMASUKAN_FILE)
-    df_pengeluaran = load_data(PENGELUARAN_FILE)
-    df_investasi = load_data(INVESTASI_FILE)
-    
-    # Convert date columns
-    if not df_pemasukan.empty:
-        df_pemasukan['Tanggal'] = pd.to_datetime(df_pemasukan['Tanggal'])
-    if not df_pengeluaran.empty:
-        df_pengeluaran['Tanggal'] = pd.to_datetime(df_pengeluaran['Tanggal'])
-    if not df_investasi.empty:
-        df_investasi['Tanggal'] = pd.to_datetime(df_investasi['Tanggal'])
+    # Monthly and daily aggregates, kept up to date on every save and delete;
+    # any date range is summed from their prefix sums
+    aggs = {tipe: aggregates.get(filename) for tipe, filename in LEDGERS.items()}
     
     # Get available months
-    all_dates = []
-    if not df_pemasukan.empty:
-        all_dates.extend(df_pemasukan['Tanggal'].tolist())
-    if not df_pengeluaran.empty:
-        all_dates.extend(df_pengeluaran['Tanggal'].tolist())
-    if not df_investasi.empty:
-        all_dates.extend(df_investasi['Tanggal'].tolist())
-    
-    if all_dates:
-        # Convert to pandas Series and format to month string
-        dates_series = pd.Series(all_dates)
-        unique_months = sorted(dates_series.dt.strftime('%Y-%m').unique(), reverse=True)
-        
-        # Month filter with better styling
-        col1, col2, col3 = st.columns([2, 2, 2])
-        with col1:
-            selected_month = st.selectbox("🗓️ Filter Bulan", options=unique_months, index=0)
+    unique_months = aggregates.months(LEDGERS)
+    
+    if unique_months:
+        start, end, previous_start, previous_end = select_period(unique_months)
     else:
         st.warning("⚠️ Belum ada data. Silakan tambahkan transaksi terlebih dahulu!")
         st.stop()
     
-    # Filter data by month
-    df_pemasukan_filtered = df_pemasukan[df_pemasukan['Tanggal'].dt.strftime('%Y-%m') == selected_month] if not df_pemasukan.empty else pd.DataFrame()
-    df_pengeluaran_filtered = df_pengeluaran[df_pengeluaran['Tanggal'].dt.strftime('%Y-%m') == selected_month] if not df_pengeluaran.empty else pd.DataFrame()
-    df_investasi_filtered = df_investasi[df_investasi['Tanggal'].dt.strftime('%Y-%m') == selected_month] if not df_investasi.empty else pd.DataFrame()
-    
     # Calculate totals
-    total_pemasukan = df_pemasukan_filtered['Jumlah'].sum() if not df_pemasukan_filtered.empty else 0
-    total_pengeluaran = df_pengeluaran_filtered['Jumlah'].sum() if not df_pengeluaran_filtered.empty else 0
-    total_investasi = df_investasi_filtered['Jumlah'].sum() if not df_investasi_filtered.empty else 0
-    saldo = total_pemasukan - total_pengeluaran - total_investasi
+    totals = aggregates.range_summary(start, end, LEDGERS)
+    previous_totals = aggregates.range_summary(previous_start, previous_end, LEDGERS)
+    saldo = totals['Saldo']
     
     # Summary cards with gradient
     st.markdown("### 💼 Ringkasan Keuangan")
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        st.markdown("""
-        <div style='background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                    padding: 25px; border-radius: 15px; color: white; box-shadow: 0 4px 15px rgba(0,0,0,0.2);'>
-            <h4 style='margin: 0; font-size: 14px; opacity: 0.9;'>💰 Total Pemasukan</h4>
-            <h2 style='margin: 10px 0 0 0; font-size: 20px;'>{}</h2>
-        </div>
-        """.format(format_currency(total_pemasukan)), unsafe_allow_html=True)
+    st.caption(f"{start:%d/%m/%Y} – {end:%d/%m/%Y}, dibandingkan dengan {previous_start:%d/%m/%Y} – {previous_end:%d/%m/%Y}")
+    saldo_color = "#43e97b" if saldo >= 0 else "#fa709a"
+    cards = [TIPE_CONFIG[tipe]['card'] + (totals[tipe], previous_totals[tipe]) for tipe in TIPE_CONFIG]
+    cards.append(("💵 Saldo Akhir", saldo_color, saldo_color, saldo, previous_totals['Saldo']))
     
-    with col2:
-        st.markdown("""
-        <div style='background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%); 
-                    padding: 25px; border-radius: 15px; color: white; box-shadow: 0 4px 15px rgba(0,0,0,0.2);'>
-            <h4 style='margin: 0; font-size: 14px; opacity: 0.9;'>💸 Total Pengeluaran</h4>
-            <h2 style='margin: 10px 0 0 0; font-size: 20px;'>{}</h2>
-        </div>
-        """.format(format_currency(total_pengeluaran)), unsafe_allow_html=True)
-    
-    with col3:
-        st.markdown("""
-        <div style='background: linear-gradient(135deg, #4facfe 0%, #00f2fe 100%); 
-                    padding: 25px; border-radius: 15px; color: white; box-shadow: 0 4px 15px rgba(0,0,0,0.2);'>
-            <h4 style='margin: 0; font-size: 14px; opacity: 0.9;'>📈 Total Investasi</h4>
-            <h2 style='margin: 10px 0 0 0; font-size: 20px;'>{}</h2>
-        </div>
-        """.format(format_currency(total_investasi)), unsafe_allow_html=True)
-    
-    with col4:
-        saldo_color = "#43e97b" if saldo >= 0 else "#fa709a"
-        st.markdown("""
-        <div style='background: linear-gradient(135deg, {} 0%, {} 100%); 
-                    padding: 25px; border-radius: 15px; color: white; box-shadow: 0 4px 15px rgba(0,0,0,0.2);'>
-            <h4 style='margin: 0; font-size: 14px; opacity: 0.9;'>💵 Saldo Akhir</h4>
-            <h2 style='margin: 10px 0 0 0; font-size: 20px;'>{}</h2>
-        </div>
-        """.format(saldo_color, saldo_color, format_currency(saldo)), unsafe_allow_html=True)
+    for col, (label, color_from, color_to, amount, previous) in zip(st.columns(len(cards)), cards):
+        with col:
+            st.markdown("""
+            <div style='background: linear-gradient(135deg, {} 0%, {} 100%); 
+                        padding: 25px; border-radius: 15px; color: white; box-shadow: 0 4px 15px rgba(0,0,0,0.2);'>
+                <h4 style='margin: 0; font-size: 14px; opacity: 0.9;'>{}</h4>
+                <h2 style='margin: 10px 0 0 0; font-size: 20px;'>{}</h2>
+                <p style='margin: 5px 0 0 0; font-size: 12px; opacity: 0.9;'>{}&nbsp;</p>
+            </div>
+            """.format(color_from, color_to, label, format_currency(amount), format_change(amount, previous)), unsafe_allow_html=True)
     
     st.markdown("<br><br>", unsafe_allow_html=True)
     
     # Pie charts section
     st.markdown("### 📊 Distribusi per Kategori")
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        st.markdown("#### 💰 Pemasukan")
-        if not df_pemasukan_filtered.empty:
-            pemasukan_by_kategori = df_pemasukan_filtered.groupby('Kategori')['Jumlah'].sum().reset_index()
-            fig_pemasukan = px.pie(
-                pemasukan_by_kategori, 
-                values='Jumlah', 
-                names='Kategori',
-                hole=0.5,
-                color_discrete_sequence=px.colors.sequential.Greens_r
-            )
-            fig_pemasukan.update_traces(
-                textposition='inside', 
-                textinfo='percent+label',
-                hovertemplate='<b>%{label}</b><br>Jumlah: Rp %{value:,.0f}<br>Persentase: %{percent}<extra></extra>'
-            )
-            fig_pemasukan.update_layout(
-                height=350, 
-                showlegend=False,
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                font=dict(color='white', size=12)
-            )
-            st.plotly_chart(fig_pemasukan, use_container_width=True)
-        else:
-            st.info("Tidak ada data")
     
-    with col2:
-        st.markdown("#### 💸 Pengeluaran")
-        if not df_pengeluaran_filtered.empty:
-            pengeluaran_by_kategori = df_pengeluaran_filtered.groupby('Kategori')['Jumlah'].sum().reset_index()
-            fig_pengeluaran = px.pie(
-                pengeluaran_by_kategori, 
-                values='Jumlah', 
-                names='Kategori',
-                hole=0.5,
-                color_discrete_sequence=px.colors.sequential.Reds_r
-            )
-            fig_pengeluaran.update_traces(
-                textposition='inside', 
-                textinfo='percent+label',
-                hovertemplate='<b>%{label}</b><br>Jumlah: Rp %{value:,.0f}<br>Persentase: %{percent}<extra></extra>'
-            )
-            fig_pengeluaran.update_layout(
-                height=350, 
-                showlegend=False,
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                font=dict(color='white', size=12)
-            )
-            st.plotly_chart(fig_pengeluaran, use_container_width=True)
-        else:
-            st.info("Tidak ada data")
-    
-    with col3:
-        st.markdown("#### 📈 Investasi")
-        if not df_investasi_filtered.empty:
-            investasi_by_kategori = df_investasi_filtered.groupby('Kategori')['Jumlah'].sum().reset_index()
-            fig_investasi = px.pie(
-                investasi_by_kategori, 
-                values='Jumlah', 
-                names='Kategori',
-                hole=0.5,
-                color_discrete_sequence=px.colors.sequential.Blues_r
-            )
-            fig_investasi.update_traces(
-                textposition='inside', 
-                textinfo='percent+label',
-                hovertemplate='<b>%{label}</b><br>Jumlah: Rp %{value:,.0f}<br>Persentase: %{percent}<extra></extra>'
-            )
-            fig_investasi.update_layout(
-                height=350, 
-                showlegend=False,
-                paper_bgcolor='rgba(0,0,0,0)',
-                plot_bgcolor='rgba(0,0,0,0)',
-                font=dict(color='white', size=12)
-            )
-            st.plotly_chart(fig_investasi, use_container_width=True)
-        else:
-            st.info("Tidak ada data")
+    for col, (tipe, config) in zip(st.columns(len(TIPE_CONFIG)), TIPE_CONFIG.items()):
+        with col:
+            heading, colors = config['pie']
+            st.markdown(heading)
+            agg = aggs[tipe]
+            if agg.count_between(start, end):
+                with trace.span("figure", f"pie {tipe}"):
+                    fig = figures.get_or_build(
+                        ('pie', TENANT.id, tipe, start, end, agg.range_version(start, end), agg.registry.version),
+                        lambda: pie_figure(agg.by_kategori_between(start, end), colors)
+                    )
+                with trace.span("plotly_chart", f"pie {tipe}"):
+                    st.plotly_chart(fig, use_container_width=True, key=f"pie_{config['key']}")
+            else:
+                st.info("Tidak ada data")
     
     st.markdown("<br>", unsafe_allow_html=True)
     
     # Line chart for daily expenses
     st.markdown("### 📈 Tren Pengeluaran Harian")
-    if not df_pengeluaran_filtered.empty:
-        daily_expenses = df_pengeluaran_filtered.groupby('Tanggal')['Jumlah'].sum().reset_index()
-        daily_expenses = daily_expenses.sort_values('Tanggal')
-        
-        fig_line = go.Figure()
-        fig_line.add_trace(go.Scatter(
-            x=daily_expenses['Tanggal'],
-            y=daily_expenses['Jumlah'],
-            mode='lines+markers',
-            name='Pengeluaran',
-            line=dict(color='#FF6B6B', width=4),
-            marker=dict(size=10, color='#FF6B6B', line=dict(color='white', width=2)),
-            fill='tozeroy',
-            fillcolor='rgba(255, 107, 107, 0.3)',
-            hovertemplate='<b>Tanggal:</b> %{x|%d/%m/%Y}<br><b>Pengeluaran:</b> Rp %{y:,.0f}<extra></extra>'
-        ))
-        
-        fig_line.update_layout(
-            height=400,
-            paper_bgcolor='rgba(0,0,0,0)',
-            plot_bgcolor='rgba(255,255,255,0.1)',
-            font=dict(color='white', size=12),
-            xaxis=dict(
-                title="Tanggal",
-                showgrid=True,
-                gridcolor='rgba(255,255,255,0.1)'
-            ),
-            yaxis=dict(
-                title="Jumlah (Rp)",
-                showgrid=True,
-                gridcolor='rgba(255,255,255,0.1)'
-            ),
-            hovermode='x unified'
-        )
+    daily_expenses = aggs['Pengeluaran'].daily_between(start, end)
+    if not daily_expenses.empty:
+        agg = aggs['Pengeluaran']
+        with trace.span("figure", "trend"):
+            fig_line = figures.get_or_build(
+                ('trend', TENANT.id, start, end, agg.range_version(start, end)),
+                lambda: trend_figure(daily_expenses)
+            )
         
-        st.plotly_chart(fig_line, use_container_width=True)
+        with trace.span("plotly_chart", "trend"):
+            st.plotly_chart(fig_line, use_container_width=True)
         
         # Statistics
         col1, col2, col3 = st.columns(3)
@@ -750,81 +879,185 @@ elif menu == "📊 Dashboard":
             </div>
             """.format(format_currency(daily_expenses['Jumlah'].min())), unsafe_allow_html=True)
     else:
-        st.info("📝 Tidak ada data pengeluaran harian untuk bulan ini")
+        st.info("📝 Tidak ada data pengeluaran harian untuk periode ini")
+    
+    st.markdown("<br>", unsafe_allow_html=True)
+    
+    # Change per category against the previous period (month over month in the monthly view)
+    st.markdown("### 🔄 Perubahan per Kategori")
+    for tab, tipe in zip(st.tabs(list(TIPE_CONFIG)), TIPE_CONFIG):
+        with tab:
+            changes = aggs[tipe].changes(start, end, previous_start, previous_end)
+            if changes.empty:
+                st.info("Tidak ada data")
+                continue
+            st.dataframe(pd.DataFrame({
+                TIPE_CONFIG[tipe]['item']: changes['Kategori'],
+                'Periode Ini': changes['Jumlah'].map(format_currency),
+                'Sebelumnya': changes['Sebelumnya'].map(format_currency),
+                'Selisih': changes['Selisih'].map(format_signed),
+                'Perubahan': [format_change(a, b) or "baru" for a, b in zip(changes['Jumlah'], changes['Sebelumnya'])],
+            }), hide_index=True, use_container_width=True)
+    
+    st.markdown("<br>", unsafe_allow_html=True)
+    
+    # Budgets of the period's last month against its spend, from the running counters
+    for tipe, config in TIPE_CONFIG.items():
+        if not config['budget']:
+            continue
+        st.markdown("### 🎯 Anggaran vs Realisasi")
+        status = budgets.status(LEDGERS[tipe], f"{end:%Y-%m}")
+        status = status[status['Anggaran'] > 0]
+        if status.empty:
+            st.info(f"Belum ada anggaran. Atur di halaman {tipe}, bagian \"🎯 Anggaran Bulanan per {config['item']}\".")
+            continue
+        st.caption(f"{tipe} bulan {end:%m/%Y}")
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Total Anggaran", format_currency(status['Anggaran'].sum()))
+        col2.metric("Terpakai", format_currency(status['Terpakai'].sum()))
+        col3.metric("Sisa", format_signed(status['Sisa'].sum()))
+        st.dataframe(pd.DataFrame({
+            config['item']: status['Kategori'],
+            'Anggaran': status['Anggaran'].map(format_currency),
+            'Terpakai': status['Terpakai'].map(format_currency),
+            'Sisa': status['Sisa'].map(format_signed),
+            'Persen': status['Persen'].clip(upper=100),
+            'Status': status['Persen'].map(budget_label),
+        }), column_config={
+            'Persen': st.column_config.ProgressColumn("Terpakai (%)", min_value=0, max_value=100, format="%.0f%%"),
+        }, hide_index=True, use_container_width=True)
     
     st.markdown("<br>", unsafe_allow_html=True)
     
     # Export section
     st.markdown("### 📥 Ekspor Data")
     
-    col1, col2, col3, col4 = st.columns(4)
+    # Files are generated only when a button is clicked (in memory, see export.to_bytes)
+    book = combined.load(LEDGERS)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     
+    col1, col2, col3 = st.columns([2, 2, 2])
     with col1:
-        if not df_pemasukan.empty:
-            csv_pemasukan = df_pemasukan.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="📥 Pemasukan CSV",
-                data=csv_pemasukan,
-                file_name=f'pemasukan_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-                mime='text/csv',
-                use_container_width=True
-            )
+        fmt = st.selectbox("📄 Format", options=export.available_formats(), format_func=EXPORT_LABELS.get, key="export_format")
+    extension, mime = export.FORMATS[fmt]
     
-    with col2:
-        if not df_pengeluaran.empty:
-            csv_pengeluaran = df_pengeluaran.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="📥 Pengeluaran CSV",
-                data=csv_pengeluaran,
-                file_name=f'pengeluaran_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-                mime='text/csv',
-                use_container_width=True
-            )
+    columns = st.columns(len(TIPE_CONFIG) + 1)
+    for col, (tipe, config) in zip(columns, TIPE_CONFIG.items()):
+        with col:
+            if not book.view(tipe).empty:
+                st.download_button(
+                    label=f"📥 {tipe} {EXPORT_LABELS[fmt]}",
+                    data=lambda tipe=tipe: export.to_bytes(tipe, fmt, LEDGERS),
+                    file_name=f'{config["key"]}_{timestamp}{extension}',
+                    mime=mime,
+                    use_container_width=True
+                )
     
-    with col3:
-        if not df_investasi.empty:
-            csv_investasi = df_investasi.to_csv(index=False).encode('utf-8')
+    with columns[-1]:
+        if not book.empty:
             st.download_button(
-                label="📥 Investasi CSV",
-                data=csv_investasi,
-                file_name=f'investasi_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-                mime='text/csv',
-                use_container_width=True
-            )
-    
-    with col4:
-        if not df_pemasukan.empty or not df_pengeluaran.empty or not df_investasi.empty:
-            all_data = []
-            
-            if not df_pemasukan.empty:
-                df_p = df_pemasukan.copy()
-                df_p['Tipe'] = 'Pemasukan'
-                all_data.append(df_p)
-            
-            if not df_pengeluaran.empty:
-                df_e = df_pengeluaran.copy()
-                df_e['Tipe'] = 'Pengeluaran'
-                all_data.append(df_e)
-            
-            if not df_investasi.empty:
-                df_i = df_investasi.copy()
-                df_i['Tipe'] = 'Investasi'
-                all_data.append(df_i)
-            
-            df_all = pd.concat(all_data, ignore_index=True)
-            df_all = df_all.sort_values('Tanggal', ascending=False)
-            
-            csv_all = df_all.to_csv(index=False).encode('utf-8')
-            st.download_button(
-                label="📥 Semua Data CSV",
-                data=csv_all,
-                file_name=f'cashflow_lengkap_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
-                mime='text/csv',
+                label=f"📥 Semua Data {EXPORT_LABELS[fmt]}",
+                data=lambda: export.to_bytes(None, fmt, LEDGERS),
+                file_name=f'cashflow_lengkap_{timestamp}{extension}',
+                mime=mime,
                 use_container_width=True
             )
 
+def render_worker_status():
+    """Sidebar caption with the background worker's progress or its last run"""
+    status = worker.status()
+    if status['state'] == 'running':
+        st.sidebar.caption(f"🧹 Merapikan data… {status['done']}/{status['total']} ({status['current'] or '-'})")
+    elif status['last_started'] is not None:
+        text = (f"🧹 Data dirapikan {datetime.fromtimestamp(status['last_started']):%H:%M:%S} · "
+                f"{status['last_seconds'] * 1000:.0f} ms · {status['compacted']} ledger dipadatkan")
+        st.sidebar.caption(text)
+        if status['last_error']:
+            st.sidebar.caption(f"⚠️ {status['last_error']}")
+
+# Traced reruns listed in the debug panel, per session
+TRACE_HISTORY = 10
+
+def render_debug_panel():
+    """Sidebar panel with the timing spans of this session's recent reruns"""
+    traces = st.session_state.get('traces', [])
+    with st.sidebar.expander("🐞 Debug: Waktu Proses", expanded=True):
+        if not traces:
+            st.caption("Belum ada rerun yang diukur.")
+            return
+        picked = st.selectbox(
+            "Rerun",
+            options=range(len(traces) - 1, -1, -1),
+            format_func=lambda i: f"{datetime.fromtimestamp(traces[i].started_at):%H:%M:%S} · "
+                                  f"{traces[i].labels.get('page', '-')} · {traces[i].seconds * 1000:,.1f} ms"
+        )
+        picked = traces[picked]
+        st.dataframe(pd.DataFrame({
+            'Span': ["· " * span.depth + span.name for span in picked.spans],
+            'Detail': [span.label or "" for span in picked.spans],
+            'ms': [round(span.seconds * 1000, 2) for span in picked.spans],
+            'Baris': [span.rows for span in picked.spans],
+            'Byte': [span.bytes for span in picked.spans],
+            'Cache': [f"{span.hits}/{span.hits + span.misses}" if span.hits or span.misses else "" for span in picked.spans],
+        }), hide_index=True, use_container_width=True)
+        st.download_button("📥 Trace JSON", picked.to_json(indent=1), file_name="cashflow_trace.json",
+                           mime="application/json", use_container_width=True)
+        st.download_button("📥 Metrik Prometheus", trace.prometheus(), file_name="cashflow_metrics.prom",
+                           mime="text/plain", use_container_width=True)
+
+# Sidebar navigation with icons
+st.sidebar.markdown("""
+    <div style='text-align: center; padding: 20px;'>
+        <h1 style='color: white; font-size: 2.5em;'>💰</h1>
+        <h2 style='color: white; margin: 0;'>Cashflow Tracker</h2>
+        <p style='color: #b8c6db; margin-top: 5px;'>Kelola Keuangan Lebih Mudah</p>
+    </div>
+""", unsafe_allow_html=True)
+
+st.sidebar.markdown("---")
+
+# Initialize session state for menu
+if 'menu' not in st.session_state:
+    st.session_state.menu = "📊 Dashboard"
+
+# Custom styled navigation buttons
+st.sidebar.markdown("<h3 style='color: white; text-align: center; margin-bottom: 20px;'>📍 NAVIGASI</h3>", unsafe_allow_html=True)
+
+NAVIGATION = [("📊 Dashboard", "dashboard")] + [(config['menu'], config['key']) for config in TIPE_CONFIG.values()]
+for menu_label, key in NAVIGATION:
+    icon, label = menu_label.split(" ", 1)
+    if st.sidebar.button(icon, key=f"nav_{key}", use_container_width=True):
+        st.session_state.menu = menu_label
+    st.sidebar.markdown("""
+<div style='margin-top: -10px; margin-bottom: 15px;'>
+    <p style='color: {}; text-align: center; font-size: 14px; font-weight: bold;'>{}</p>
+</div>
+""".format('#4facfe' if st.session_state.menu == menu_label else '#b8c6db', label), unsafe_allow_html=True)
+
+menu = st.session_state.menu
+PAGE_TIPES = {config['menu']: tipe for tipe, config in TIPE_CONFIG.items()}
+
+# Render only the selected page; the trace ends here even if the page stops or reruns
+RERUN_TRACE = trace.current()
+if RERUN_TRACE is not None:
+    RERUN_TRACE.labels['page'] = menu.split(" ", 1)[1]
+try:
+    with trace.span("render", menu.split(" ", 1)[1]):
+        if menu in PAGE_TIPES:
+            render_entry_page(PAGE_TIPES[menu])
+        elif menu == "📊 Dashboard":
+            render_dashboard()
+finally:
+    if RERUN_TRACE is not None:
+        trace.finish(RERUN_TRACE)
+        # Reruns cut short by st.rerun() are kept too, so saves and deletes show up
+        st.session_state['traces'] = (st.session_state.get('traces', []) + [RERUN_TRACE])[-TRACE_HISTORY:]
+
 # Sidebar footer
 st.sidebar.markdown("---")
+if st.user.get('is_logged_in'):
+    st.sidebar.caption(f"👤 {st.user.get('email') or st.user.get('name')}")
+    st.sidebar.button("🚪 Keluar", key="logout", on_click=st.logout, use_container_width=True)
 st.sidebar.markdown("""
 <div style='text-align: center; padding: 20px; background: rgba(255,255,255,0.1); border-radius: 10px;'>
     <h4 style='color: white; margin: 0;'>📊 Cashflow Tracker Pro</h4>
@@ -833,6 +1066,10 @@ st.sidebar.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+render_worker_status()
+if DEBUG:
+    render_debug_panel()
+
 st.sidebar.markdown("<br>", unsafe_allow_html=True)
 st.sidebar.markdown("""
 <div style='background: rgba(255,255,255,0.05); padding: 15px; border-radius: 10px; border-left: 4px solid #4facfe;'>
@@ -0,0 +1,23 @@
+"""Data layer for Cashflow Tracker Pro
+
+Loading, writing, aggregation and export of the ledgers, without Streamlit or
+plotly, for the app, the command line (python -m cashflow) and batch jobs.
+Submodules and the ledger API (cashflow.load_data, cashflow.save_data, ...)
+are imported on first use, so ``import cashflow`` itself is instant.
+"""
+import importlib
+
+_SUBMODULES = {'aggregates', 'budgets', 'categories', 'combined', 'export', 'fileio', 'importer', 'ledger', 'lru', 'portfolio', 'query', 'recurring', 'storage', 'tenants', 'trace', 'worker'}
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f'{__name__}.{name}')
+    ledger = importlib.import_module(f'{__name__}.ledger')
+    if name in ledger.__all__:
+        return getattr(ledger, name)
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def __dir__():
+    return sorted(set(globals()) | _SUBMODULES | set(importlib.import_module(f'{__name__}.ledger').__all__))
@@ -0,0 +1,160 @@
+"""Command line tools: python -m cashflow <command>"""
+import argparse
+import datetime
+import os
+
+import pandas as pd
+
+from cashflow import aggregates, budgets, categories, export, importer, ledger, portfolio, recurring
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m cashflow')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    cmd = commands.add_parser('migrate', help='copy the CSV ledgers into another storage backend')
+    cmd.add_argument('backend', choices=sorted(ledger.BACKENDS))
+    cmd.add_argument('files', nargs='*', default=list(ledger.LEDGERS.values()))
+
+    cmd = commands.add_parser('export', help='write a ledger from the active backend as CSV')
+    cmd.add_argument('file', help='ledger name, e.g. pengeluaran.csv')
+    cmd.add_argument('dest')
+
+    cmd = commands.add_parser('export-all', help='write every ledger, with its Tipe, newest first')
+    cmd.add_argument('dest')
+    cmd.add_argument('--format', choices=list(export.FORMATS), default='csv')
+
+    cmd = commands.add_parser('import', help='add the transactions of a CSV file or bank statement to a ledger')
+    cmd.add_argument('source', help='CSV with Tanggal and Jumlah columns (Kategori, Keterangan optional)')
+    cmd.add_argument('file', help='ledger name, e.g. pengeluaran.csv')
+    cmd.add_argument('--sep', default=',', help="field separator (default ',')")
+    cmd.add_argument('--dry-run', action='store_true', help='validate only, write nothing')
+
+    cmd = commands.add_parser('kategori', help="list, rename or merge a ledger's categories")
+    cmd.add_argument('file', help='ledger name, e.g. pengeluaran.csv')
+    action = cmd.add_mutually_exclusive_group()
+    action.add_argument('--add', metavar='NAME')
+    action.add_argument('--rename', nargs=2, metavar=('OLD', 'NEW'))
+    action.add_argument('--merge', nargs=2, metavar=('SOURCE', 'TARGET'))
+
+    cmd = commands.add_parser('anggaran', help="show or set the monthly budgets of a ledger's categories")
+    cmd.add_argument('file', nargs='?', default=ledger.LEDGERS['Pengeluaran'])
+    cmd.add_argument('--set', nargs=2, metavar=('KATEGORI', 'JUMLAH'), help='set a budget (0 removes it)')
+    cmd.add_argument('--bulan', metavar='YYYY-MM', help='month whose spend is shown (default: this month)')
+
+    commands.add_parser('months', help='list the months that have transactions')
+
+    cmd = commands.add_parser('summary', help='print the totals of a month or a date range')
+    cmd.add_argument('month', nargs='?', help="'YYYY-MM' (default: the latest month)")
+    cmd.add_argument('--from', dest='start', type=datetime.date.fromisoformat, metavar='YYYY-MM-DD',
+                     help='first day of a date range instead of a month')
+    cmd.add_argument('--to', dest='end', type=datetime.date.fromisoformat, metavar='YYYY-MM-DD',
+                     help='last day of the date range (default: today)')
+
+    cmd = commands.add_parser('harga', help='import daily closes (CSV or Parquet) for valuing investments')
+    cmd.add_argument('source', help='Tanggal, Instrumen and Harga columns, or Tanggal and one column per instrument')
+    cmd.add_argument('--ledger', default=ledger.LEDGERS['Investasi'], help='investment ledger whose folder gets the prices')
+    cmd.add_argument('--sep', default=',', help="field separator (default ',')")
+
+    cmd = commands.add_parser('portfolio', help='print the value, cost and returns of the investments')
+    cmd.add_argument('file', nargs='?', default=ledger.LEDGERS['Investasi'])
+
+    cmd = commands.add_parser('rutin', help='write the recurring transactions that are due and list the rules')
+    cmd.add_argument('folder', nargs='?', default='', help='folder of the ledgers (default: the current one)')
+    cmd.add_argument('--sampai', type=datetime.date.fromisoformat, metavar='YYYY-MM-DD',
+                     help='write the occurrences up to this day (default: today)')
+
+    args = parser.parse_args(argv)
+    if args.command == 'migrate':
+        backend = ledger.migrate(args.files, args.backend)
+        for filename in args.files:
+            print(f'{filename} -> {backend.path(filename)} ({len(backend.load(filename))} baris)')
+    elif args.command == 'export':
+        ledger.export_csv(args.file, args.dest)
+    elif args.command == 'export-all':
+        with open(args.dest, 'wb') as f:
+            export.write(f, fmt=args.format)
+    elif args.command == 'import':
+        try:
+            result = importer.import_csv(args.source, args.file, sep=args.sep, dry_run=args.dry_run)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f'{result.read} baris dibaca, {result.imported} {"siap diimpor" if args.dry_run else "diimpor"}, '
+              f'{result.duplicates} duplikat, {result.rejected} ditolak, {result.skipped} sisi lain '
+              f'({result.seconds:.2f} s, {result.rows_per_second:,.0f} baris/s)')
+        for row in result.errors.head(10).itertuples(index=False):
+            print(f'  baris {row.Baris}: {row.Alasan}')
+    elif args.command == 'kategori':
+        registry = categories.get(args.file)
+        try:
+            if args.add:
+                registry.add(args.add)
+            elif args.rename:
+                registry.rename(*args.rename)
+            elif args.merge:
+                registry.merge(*args.merge)
+        except ValueError as e:
+            parser.error(str(e))
+        for name in registry:
+            aliases = registry.aliases(name)
+            print(f'{registry.id(name):>4}  {name}' + (f"  (juga: {', '.join(aliases)})" if aliases else ''))
+    elif args.command == 'anggaran':
+        try:
+            if args.set:
+                budgets.get(args.file).set(args.set[0], int(args.set[1]))
+        except ValueError as e:
+            parser.error(str(e))
+        status = budgets.status(args.file, args.bulan)
+        lines = [f"{'Kategori':<20}{'Anggaran':>16}{'Terpakai':>16}{'Sisa':>16}{'Persen':>9}"]
+        for row in status.itertuples(index=False):
+            if row.Anggaran:
+                sisa, percent = f'{row.Sisa:,}', f'{row.Persen:.0f}%'
+            else:
+                sisa, percent = '-', '-'
+            lines.append(f'{row.Kategori:<20}{row.Anggaran:>16,}{row.Terpakai:>16,}{sisa:>16}{percent:>9}')
+        print('\n'.join(lines).replace(',', '.'))
+    elif args.command == 'harga':
+        try:
+            prices = portfolio.read_prices(args.source, sep=args.sep)
+        except ValueError as e:
+            parser.error(str(e))
+        store = portfolio.price_store(args.ledger)
+        store.update(prices)
+        first, last = store.bounds()
+        print(f"{len(prices)} harga diimpor; {len(store.instruments)} instrumen, {first:%Y-%m-%d} s.d. {last:%Y-%m-%d}")
+    elif args.command == 'portfolio':
+        valuation = portfolio.get(args.file)
+        lines = [f"{'Instrumen':<12}{'Unit':>14}{'Modal':>16}{'Nilai':>16}{'Return':>10}{'TWR':>10}"]
+        for row in valuation.positions().itertuples(index=False):
+            lines.append(f'{row.Instrumen:<12}{row.Unit:>14,.4f}{row.Modal:>16,.0f}{row.Nilai:>16,.0f}'
+                         f'{row.Return:>9.2f}%{row.TWR:>9.2f}%')
+        lines.append(f'TWR portofolio: {valuation.twr():.2f}%')
+        # Indonesian separators: 1.234.567,89
+        print('\n'.join(lines).replace(',', '_').replace('.', ',').replace('_', '.'))
+    elif args.command == 'rutin':
+        ledgers = {tipe: os.path.join(args.folder, name) for tipe, name in ledger.LEDGERS.items()}
+        written = recurring.materialize(ledgers, args.sampai)
+        print(f'{sum(written.values())} transaksi rutin dicatat')
+        for rule in recurring.get(ledgers).frame().itertuples(index=False):
+            schedule = rule.Frekuensi if rule.Interval == 1 else f'{rule.Frekuensi} x{rule.Interval}'
+            upcoming = '-' if pd.isna(rule.Berikutnya) else f'{rule.Berikutnya:%Y-%m-%d}'
+            print(f'{rule.Tipe:<12}{rule.Kategori:<20}{rule.Jumlah:>14,}  {schedule:<12}{upcoming}'.replace(',', '.'))
+    elif args.command == 'months':
+        print('\n'.join(aggregates.months()))
+    elif args.command == 'summary':
+        if args.start is not None:
+            end = args.end or datetime.date.today()
+            print(f'{args.start} s.d. {end}')
+            totals = aggregates.range_summary(args.start, end)
+        else:
+            month = args.month or next(iter(aggregates.months()), None)
+            if month is None:
+                parser.error('belum ada transaksi')
+            print(month)
+            totals = aggregates.summary(month)
+        for name, total in totals.items():
+            print(f'{name:<12}{total:>16,}'.replace(',', '.'))
+
+
+if __name__ == '__main__':
+    main()
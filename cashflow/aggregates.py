@@ -0,0 +1,369 @@
+"""Monthly and daily aggregates of the ledgers, maintained incrementally
+
+Each ledger gets sums and counts per (month, Kategori), per day and per
+(day, Kategori). They are built once from the cached frame and then kept
+current from the storage backend's change events, so saves and deletes (from
+any session) adjust a few counters instead of regrouping the whole ledger.
+The Dashboard reads its month list, totals, pie charts and daily trend from
+here; date ranges are summed from prefix sums over the daily cells (RangeSums).
+"""
+import datetime
+import itertools
+import os
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from cashflow import categories, ledger, trace
+from cashflow.query import month_code, month_codes, month_label
+
+_stores = {}
+_lock = threading.Lock()
+_subscribed = weakref.WeakSet()
+# Data versions are unique across stores, so a rebuilt store never reuses one
+_versions = itertools.count(1)
+
+
+class RangeSums:
+    """Prefix sums of daily totals per Kategori, so any date range is summed without a scan
+
+    Row i of sums and counts holds the totals of every day before
+    start + i, so a range is the difference of two rows: O(1) per category.
+    """
+
+    def __init__(self, cells):
+        """cells: {(day, kategori): (sum, count)} with day a Timestamp"""
+        self.kategori = sorted({kategori for _, kategori in cells})
+        if cells:
+            days = np.array([day for day, _ in cells], dtype='datetime64[D]')
+            self.start = days.min()
+            length = int((days.max() - self.start).astype('int64')) + 1
+            rows = (days - self.start).astype('int64') + 1
+        else:
+            self.start = np.datetime64('1970-01-01', 'D')
+            length, rows = 0, np.zeros(0, dtype='int64')
+        column = {kategori: i for i, kategori in enumerate(self.kategori)}
+        columns = np.array([column[kategori] for _, kategori in cells], dtype='int64')
+        values = np.array(list(cells.values()), dtype='int64').reshape(-1, 2)
+        sums = np.zeros((length + 1, len(self.kategori)), dtype='int64')
+        counts = np.zeros_like(sums)
+        np.add.at(sums, (rows, columns), values[:, 0])
+        np.add.at(counts, (rows, columns), values[:, 1])
+        self.sums = sums.cumsum(axis=0)
+        self.counts = counts.cumsum(axis=0)
+        self.daily_sums = self.sums.sum(axis=1)
+        self.daily_counts = self.counts.sum(axis=1)
+
+    def _rows(self, start, end):
+        """Prefix rows bounding the dates start to end (inclusive), clipped to the data"""
+        last = len(self.sums) - 1
+        first = int((np.datetime64(start, 'D') - self.start).astype('int64'))
+        stop = int((np.datetime64(end, 'D') - self.start).astype('int64')) + 1
+        first, stop = min(max(first, 0), last), min(max(stop, 0), last)
+        return first, max(first, stop)
+
+    def total(self, start, end):
+        """Sum of Jumlah from start to end"""
+        first, stop = self._rows(start, end)
+        return int(self.daily_sums[stop] - self.daily_sums[first])
+
+    def count(self, start, end):
+        """Number of transactions from start to end"""
+        first, stop = self._rows(start, end)
+        return int(self.daily_counts[stop] - self.daily_counts[first])
+
+    def by_kategori(self, start, end):
+        """{kategori: sum} from start to end, for the categories with transactions"""
+        first, stop = self._rows(start, end)
+        sums = self.sums[stop] - self.sums[first]
+        counts = self.counts[stop] - self.counts[first]
+        return {kategori: int(total) for kategori, total, count in zip(self.kategori, sums, counts) if count}
+
+    def daily(self, start, end):
+        """Frame of Tanggal and summed Jumlah for the days from start to end with transactions"""
+        first, stop = self._rows(start, end)
+        totals = np.diff(self.daily_sums[first:stop + 1])
+        present = np.diff(self.daily_counts[first:stop + 1]) > 0
+        days = self.start + np.arange(first, stop)[present]
+        return pd.DataFrame({
+            'Tanggal': pd.to_datetime(days),
+            'Jumlah': totals[present],
+        }, columns=['Tanggal', 'Jumlah'])
+
+
+class LedgerAggregates:
+    """Sums and counts of one ledger per (month, Kategori), per (month, day) and per (month, day, Kategori)
+
+    Cells are kept under the names rows were saved with; with a registry,
+    by_kategori() reports them under the current category names.
+    """
+
+    def __init__(self, frame, registry=None):
+        self.frame = frame
+        self.registry = registry
+        # month -> {kategori: [sum, count]}, month -> {day: [sum, count]}
+        # and month -> {(day, kategori): [sum, count]}
+        self.by_month = {}
+        self.by_day = {}
+        self.by_day_kategori = {}
+        # month -> data version, bumped whenever the month's rows change
+        self.versions = {}
+        self._latest = 0
+        self._range_sums = None
+        self._lock = threading.Lock()
+        self._add(frame, 1)
+
+    def _add(self, df, sign):
+        if df is None or df.empty:
+            return
+        with trace.span('groupby') as span:
+            span.rows = len(df)
+            month = month_codes(df['Tanggal'])
+            names = df['Kategori'].astype(str)
+            by_month = df.groupby([month, names], sort=False)['Jumlah'].agg(['sum', 'count'])
+            by_day = df.groupby([month, df['Tanggal'], names], sort=False)['Jumlah'].agg(['sum', 'count'])
+        labels = {}
+        for (code, kategori), total, count in zip(by_month.index, by_month['sum'], by_month['count']):
+            m = labels.get(code) or labels.setdefault(code, month_label(code))
+            self._bump(self.by_month, m, kategori, sign * int(total), sign * int(count))
+        for (code, day, kategori), total, count in zip(by_day.index, by_day['sum'], by_day['count']):
+            m = labels.get(code) or labels.setdefault(code, month_label(code))
+            self._bump(self.by_day, m, day, sign * int(total), sign * int(count))
+            self._bump(self.by_day_kategori, m, (day, kategori), sign * int(total), sign * int(count))
+
+    def _bump(self, table, month, key, total, count):
+        self.versions[month] = self._latest = next(_versions)
+        cells = table.setdefault(month, {})
+        cell = cells.setdefault(key, [0, 0])
+        cell[0] += total
+        cell[1] += count
+        if cell[1] <= 0:
+            del cells[key]
+            if not cells:
+                del table[month]
+
+    def apply(self, frame, added, removed):
+        """Move the aggregates from self.frame to frame given the rows added and removed"""
+        with self._lock:
+            self._add(added, 1)
+            self._add(removed, -1)
+            self.frame = frame
+
+    def version(self, month=None):
+        """Data version of a month (or of the whole ledger); it changes whenever its transactions do
+
+        Meant as a cache key for anything derived from the month.
+        """
+        with self._lock:
+            return self._latest if month is None else self.versions.get(month, 0)
+
+    def range_version(self, start, end):
+        """Data version of the dates start to end: the latest version of the months they cover"""
+        first, last = month_code(str(start)[:7]), month_code(str(end)[:7])
+        with self._lock:
+            return max((v for m, v in self.versions.items() if first <= month_code(m) <= last), default=0)
+
+    def range_sums(self):
+        """RangeSums of the ledger, rebuilt from the daily cells only after a change"""
+        with self._lock:
+            if self._range_sums is None or self._range_sums[0] != self._latest:
+                with trace.span('range_sums') as span:
+                    cells = {key: cell for cells in self.by_day_kategori.values() for key, cell in cells.items()}
+                    self._range_sums = (self._latest, RangeSums(cells))
+                    span.rows = len(cells)
+                    span.misses = 1
+            else:
+                trace.note(hits=1)
+            return self._range_sums[1]
+
+    def months(self):
+        """Months ('YYYY-MM') with transactions, newest first"""
+        with self._lock:
+            return sorted(self.by_month, reverse=True)
+
+    def total(self, month):
+        """Sum of Jumlah in a month"""
+        with self._lock:
+            return sum(cell[0] for cell in self.by_month.get(month, {}).values())
+
+    def count(self, month):
+        """Number of transactions in a month"""
+        with self._lock:
+            return sum(cell[1] for cell in self.by_month.get(month, {}).values())
+
+    def by_kategori(self, month):
+        """Frame of Kategori and summed Jumlah for a month"""
+        return self._kategori_frame(self._month_sums(month))
+
+    def kategori_totals(self, month):
+        """{kategori: sum} for a month under the current category names, read from the counters"""
+        return self._canonical(self._month_sums(month))
+
+    def _month_sums(self, month):
+        with self._lock:
+            return {kategori: cell[0] for kategori, cell in self.by_month.get(month, {}).items()}
+
+    def total_between(self, start, end):
+        """Sum of Jumlah from start to end (dates, inclusive)"""
+        return self.range_sums().total(start, end)
+
+    def count_between(self, start, end):
+        """Number of transactions from start to end"""
+        return self.range_sums().count(start, end)
+
+    def by_kategori_between(self, start, end):
+        """Frame of Kategori and summed Jumlah from start to end"""
+        return self._kategori_frame(self.range_sums().by_kategori(start, end))
+
+    def daily_between(self, start, end):
+        """Frame of Tanggal and summed Jumlah per day from start to end"""
+        return self.range_sums().daily(start, end)
+
+    def changes(self, start, end, previous_start, previous_end):
+        """Per Kategori: Jumlah from start to end, Sebelumnya (the previous period), Selisih and Persen
+
+        With two months this gives the month-over-month change per category.
+        Persen is NaN for categories absent in the previous period.
+        """
+        sums = self.range_sums()
+        current = self._canonical(sums.by_kategori(start, end))
+        previous = self._canonical(sums.by_kategori(previous_start, previous_end))
+        names = list(current) + [name for name in previous if name not in current]
+        df = pd.DataFrame({
+            'Kategori': names,
+            'Jumlah': [current.get(name, 0) for name in names],
+            'Sebelumnya': [previous.get(name, 0) for name in names],
+        }, columns=['Kategori', 'Jumlah', 'Sebelumnya'])
+        df['Selisih'] = df['Jumlah'] - df['Sebelumnya']
+        df['Persen'] = df['Selisih'] / df['Sebelumnya'].where(df['Sebelumnya'] != 0) * 100
+        return df.sort_values('Jumlah', ascending=False, ignore_index=True)
+
+    def _canonical(self, sums):
+        """{kategori: sum} under the current category names"""
+        if self.registry is None:
+            return dict(sums)
+        cells = {}
+        for kategori, total in sums.items():
+            name = self.registry.canonical(kategori)
+            cells[name] = cells.get(name, 0) + total
+        return cells
+
+    def _kategori_frame(self, sums):
+        cells = self._canonical(sums)
+        return pd.DataFrame({
+            'Kategori': list(cells),
+            'Jumlah': list(cells.values()),
+        }, columns=['Kategori', 'Jumlah'])
+
+    def daily(self, month):
+        """Frame of Tanggal and summed Jumlah per day of a month, sorted by date"""
+        with self._lock:
+            cells = {day: cell[0] for day, cell in self.by_day.get(month, {}).items()}
+        days = sorted(cells)
+        return pd.DataFrame({
+            'Tanggal': pd.to_datetime(days),
+            'Jumlah': [cells[day] for day in days],
+        }, columns=['Tanggal', 'Jumlah'])
+
+
+def _on_change(filename, previous, frame, added, removed):
+    key = os.path.abspath(filename)
+    with _lock:
+        store = _stores.get(key)
+        if store is None:
+            return
+        if added is not None and frame is not None and store.frame is previous:
+            store.apply(frame, added, removed)
+        else:
+            del _stores[key]
+
+
+def get(filename):
+    """Aggregates for a ledger, in sync with its current contents"""
+    backend = ledger.get_backend()
+    if backend not in _subscribed:
+        backend.subscribe(_on_change)
+        _subscribed.add(backend)
+
+    # Loading first lets pending changes arrive as events before the check
+    frame = ledger.load_data(filename)
+    registry = categories.get(filename)
+    key = os.path.abspath(filename)
+    with _lock:
+        store = _stores.get(key)
+        if store is None or store.frame is not frame:
+            with trace.span('aggregate', os.path.basename(filename)) as span:
+                store = LedgerAggregates(frame, registry)
+                span.rows = len(frame)
+                span.misses = 1
+            _stores[key] = store
+        else:
+            trace.note(hits=1)
+        return store
+
+
+def invalidate(filename=None):
+    """Drop the aggregates of a ledger, or of every ledger if no filename is given"""
+    with _lock:
+        if filename is None:
+            _stores.clear()
+        else:
+            _stores.pop(os.path.abspath(filename), None)
+
+
+def months(ledgers=None):
+    """Months ('YYYY-MM') with transactions in any ledger, newest first"""
+    ledgers = ledger.LEDGERS if ledgers is None else ledgers
+    return sorted(set().union(*(get(filename).months() for filename in ledgers.values())), reverse=True)
+
+
+def _with_saldo(totals):
+    totals['Saldo'] = totals.get('Pemasukan', 0) - totals.get('Pengeluaran', 0) - totals.get('Investasi', 0)
+    return totals
+
+
+def summary(month, ledgers=None):
+    """Totals per Tipe for a month, plus 'Saldo' (Pemasukan minus Pengeluaran and Investasi)"""
+    ledgers = ledger.LEDGERS if ledgers is None else ledgers
+    return _with_saldo({tipe: get(filename).total(month) for tipe, filename in ledgers.items()})
+
+
+def range_summary(start, end, ledgers=None):
+    """Totals per Tipe from start to end (dates, inclusive), plus 'Saldo'"""
+    ledgers = ledger.LEDGERS if ledgers is None else ledgers
+    return _with_saldo({tipe: get(filename).total_between(start, end) for tipe, filename in ledgers.items()})
+
+
+def month_range(month):
+    """First and last day of a 'YYYY-MM' month"""
+    period = pd.Period(month, freq='M')
+    return period.start_time.date(), period.end_time.date()
+
+
+def trailing_range(month, n):
+    """First day of the n months ending with month, and the last day of month"""
+    period = pd.Period(month, freq='M')
+    return (period - (n - 1)).start_time.date(), period.end_time.date()
+
+
+def year_to_date(day):
+    """First day of day's year, and day"""
+    return datetime.date(day.year, 1, 1), day
+
+
+def previous_range(start, end, months=None):
+    """The period start..end is compared with: months months earlier, or else as many days right before
+
+    A range ending on a month's last day keeps ending on one, so the
+    previous period of a month is the whole previous month.
+    """
+    if months is None:
+        length = datetime.timedelta(days=(end - start).days + 1)
+        return start - length, end - length
+    offset = pd.DateOffset(months=months)
+    previous_end = pd.Timestamp(end) - offset
+    if (end + datetime.timedelta(days=1)).day == 1:
+        previous_end += pd.offsets.MonthEnd(0)
+    return (pd.Timestamp(start) - offset).date(), previous_end.date()
@@ -0,0 +1,128 @@
+"""Monthly budgets per category, compared with what the month has spent so far
+
+The budgets of a ledger are in ``<ledger>.anggaran.json`` next to it, shared
+by every session. They are keyed by category ID (cashflow.categories), so a
+renamed category keeps its budget. The spend comes from the month's
+(month, Kategori) counters in cashflow.aggregates, which every save and
+delete adjusts, so checking a budget never scans the ledger: one counter
+lookup per category.
+"""
+import datetime
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cashflow import aggregates, categories, fileio
+
+# Share of a budget (percent) from which it is reported as nearly used up
+WARNING = 80
+
+_budgets = {}
+_lock = threading.Lock()
+
+
+class Budgets(fileio.JsonStore):
+    """Monthly budget (Rupiah) of each category of a ledger, persisted as JSON by category ID"""
+
+    def __init__(self, path, registry):
+        self.registry = registry
+        super().__init__(path, {'budgets': {}})
+        self.refresh()
+
+    def _set_state(self, state):
+        self._amounts = {int(i): int(amount) for i, amount in state['budgets'].items()}
+
+    def _state(self):
+        return {'budgets': {str(i): amount for i, amount in sorted(self._amounts.items())}}
+
+    def amounts(self):
+        """{category name: budget} of the categories with a budget, in registry order"""
+        ids = {name: self.registry.id(name) for name in self.registry}
+        return {name: self._amounts[i] for name, i in ids.items() if i in self._amounts}
+
+    def amount(self, kategori):
+        """Budget of a category (by current name or alias), or None"""
+        return self._amounts.get(self.registry.id(kategori))
+
+    def _set(self, kategori, amount):
+        category_id = self.registry.id(kategori)
+        if category_id is None:
+            raise ValueError(f"Kategori '{kategori}' tidak ada")
+        amount = int(amount or 0)
+        if amount < 0:
+            raise ValueError('Anggaran tidak boleh negatif')
+        if amount:
+            self._amounts[category_id] = amount
+        else:
+            self._amounts.pop(category_id, None)
+
+    def set(self, kategori, amount):
+        """Set a category's monthly budget; 0 or None removes it"""
+        self._change(lambda: self._set(kategori, amount))
+
+    def update(self, amounts):
+        """Set the budgets {kategori: amount} of several categories with a single save"""
+        def change():
+            for kategori, amount in amounts.items():
+                self._set(kategori, amount)
+        self._change(change)
+
+
+def budgets_path(filename):
+    return os.path.splitext(filename)[0] + '.anggaran.json'
+
+
+def get(filename):
+    """Budgets of a ledger, shared by every session and reloaded when their file changes"""
+    key = os.path.abspath(filename)
+    with _lock:
+        budgets = _budgets.get(key)
+        if budgets is None:
+            budgets = _budgets[key] = Budgets(budgets_path(filename), categories.get(filename))
+    budgets.registry = categories.get(filename)
+    budgets.refresh()
+    return budgets
+
+
+def invalidate(filename=None):
+    """Forget the loaded budgets of a ledger (or of every ledger)"""
+    with _lock:
+        if filename is None:
+            _budgets.clear()
+        else:
+            _budgets.pop(os.path.abspath(filename), None)
+
+
+def _month(month):
+    return month or f'{datetime.date.today():%Y-%m}'
+
+
+def check(filename, kategori, month=None):
+    """(budget, spent) of one category in a 'YYYY-MM' month (default: this month); budget is None if unset"""
+    budget = get(filename).amount(kategori)
+    registry = categories.get(filename)
+    spent = aggregates.get(filename).kategori_totals(_month(month)).get(registry.canonical(kategori), 0)
+    return budget, spent
+
+
+def status(filename, month=None):
+    """Budget against spend per category in a 'YYYY-MM' month (default: this month)
+
+    Frame of Kategori, Anggaran, Terpakai, Sisa and Persen (share of the
+    budget used), with every category that has a budget or spent something;
+    Anggaran is 0 and Persen NaN for categories without a budget. Sorted by
+    Persen, the most used budgets first.
+    """
+    amounts = get(filename).amounts()
+    spent = aggregates.get(filename).kategori_totals(_month(month))
+    names = list(amounts) + [name for name in spent if name not in amounts]
+    df = pd.DataFrame({
+        'Kategori': names,
+        'Anggaran': np.array([amounts.get(name, 0) for name in names], dtype=np.int64),
+        'Terpakai': np.array([spent.get(name, 0) for name in names], dtype=np.int64),
+    }, columns=['Kategori', 'Anggaran', 'Terpakai'])
+    df['Sisa'] = df['Anggaran'] - df['Terpakai']
+    df['Persen'] = df['Terpakai'] / df['Anggaran'].where(df['Anggaran'] > 0) * 100
+    return df.sort_values(['Persen', 'Terpakai'], ascending=False, na_position='last', ignore_index=True)
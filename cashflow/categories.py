@@ -0,0 +1,207 @@
+"""Categories (Kategori) of each ledger: defaults and the persisted registry
+
+Each ledger has a registry in ``<ledger>.kategori.json`` next to it, shared by
+every session: the categories offered in the forms, each with a stable
+integer ID, plus the old names left behind by renames and merges (aliases).
+Rows keep the name they were saved with. Frames are mapped onto the current
+names through their categorical codes, so renaming or merging a category
+rewrites the registry and a handful of codes, never the rows on disk.
+"""
+import itertools
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cashflow import fileio, ledger
+
+DEFAULTS = {
+    'Pemasukan': ['Gaji Pokok', 'Tunjangan Kinerja', 'Uang Perjalanan Dinas', 'Bonus', 'Lain-lain'],
+    'Pengeluaran': ['Listrik', 'Makan', 'Minum', 'Transportasi', 'Pulsa', 'Kuota Internet', 'Persembahan', 'Kasih Ortu', 'Belanja', 'Hiburan', 'Lain-lain'],
+    'Investasi': ['Reksadana', 'BBRI', 'BBCA', 'BBNI', 'BMRI', 'Gold', 'APPL', 'GOOG', 'MSFT', 'TSLA'],
+}
+
+_registries = {}
+_lock = threading.Lock()
+_versions = itertools.count(1)
+
+
+def _key(name):
+    """Lookup key of a category name: case and surrounding spaces don't matter"""
+    return str(name).strip().casefold()
+
+
+def _clean(name):
+    name = str(name).strip()
+    if not name:
+        raise ValueError('Nama kategori tidak boleh kosong')
+    return name
+
+
+class Registry(fileio.JsonStore):
+    """Categories of one ledger with stable IDs and aliases, persisted as JSON
+
+    ``version`` changes with every change, including ones made by other
+    sessions, so it can be part of cache keys.
+    """
+
+    def __init__(self, path, defaults=()):
+        super().__init__(path, {'next_id': 1, 'categories': [], 'aliases': {}})
+        if not self.refresh():
+            for name in defaults:
+                self._add(name)
+            self._index()
+
+    def _set_state(self, state):
+        self._next_id = state['next_id']
+        self._names = {int(c['id']): c['name'] for c in state['categories']}
+        self._aliases = {alias: int(i) for alias, i in state['aliases'].items()}
+        self._index()
+
+    def _state(self):
+        return {
+            'next_id': self._next_id,
+            'categories': [{'id': i, 'name': name} for i, name in self._names.items()],
+            'aliases': dict(self._aliases),
+        }
+
+    def _index(self):
+        self._lookup = {_key(alias): i for alias, i in self._aliases.items() if i in self._names}
+        self._lookup.update((_key(name), i) for i, name in self._names.items())
+        self._ordered = list(self._names.values())
+        self.version = next(_versions)
+
+    def __contains__(self, name):
+        return _key(name) in self._lookup
+
+    def __iter__(self):
+        return iter(self._ordered)
+
+    def __len__(self):
+        return len(self._ordered)
+
+    def names(self):
+        """Current category names in ID order (defaults first, then in order of creation)"""
+        return list(self._ordered)
+
+    def id(self, name):
+        """ID of a category by current name or alias, or None"""
+        return self._lookup.get(_key(name))
+
+    def name(self, category_id):
+        return self._names.get(category_id)
+
+    def aliases(self, name):
+        """Old names that now mean the category name"""
+        category_id = self.id(name)
+        return [alias for alias, i in self._aliases.items() if i == category_id]
+
+    def canonical(self, name):
+        """Current name for a category name or alias; unknown names are returned as they are"""
+        category_id = self._lookup.get(_key(name))
+        return str(name) if category_id is None else self._names[category_id]
+
+    def _add(self, name):
+        name = _clean(name)
+        category_id = self._lookup.get(_key(name))
+        if category_id is None:
+            category_id = self._next_id
+            self._next_id += 1
+            self._names[category_id] = name
+            self._lookup[_key(name)] = category_id
+        return category_id
+
+    def add(self, name):
+        """Register a category and return its ID (the existing one if the name is known)"""
+        return self._change(lambda: self._add(name))
+
+    def extend(self, names):
+        """Register several categories (blank names are skipped) with a single save"""
+        return self._change(lambda: [self._add(name) for name in names if str(name).strip()])
+
+    def rename(self, old, new):
+        """Give a category a new name; the old one stays as an alias, so existing rows follow"""
+        def change():
+            category_id = self._existing(old)
+            name = _clean(new)
+            other = self._lookup.get(_key(name))
+            if other is not None and other != category_id:
+                raise ValueError(f"Kategori '{name}' sudah ada, gunakan Gabungkan")
+            previous = self._names[category_id]
+            self._names[category_id] = name
+            self._aliases = {alias: i for alias, i in self._aliases.items() if _key(alias) != _key(name)}
+            if _key(previous) != _key(name):
+                self._aliases[previous] = category_id
+            return category_id
+        return self._change(change)
+
+    def merge(self, source, target):
+        """Fold the category source into target; source's name and aliases now mean target"""
+        def change():
+            source_id, target_id = self._existing(source), self._existing(target)
+            if source_id == target_id:
+                raise ValueError('Kategori asal dan tujuan sama')
+            name = self._names.pop(source_id)
+            self._aliases = {alias: target_id if i == source_id else i for alias, i in self._aliases.items()}
+            self._aliases[name] = target_id
+            return target_id
+        return self._change(change)
+
+    def _existing(self, name):
+        category_id = self._lookup.get(_key(name))
+        if category_id is None:
+            raise ValueError(f"Kategori '{name}' tidak ada")
+        return category_id
+
+    def remap(self, kategori):
+        """Categorical Series kategori with every category mapped onto its current name
+
+        Only the categories are looked at: renames relabel them and merges
+        re-point their integer codes; row strings are never touched.
+        """
+        categories = [str(c) for c in kategori.cat.categories]
+        names = [self.canonical(c) for c in categories]
+        if names == categories:
+            return kategori
+        unique = list(dict.fromkeys(names))
+        if len(unique) == len(names):
+            return kategori.cat.rename_categories(names)
+        position = {name: i for i, name in enumerate(unique)}
+        # A trailing -1 keeps missing values (code -1) missing
+        lookup = np.array([position[name] for name in names] + [-1], dtype=kategori.cat.codes.dtype)
+        codes = lookup[kategori.cat.codes.to_numpy()]
+        return pd.Series(pd.Categorical.from_codes(codes, categories=unique), index=kategori.index, name=kategori.name)
+
+
+def registry_path(filename):
+    return os.path.splitext(filename)[0] + '.kategori.json'
+
+
+def get(filename, tipe=None):
+    """Category registry of a ledger, shared by every session and reloaded when its file changes
+
+    A new registry starts from the DEFAULTS of tipe (by default the type whose
+    file is filename) plus the categories already used in the ledger.
+    """
+    key = os.path.abspath(filename)
+    with _lock:
+        registry = _registries.get(key)
+        if registry is None:
+            if tipe is None:
+                tipe = next((t for t, name in ledger.LEDGERS.items() if name == os.path.basename(filename)), None)
+            registry = Registry(registry_path(filename), DEFAULTS.get(tipe, ()))
+            if registry._signature is None:
+                registry.extend(ledger.load_data(filename)['Kategori'].cat.categories.astype(str))
+            _registries[key] = registry
+    registry.refresh()
+    return registry
+
+
+def invalidate(filename=None):
+    """Forget the loaded registry of a ledger (or of every ledger); it is read again on next use"""
+    with _lock:
+        if filename is None:
+            _registries.clear()
+        else:
+            _registries.pop(os.path.abspath(filename), None)
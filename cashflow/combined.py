@@ -0,0 +1,103 @@
+"""All ledgers read as one with a categorical Tipe column
+
+The three ledger files stay separate on disk, and each backend caches and
+tails them independently. The app reads them through one CombinedLedger:
+built whenever one of the cached ledgers changes, and shared by every page
+and session. Its per-type views are the backend's cached frames with Tipe and
+the current category names added, sharing the rows rather than copying them,
+so every ledger is held in memory once.
+"""
+import os
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from cashflow import categories, ledger, trace
+from cashflow.storage import COLUMNS
+
+_cache = {}
+_lock = threading.Lock()
+
+
+class CombinedLedger:
+    """Transactions of every ledger type, read as one ledger
+
+    view() is one type's cached frame with a categorical Tipe column added;
+    the other columns share memory with it. With registries ({tipe:
+    categories.Registry}) Kategori shows the current category names. frame,
+    every type in one frame, is a copy and only built when first used.
+    """
+
+    def __init__(self, frames, registries=None):
+        self.tipes = list(frames)
+        self._views = {}
+        self._frame = None
+        for code, (tipe, df) in enumerate(frames.items()):
+            kategori = registries[tipe].remap(df['Kategori']) if registries else df['Kategori']
+            tipes = pd.Categorical.from_codes(np.full(len(df), code, dtype=np.int8), categories=self.tipes)
+            self._views[tipe] = df[COLUMNS].assign(Kategori=kategori, Tipe=tipes)
+
+    def view(self, tipe):
+        """Rows of one type, sharing memory with the type's cached ledger"""
+        return self._views[tipe]
+
+    @property
+    def frame(self):
+        """Every type in one frame, grouped by Tipe in ledger order (a copy)"""
+        if self._frame is None:
+            views = [self._views[tipe] for tipe in self.tipes]
+            frame = pd.concat(views, ignore_index=True)
+            kategori = [view['Kategori'] for view in views if len(view)]
+            if kategori:
+                frame['Kategori'] = union_categoricals(kategori, ignore_order=True)
+            self._frame = frame
+        return self._frame
+
+    def total(self, tipe):
+        """Sum of Jumlah for one type"""
+        return int(self.view(tipe)['Jumlah'].sum())
+
+    @property
+    def empty(self):
+        return all(view.empty for view in self._views.values())
+
+
+def _key(ledgers):
+    return tuple((tipe, os.path.abspath(filename)) for tipe, filename in ledgers.items())
+
+
+def load(ledgers=None):
+    """Combined ledger for {tipe: filename} (default ledger.LEDGERS)
+
+    Rebuilt only when a ledger or one of their category registries changed.
+    """
+    ledgers = ledger.LEDGERS if ledgers is None else ledgers
+    frames = {tipe: ledger.load_data(filename) for tipe, filename in ledgers.items()}
+    registries = {tipe: categories.get(filename, tipe) for tipe, filename in ledgers.items()}
+    versions = tuple(registry.version for registry in registries.values())
+    key = _key(ledgers)
+    with _lock:
+        cached = _cache.get(key)
+        if (cached is not None and cached[1] == versions
+                and all(ref() is df for ref, df in zip(cached[0], frames.values()))):
+            trace.note(hits=1)
+            return cached[2]
+    with trace.span('combine') as span:
+        combined = CombinedLedger(frames, registries)
+        span.rows = sum(len(combined.view(tipe)) for tipe in combined.tipes)
+        span.misses = 1
+    with _lock:
+        _cache[key] = ([weakref.ref(df) for df in frames.values()], versions, combined)
+    return combined
+
+
+def invalidate(ledgers=None):
+    """Drop the combined ledger of {tipe: filename}, or every cached one if ledgers is None"""
+    with _lock:
+        if ledgers is None:
+            _cache.clear()
+        else:
+            _cache.pop(_key(ledgers), None)
@@ -0,0 +1,138 @@
+"""Exports of one ledger type or of all ledgers merged by date
+
+Exports are produced in blocks of CHUNK_ROWS rows: a single type in ledger
+order, and "all types" as a k-way merge of the per-type views, newest first,
+without concatenating and sorting the whole ledger. write() streams the
+blocks to a file, so its memory stays bounded by the block size; to_bytes()
+(the app's download buttons) holds the whole export in memory.
+"""
+import gzip
+import io
+
+import numpy as np
+import pandas as pd
+
+from cashflow import combined
+from cashflow.storage import COLUMNS
+
+CHUNK_ROWS = 50_000
+
+# format -> (file extension, MIME type)
+FORMATS = {
+    'csv': ('.csv', 'text/csv'),
+    'csv.gz': ('.csv.gz', 'application/gzip'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+
+
+def available_formats():
+    """Export formats usable here (Parquet needs pyarrow)"""
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return [fmt for fmt in FORMATS if fmt != 'parquet']
+    return list(FORMATS)
+
+
+def _newest_first(df):
+    """Row positions of df ordered by Tanggal, newest first"""
+    values = df['Tanggal'].to_numpy()
+    if len(values) < 2 or (values[1:] >= values[:-1]).all():
+        return np.arange(len(values))[::-1]
+    return np.argsort(values, kind='stable')[::-1]
+
+
+def _merge_newest_first(frames, chunk_rows):
+    """Blocks of the rows of frames merged by Tanggal, newest first
+
+    Each source is read in blocks of chunk_rows in its own newest-first order.
+    Every round emits, from each source's current block, the rows at or after
+    the latest "oldest date in a block": no unread row can be newer than that,
+    and the source owning it is drained, so each round makes progress.
+    """
+    sources = []
+    for df in frames:
+        if len(df):
+            order = _newest_first(df)
+            sources.append([df, order, df['Tanggal'].to_numpy()[order], 0])
+
+    while sources:
+        threshold = max(keys[min(pos + chunk_rows, len(keys)) - 1] for _, _, keys, pos in sources)
+        parts = []
+        for source in sources:
+            df, order, keys, pos = source
+            end = min(pos + chunk_rows, len(keys))
+            n = int((keys[pos:end] >= threshold).sum())
+            if n:
+                parts.append(df.iloc[order[pos:pos + n]])
+                source[3] = pos + n
+        sources = [source for source in sources if source[3] < len(source[2])]
+        block = pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0].reset_index(drop=True)
+        yield block.sort_values('Tanggal', ascending=False, kind='stable')
+
+
+def iter_blocks(tipe=None, ledgers=None, chunk_rows=CHUNK_ROWS):
+    """Frames of at most ~chunk_rows rows making up one type, or every type (with Tipe) newest first
+
+    At least one (possibly empty) frame is yielded, so empty exports still get
+    their header.
+    """
+    book = combined.load(ledgers)
+    if tipe is not None:
+        df = book.view(tipe)[COLUMNS]
+        for start in range(0, max(len(df), 1), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+    elif book.empty:
+        yield book.frame
+    else:
+        yield from _merge_newest_first([book.view(t) for t in book.tipes], chunk_rows)
+
+
+def _write_csv(f, blocks):
+    header = True
+    for block in blocks:
+        f.write(block.to_csv(index=False, header=header, date_format='%Y-%m-%d').encode('utf-8'))
+        header = False
+
+
+def _write_parquet(f, blocks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    for block in blocks:
+        block = block.astype({column: str for column in ('Kategori', 'Tipe') if column in block})
+        table = pa.Table.from_pandas(block, preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(f, table.schema)
+        writer.write_table(table.cast(writer.schema))
+    writer.close()
+
+
+def write(f, tipe=None, fmt='csv', ledgers=None, chunk_rows=CHUNK_ROWS):
+    """Stream an export to the binary file f
+
+    tipe selects one ledger type; None exports every type with its Tipe,
+    newest first. fmt is one of FORMATS.
+    """
+    blocks = iter_blocks(tipe, ledgers, chunk_rows)
+    if fmt == 'csv':
+        _write_csv(f, blocks)
+    elif fmt == 'csv.gz':
+        with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+            _write_csv(gz, blocks)
+    elif fmt == 'parquet':
+        _write_parquet(f, blocks)
+    else:
+        raise ValueError(f'unknown export format {fmt!r}')
+
+
+def to_bytes(tipe=None, fmt='csv', ledgers=None, chunk_rows=CHUNK_ROWS):
+    """Export as bytes, e.g. for st.download_button
+
+    The whole export is held in memory: Streamlit serves downloads from
+    memory, so they can't be streamed. Use write() for large exports.
+    """
+    f = io.BytesIO()
+    write(f, tipe, fmt, ledgers, chunk_rows)
+    return f.getvalue()
@@ -0,0 +1,338 @@
+"""Locked, crash-safe writes for the file-based storage backends
+
+Writers hold an advisory lock per ledger file (``fcntl.flock`` on
+``<file>.lock``, ``msvcrt.locking`` on Windows), so several sessions or
+processes can share one data directory. Rewrites go to ``<file>.<random>.tmp``, are
+fsynced and renamed over the original. Appends are first written to
+``<file>.journal``; if a writer dies half-way, the next one to take the lock
+replays the journal, so a ledger never ends in a torn row.
+
+Small state kept in one JSON file (category registries, recurring rules,
+budgets) goes through JsonStore, which reloads the file when another session
+changed it and saves changes under the same lock.
+"""
+import abc
+import contextlib
+import json
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+# CASHFLOW_FSYNC=0 skips fsync: faster writes, but a power loss may lose the latest ones
+FSYNC = os.environ.get('CASHFLOW_FSYNC', '1') != '0'
+
+# Seconds a writer waits for the lock before raising TimeoutError
+LOCK_TIMEOUT = float(os.environ.get('CASHFLOW_LOCK_TIMEOUT', 10))
+
+_POLL_SECONDS = 0.005
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def journal_path(path):
+    return path + '.journal'
+
+
+def _flock(fd, deadline, path):
+    while True:
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            elif msvcrt is not None:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return
+        except OSError:
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f'{path} is locked by another writer') from None
+            time.sleep(_POLL_SECONDS)
+
+
+def _funlock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class _FileLock:
+    """Lock on one file: reentrant within a thread, exclusive across threads and processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        if not self._thread_lock.acquire(timeout=timeout):
+            raise TimeoutError(f'{self.path} is locked by another writer')
+        if self._depth == 0:
+            try:
+                fd = os.open(self.path + '.lock', os.O_RDWR | os.O_CREAT, 0o666)
+                try:
+                    _flock(fd, deadline, self.path)
+                except BaseException:
+                    os.close(fd)
+                    raise
+                self._fd = fd
+                # Finish whatever a crashed writer left half done
+                recover(self.path)
+            except BaseException:
+                if self._fd is not None:
+                    self._release_fd()
+                self._thread_lock.release()
+                raise
+        self._depth += 1
+
+    def _release_fd(self):
+        try:
+            _funlock(self._fd)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def release(self):
+        self._depth -= 1
+        try:
+            if self._depth == 0:
+                self._release_fd()
+        finally:
+            self._thread_lock.release()
+
+
+@contextlib.contextmanager
+def locked(path, timeout=None):
+    """Hold the write lock of path, waiting at most timeout (default LOCK_TIMEOUT) seconds"""
+    key = os.path.abspath(path)
+    with _locks_lock:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = _FileLock(key)
+    lock.acquire(LOCK_TIMEOUT if timeout is None else timeout)
+    try:
+        yield
+    finally:
+        lock.release()
+
+
+def _fsync(f):
+    f.flush()
+    if FSYNC:
+        os.fsync(f.fileno())
+
+
+def _fsync_dir(path):
+    """Make a rename or removal in path's directory durable (a no-op where directories can't be opened)"""
+    if FSYNC and hasattr(os, 'O_DIRECTORY'):
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def size(path):
+    """Size of a file in bytes, 0 if it doesn't exist"""
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def signature(path):
+    """Return (mtime_ns, size) of a file, or None if it doesn't exist"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _write_at(path, offset, data):
+    """Write data at offset, cutting off anything after it, and fsync"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o666)
+    with os.fdopen(fd, 'wb') as f:
+        f.seek(offset)
+        f.write(data)
+        f.truncate()
+        _fsync(f)
+
+
+def commit(tmp, path):
+    """Durably move the finished file tmp over path"""
+    if FSYNC:
+        fd = os.open(tmp, os.O_RDWR | getattr(os, 'O_BINARY', 0))
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+
+def atomic_write(path, data):
+    """Replace path with data, so readers and crashes see either the old or the new contents
+
+    Each call writes its own temporary file, so concurrent writers of the
+    same path never rename each other's file away; the last rename wins.
+    """
+    tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(data)
+            _fsync(f)
+        os.replace(tmp, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp)
+        raise
+    _fsync_dir(path)
+
+
+def _write_journal(path, entry, data):
+    entry = dict(entry, size=len(data))
+    with open(journal_path(path), 'wb') as f:
+        f.write(json.dumps(entry).encode('utf-8') + b'\n')
+        f.write(data)
+        _fsync(f)
+
+
+def append(path, data, header=b''):
+    """Append data to path through the journal; header is written first if the file is empty
+
+    Call under locked(path). The append counts as done once the journal is
+    synced: a crash after that point is completed by recover().
+    """
+    offset = size(path)
+    if offset == 0:
+        data = header + data
+    _write_journal(path, {'offset': offset}, data)
+    _write_at(path, offset, data)
+    os.remove(journal_path(path))
+
+
+def replace(path, data, renames=()):
+    """Give path the contents data after moving each finished (tmp, target) file into place
+
+    Call under locked(path). The renames and the new contents of path are
+    journaled together, so files that must change as a set (like a Feather
+    base file and its delta) are never left half updated.
+    """
+    _write_journal(path, {'renames': [list(pair) for pair in renames]}, data)
+    _apply_replace(path, renames, data)
+    os.remove(journal_path(path))
+    _fsync_dir(path)
+
+
+def _apply_replace(path, renames, data):
+    for tmp, target in renames:
+        if os.path.exists(tmp):
+            commit(tmp, target)
+    atomic_write(path, data)
+
+
+def recover(path):
+    """Complete the write recorded in path's journal, if any; True if one was replayed
+
+    A journal that was itself cut short means the write never started and
+    is dropped. An append journal is also dropped when the file has already
+    grown past it, i.e. the append finished before the crash.
+    """
+    try:
+        with open(journal_path(path), 'rb') as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return False
+    header, _, data = raw.partition(b'\n')
+    try:
+        entry = json.loads(header)
+    except ValueError:
+        entry = None
+
+    replayed = False
+    if entry is not None and entry.get('size') == len(data):
+        if 'offset' in entry:
+            if entry['offset'] <= size(path) <= entry['offset'] + len(data):
+                _write_at(path, entry['offset'], data)
+                replayed = True
+        else:
+            _apply_replace(path, entry['renames'], data)
+            replayed = True
+    os.remove(journal_path(path))
+    _fsync_dir(path)
+    return replayed
+
+
+class JsonStore(abc.ABC):
+    """State persisted in one JSON file shared by every session and process
+
+    Subclasses hold their state in their own attributes and implement
+    _set_state(state) and _state(), the JSON-ready dict. refresh() reloads the
+    file when it changed; _change() applies a change to the latest saved state
+    under the file lock and saves it, or restores the state if it raises.
+    """
+
+    def __init__(self, path, state):
+        self.path = path
+        self._lock = threading.RLock()
+        self._signature = None
+        self._set_state(state)
+
+    @abc.abstractmethod
+    def _set_state(self, state):
+        """Replace the state with one read from the file (or the initial one)"""
+
+    @abc.abstractmethod
+    def _state(self):
+        """The state as a JSON-ready dict"""
+
+    def _index(self):
+        """Rebuild whatever is derived from the state; called before each save"""
+
+    def refresh(self):
+        """Reload the state if its file changed; False if there is no file yet"""
+        current = signature(self.path)
+        if current is None:
+            return False
+        with self._lock:
+            if current != self._signature:
+                with open(self.path, encoding='utf-8') as f:
+                    self._set_state(json.load(f))
+                self._signature = current
+        return True
+
+    def _write(self):
+        data = json.dumps(self._state(), ensure_ascii=False, indent=1)
+        atomic_write(self.path, data.encode('utf-8'))
+        self._signature = signature(self.path)
+
+    def _change(self, change):
+        """Apply change() to the latest saved state and save the result, under the file lock
+
+        The file is written when the state changed or doesn't exist yet.
+        Returns what change() returns.
+        """
+        with self._lock, locked(self.path):
+            self.refresh()
+            before = self._state()
+            try:
+                result = change()
+            except BaseException:
+                self._set_state(before)
+                raise
+            if self._state() != before or self._signature is None:
+                self._index()
+                self._write()
+            return result
@@ -0,0 +1,243 @@
+"""Bulk import of transactions from CSV files and bank statement exports
+
+The input is read in chunks of CHUNK_ROWS rows and validated column-wise
+(dates, amounts and categories are normalized with vectorized string
+operations). Rows already in the ledger are skipped by comparing row hashes,
+and everything that is left is written with a single append.
+"""
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from cashflow import categories, ledger, portfolio
+
+CHUNK_ROWS = 50_000
+
+# Lower-cased input column name -> ledger column; earlier names win
+COLUMN_ALIASES = {
+    'tanggal': 'Tanggal', 'tgl': 'Tanggal', 'date': 'Tanggal', 'tanggal transaksi': 'Tanggal',
+    'transaction date': 'Tanggal',
+    'kategori': 'Kategori', 'category': 'Kategori', 'instrumen': 'Kategori',
+    'jumlah': 'Jumlah', 'nominal': 'Jumlah', 'amount': 'Jumlah', 'mutasi': 'Jumlah',
+    'debit': 'Debet', 'debet': 'Debet', 'kredit': 'Kredit', 'credit': 'Kredit',
+    'keterangan': 'Keterangan', 'deskripsi': 'Keterangan', 'description': 'Keterangan',
+    'catatan': 'Keterangan', 'uraian': 'Keterangan',
+    'unit': 'Unit', 'units': 'Unit', 'jumlah unit': 'Unit', 'quantity': 'Unit', 'qty': 'Unit',
+}
+
+# Column of a bank statement with separate Debet and Kredit columns that holds
+# each type's transactions: money going out, or coming in
+STATEMENT_SIDES = {'Pemasukan': 'Kredit', 'Pengeluaran': 'Debet', 'Investasi': 'Debet'}
+
+DEFAULT_KATEGORI = 'Lain-lain'
+
+# Rejected rows kept in ImportResult.errors
+MAX_ERRORS = 100
+
+_HASH_COLUMNS = ['Tanggal', 'Kategori', 'Jumlah', 'Keterangan']
+
+
+class ImportResult:
+    """Counts, new IDs and a sample of rejected rows of one import
+
+    skipped counts the rows of a Debet/Kredit statement that belong to the
+    other side (credits when importing expenses, and the other way round).
+    """
+
+    def __init__(self):
+        self.read = 0
+        self.imported = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.skipped = 0
+        self.errors = pd.DataFrame(columns=['Baris', 'Alasan'])
+        self.ids = []
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return (f'ImportResult(read={self.read}, imported={self.imported}, duplicates={self.duplicates}, '
+                f'rejected={self.rejected}, skipped={self.skipped}, rows_per_second={self.rows_per_second:.0f})')
+
+
+def column_mapping(columns):
+    """{input column: ledger column} for the recognized columns of an input file"""
+    mapping = {}
+    for column in columns:
+        target = COLUMN_ALIASES.get(str(column).strip().lower())
+        if target and target not in mapping.values():
+            mapping[column] = target
+    found = set(mapping.values())
+    missing = ['Tanggal'] if 'Tanggal' not in found else []
+    if not found & {'Jumlah', 'Debet', 'Kredit'}:
+        missing.append('Jumlah (atau Debet/Kredit)')
+    if missing:
+        raise ValueError(f"kolom {', '.join(missing)} tidak ditemukan (ada: {', '.join(map(str, columns))})")
+    return mapping
+
+
+def parse_dates(values):
+    """Dates from ISO (YYYY-MM-DD) or day-first (DD/MM/YYYY, DD-MM-YYYY) strings; NaT if invalid"""
+    text = values.str.strip()
+    dates = pd.to_datetime(text, format='ISO8601', errors='coerce')
+    for fmt in ('%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y'):
+        missing = dates.isna() & (text != '')
+        if not missing.any():
+            break
+        dates[missing] = pd.to_datetime(text[missing], format=fmt, errors='coerce')
+    return dates.dt.normalize()
+
+
+def parse_numbers(values):
+    """Numbers from strings like 'Rp 1.500.000', '1,500,000.00', '4.250,5' or '-25000'; NaN if invalid"""
+    text = values.str.replace(r'[^\d,.\-]', '', regex=True)
+    # 1.500.000 or 1.500.000,50: dots group thousands, a comma marks decimals
+    dotted = text.str.fullmatch(r'-?\d{1,3}(\.\d{3})+(,\d+)?')
+    text = text.where(~dotted, text.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+    # 1500,50: decimal comma
+    decimal_comma = text.str.fullmatch(r'-?\d+,\d{1,2}')
+    text = text.where(~decimal_comma, text.str.replace(',', '.', regex=False))
+    # 1,500,000.00: the remaining commas group thousands
+    text = text.str.replace(',', '', regex=False)
+    return pd.to_numeric(text, errors='coerce')
+
+
+def parse_amounts(values):
+    """Whole Rupiah amounts from strings like 'Rp 1.500.000', '1,500,000.00' or '-25000'
+
+    Signs are dropped, since statements list debits as negative amounts; NaN
+    if the text isn't a number.
+    """
+    return parse_numbers(values).abs().round()
+
+
+def normalize(chunk, mapping, registry=None, default_kategori=DEFAULT_KATEGORI, side='Debet'):
+    """Ledger rows from one raw chunk (all columns str), and the rejected rows with reasons
+
+    Category names are mapped onto their current name in the registry, so
+    'makan', 'MAKAN ' and a renamed 'Makanan' all become 'Makan'. Without a
+    Jumlah column the amounts are taken from the side ('Debet' or 'Kredit')
+    column of a statement; rows with an amount only on the other side are
+    left out of both results.
+    """
+    raw = chunk.rename(columns=mapping)
+    tanggal = parse_dates(raw['Tanggal'])
+    other = pd.Series(False, index=raw.index)
+    if 'Jumlah' in raw:
+        jumlah = parse_amounts(raw['Jumlah'])
+    else:
+        missing = pd.Series(np.nan, index=raw.index)
+        jumlah = parse_amounts(raw[side]) if side in raw else missing
+        opposite = 'Kredit' if side == 'Debet' else 'Debet'
+        other_jumlah = parse_amounts(raw[opposite]) if opposite in raw else missing
+        # Statements leave the unused side blank or write 0 in it
+        other = ~(jumlah > 0) & (other_jumlah > 0)
+
+    if 'Kategori' in raw:
+        kategori = raw['Kategori'].str.strip()
+        kategori = kategori.mask(kategori == '', default_kategori)
+    else:
+        kategori = pd.Series(default_kategori, index=raw.index)
+    if registry is not None:
+        kategori = kategori.map({name: registry.canonical(name) for name in kategori.unique()})
+    keterangan = raw['Keterangan'].str.strip() if 'Keterangan' in raw else pd.Series('', index=raw.index)
+
+    reason = pd.Series(None, index=raw.index, dtype=object)
+    reason = reason.mask(jumlah.isna() | (jumlah <= 0), 'jumlah tidak valid')
+    reason = reason.mask(tanggal.isna(), 'tanggal tidak valid')
+    reason = reason.mask(other, None)
+    valid = reason.isna() & ~other
+    rejected = reason.notna()
+
+    rows = pd.DataFrame({
+        'Tanggal': tanggal[valid],
+        'Kategori': kategori[valid].astype(object),
+        'Jumlah': jumlah[valid].astype('int64'),
+        'Keterangan': keterangan[valid].astype(object),
+    })
+    if 'Unit' in raw:
+        # Units bought, for investment ledgers; kept next to the ledger, not in it
+        rows['Unit'] = parse_numbers(raw['Unit'][valid]).abs()
+    errors = pd.DataFrame({'Baris': raw.index[rejected] + 2, 'Alasan': reason[rejected].to_numpy()})
+    return rows, errors
+
+
+def row_hashes(df):
+    """64-bit hash of (Tanggal, Kategori, Jumlah, Keterangan) per row"""
+    keys = pd.DataFrame({
+        'Tanggal': df['Tanggal'].to_numpy().astype('datetime64[D]').astype('int64'),
+        'Kategori': df['Kategori'].astype(str).to_numpy(dtype=object),
+        'Jumlah': df['Jumlah'].to_numpy(dtype='int64'),
+        'Keterangan': df['Keterangan'].astype(str).to_numpy(dtype=object),
+    })
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+def new_rows_mask(hashes, existing):
+    """True for the rows not already present in existing (both arrays of row hashes)
+
+    Identical transactions are counted, so a file with the same purchase twice
+    adds a second copy to a ledger that has one, and re-importing a file adds
+    nothing.
+    """
+    if not len(hashes):
+        return np.ones(0, dtype=bool)
+    present = pd.Series(existing).value_counts()
+    occurrence = pd.Series(hashes).groupby(hashes).cumcount().to_numpy()
+    return occurrence >= pd.Series(hashes).map(present).fillna(0).to_numpy()
+
+
+def import_csv(source, filename, tipe=None, sep=',', chunk_rows=CHUNK_ROWS, dry_run=False,
+               default_kategori=DEFAULT_KATEGORI):
+    """Import transactions from a CSV path or file object into a ledger
+
+    Categories are matched against the ledger's registry (tipe, by default the
+    type whose file is filename, picks the defaults of a new one), and new
+    ones are registered. From a statement with Debet and Kredit columns only
+    tipe's side is imported (see STATEMENT_SIDES). With dry_run nothing is
+    written. Returns an ImportResult.
+    """
+    start = time.perf_counter()
+    result = ImportResult()
+    if tipe is None:
+        tipe = next((t for t, name in ledger.LEDGERS.items() if name == os.path.basename(filename)), None)
+    side = STATEMENT_SIDES.get(tipe, 'Debet')
+    registry = categories.get(filename, tipe)
+    current = ledger.load_data(filename)
+
+    chunks, errors, mapping = [], [], None
+    reader = pd.read_csv(source, sep=sep, dtype=str, keep_default_na=False, chunksize=chunk_rows,
+                         encoding='utf-8-sig', skipinitialspace=True)
+    for chunk in reader:
+        if mapping is None:
+            mapping = column_mapping(chunk.columns)
+        rows, rejected = normalize(chunk, mapping, registry, default_kategori, side)
+        result.read += len(chunk)
+        result.rejected += len(rejected)
+        result.skipped += len(chunk) - len(rows) - len(rejected)
+        chunks.append(rows)
+        if sum(map(len, errors)) < MAX_ERRORS:
+            errors.append(rejected)
+
+    if errors:
+        result.errors = pd.concat(errors, ignore_index=True).head(MAX_ERRORS)
+    batch = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=_HASH_COLUMNS)
+    if len(batch):
+        fresh = new_rows_mask(row_hashes(batch), row_hashes(current))
+        result.duplicates = int((~fresh).sum())
+        # Date order keeps month lookups on the ledger a plain slice
+        batch = batch[fresh].sort_values('Tanggal', kind='stable')
+        result.imported = len(batch)
+        if result.imported and not dry_run:
+            result.ids = ledger.append_rows(filename, batch)
+            if 'Unit' in batch:
+                portfolio.record_units(filename, dict(zip(result.ids, batch['Unit'])))
+            registry.extend(name for name in batch['Kategori'].unique() if name not in registry)
+
+    result.seconds = time.perf_counter() - start
+    return result
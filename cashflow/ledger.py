@@ -0,0 +1,146 @@
+"""Ledger API used by the app: load, save and delete through the active storage backend"""
+import os
+import threading
+
+from cashflow import trace
+from cashflow.storage import BACKENDS, COLUMNS, CsvBackend, concat_frames, empty_frame, new_id, typed_frame
+
+__all__ = [
+    'BACKENDS', 'COLUMNS', 'LEDGERS', 'concat_frames', 'empty_frame', 'new_id', 'typed_frame',
+    'get_backend', 'set_backend', 'init_csv', 'load_data', 'save_data', 'append_rows', 'delete_row', 'delete_rows',
+    'compact', 'months', 'load_month', 'export_csv', 'migrate', 'invalidate', 'cached_frame', 'cache_stats',
+]
+
+# Ledger file of each transaction type (Tipe)
+LEDGERS = {
+    'Pemasukan': 'pemasukan.csv',
+    'Pengeluaran': 'pengeluaran.csv',
+    'Investasi': 'investasi.csv',
+}
+
+# Backend shared by every Streamlit session in this process; chosen with the
+# CASHFLOW_STORAGE environment variable ('csv', 'feather' or 'sqlite')
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the active storage backend, creating it on first use"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = BACKENDS[os.environ.get('CASHFLOW_STORAGE', 'csv')]()
+        return _backend
+
+
+def set_backend(backend):
+    """Switch storage backend, by name or instance"""
+    global _backend
+    if isinstance(backend, str):
+        backend = BACKENDS[backend]()
+    with _backend_lock:
+        _backend = backend
+    return backend
+
+
+def init_csv(filename):
+    """Initialize the ledger storage if it doesn't exist"""
+    get_backend().init(filename)
+
+
+def load_data(filename):
+    """Load a typed ledger (datetime Tanggal, categorical Kategori, int64 Jumlah)
+
+    The returned frame is cached and shared between sessions, so it must be
+    treated as read-only; use ``.copy()`` before modifying it.
+    """
+    with trace.span('load_data', os.path.basename(filename)) as span:
+        backend = get_backend()
+        if not span:
+            return backend.load(filename)
+        previous = backend._cached_frame(filename)
+        frame = backend.load(filename)
+        span.rows = len(frame)
+        if frame is previous:
+            span.hits += 1
+        else:
+            span.misses += 1
+        return frame
+
+
+def months(filename):
+    """Months ('YYYY-MM') with transactions in a ledger, newest first"""
+    with trace.span('months', os.path.basename(filename)):
+        return get_backend().months(filename)
+
+
+def load_month(filename, month):
+    """Transactions of one 'YYYY-MM' month"""
+    with trace.span('load_month', os.path.basename(filename)) as span:
+        df = get_backend().load_month(filename, month)
+        span.rows = len(df)
+        return df
+
+
+def save_data(filename, data):
+    """Save one transaction and return its ID"""
+    with trace.span('save_data', os.path.basename(filename)) as span:
+        span.rows = 1
+        return get_backend().append(filename, [data])[0]
+
+
+def append_rows(filename, rows):
+    """Save many transactions (a DataFrame or list of dicts) in a single write and return their IDs"""
+    with trace.span('append_rows', os.path.basename(filename)) as span:
+        span.rows = len(rows)
+        return get_backend().append(filename, rows)
+
+
+def delete_row(filename, row_id):
+    """Delete a transaction by ID"""
+    delete_rows(filename, [row_id])
+
+
+def delete_rows(filename, ids):
+    """Delete several transactions by ID in a single write"""
+    with trace.span('delete_rows', os.path.basename(filename)) as span:
+        span.rows = len(ids)
+        get_backend().delete(filename, ids)
+
+
+def compact(filename):
+    """Rewrite a ledger without deleted rows"""
+    get_backend().compact(filename)
+
+
+def export_csv(filename, dest=None):
+    """Write a ledger as CSV to dest, or return the CSV bytes if dest is None"""
+    df = load_data(filename)
+    if dest is None:
+        return df.to_csv(index=False, date_format='%Y-%m-%d').encode('utf-8')
+    df.to_csv(dest, index=False, date_format='%Y-%m-%d')
+
+
+def migrate(filenames, backend):
+    """Copy CSV ledgers into another backend and make it the active one"""
+    source = CsvBackend()
+    target = set_backend(backend)
+    for filename in filenames:
+        target.init(filename, migrate=False)
+        target.write(filename, source.load(filename))
+    return target
+
+
+def invalidate(filename=None):
+    """Drop the cached frame for a ledger, or every ledger if no filename is given"""
+    get_backend().invalidate(filename)
+
+
+def cached_frame(filename):
+    """The ledger's cached frame, or None if it isn't loaded; never reads storage"""
+    return get_backend()._cached_frame(filename)
+
+
+def cache_stats():
+    """Return the active backend's cache counters"""
+    return get_backend().cache_stats()
@@ -0,0 +1,89 @@
+"""Thread-safe LRU cache bounded by the total size of its values"""
+import sys
+import threading
+from collections import OrderedDict
+
+from cashflow import trace
+
+
+class LRUCache:
+    """Mapping that evicts the least recently used entries once max_bytes is exceeded
+
+    Entry sizes come from sizeof(value) unless given explicitly; a single
+    value larger than max_bytes is returned to the caller but not kept.
+    on_evict(key, value), if given, is called for every entry pushed out
+    (outside the cache's lock, so it may use the cache).
+    """
+
+    def __init__(self, max_bytes, sizeof=sys.getsizeof, on_evict=None):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.on_evict = on_evict
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key, default=None):
+        """Value for key (marking it recently used), or default"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats['misses'] += 1
+            else:
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+        trace.note(hits=int(entry is not None), misses=int(entry is None))
+        return default if entry is None else entry[0]
+
+    def put(self, key, value, size=None):
+        """Store value under key, evicting old entries to stay within max_bytes"""
+        size = self.sizeof(value) if size is None else size
+        evicted = []
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            if size > self.max_bytes:
+                evicted.append((key, value))
+            else:
+                self._entries[key] = (value, size)
+                self.bytes += size
+            while self.bytes > self.max_bytes:
+                old_key, (old_value, old_size) = self._entries.popitem(last=False)
+                self.bytes -= old_size
+                evicted.append((old_key, old_value))
+            self.stats['evictions'] += len(evicted)
+        if self.on_evict is not None:
+            for old_key, old_value in evicted:
+                self.on_evict(old_key, old_value)
+
+    def get_or_build(self, key, build):
+        """Cached value for key, calling build() and caching its result on a miss"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = build()
+            self.put(key, value)
+        return value
+
+    def keys(self):
+        """Keys from least to most recently used"""
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def cache_stats(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self.bytes)
@@ -0,0 +1,427 @@
+"""Investment portfolio: units per purchase, a local price history and valuation
+
+The Investasi ledger records what was paid per instrument (Kategori). The
+number of units bought is kept per transaction ID in ``<ledger>.unit.csv``
+next to the ledger, so the ledger schema stays the same for every type and
+backend. Purchases without units are valued at the close of their purchase
+date, or at cost if there is no price for them.
+
+Daily closes are imported from CSV or Parquet (no network access) into a
+PriceStore: a dense days x instruments matrix of float64 closes, carried
+forward over days without a close, saved as ``harga.npy`` next to the ledgers
+and memory-mapped on load, so the price of any instrument on any date is one
+array lookup.
+
+Valuation builds days x instruments matrices of units, cost and value for
+every instrument at once; the time-weighted return chains the daily growth
+factors value / (previous value + purchases).
+"""
+import datetime
+import io
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from cashflow import categories, fileio, importer, ledger, trace
+
+UNIT_HEADER = b'ID,Unit\n'
+
+PRICE_FILE = 'harga.npy'
+
+# Lower-cased input column name -> price history column
+PRICE_ALIASES = {
+    'tanggal': 'Tanggal', 'tgl': 'Tanggal', 'date': 'Tanggal',
+    'instrumen': 'Instrumen', 'kategori': 'Instrumen', 'kode': 'Instrumen', 'ticker': 'Instrumen',
+    'symbol': 'Instrumen',
+    'harga': 'Harga', 'penutupan': 'Harga', 'close': 'Harga', 'price': 'Harga',
+}
+
+_units = {}
+_stores = {}
+_valuations = {}
+_lock = threading.Lock()
+
+
+def _key(name):
+    return str(name).strip().casefold()
+
+
+# Units per transaction
+
+def units_path(filename):
+    return os.path.splitext(filename)[0] + '.unit.csv'
+
+
+def units(filename):
+    """Series of units bought, indexed by transaction ID; later records win"""
+    path = units_path(filename)
+    signature = fileio.signature(path)
+    with _lock:
+        cached = _units.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+    if signature is None:
+        series = pd.Series(dtype='float64', name='Unit')
+    else:
+        with open(path, 'rb') as f:
+            data = f.read()
+        data = data[:data.rfind(b'\n') + 1]
+        df = pd.read_csv(io.BytesIO(data), dtype={'ID': object, 'Unit': 'float64'})
+        series = df.drop_duplicates('ID', keep='last').set_index('ID')['Unit']
+    with _lock:
+        _units[path] = (signature, series)
+    return series
+
+
+def record_units(filename, units_by_id):
+    """Record the units bought by transactions, {ID: units}; missing or non-positive units are skipped"""
+    rows = pd.DataFrame(list(units_by_id.items()), columns=['ID', 'Unit'])
+    rows = rows[rows['Unit'].notna() & (rows['Unit'] > 0)]
+    if rows.empty:
+        return
+    data = rows.to_csv(index=False, header=False).encode('utf-8')
+    path = units_path(filename)
+    with fileio.locked(path):
+        fileio.append(path, data, header=UNIT_HEADER)
+
+
+# Price history
+
+def read_prices(source, sep=','):
+    """Long frame of Tanggal, Instrumen and Harga from a CSV/Parquet path or file object
+
+    Either one row per close (Tanggal, Instrumen, Harga columns) or one column
+    per instrument next to Tanggal. Rows without a valid date or price are dropped.
+    """
+    name = str(getattr(source, 'name', source))
+    if name.endswith('.parquet'):
+        raw = pd.read_parquet(source).astype(str)
+    else:
+        raw = pd.read_csv(source, sep=sep, dtype=str, keep_default_na=False, encoding='utf-8-sig',
+                          skipinitialspace=True)
+    mapping = {}
+    for column in raw.columns:
+        target = PRICE_ALIASES.get(str(column).strip().lower())
+        if target and target not in mapping.values():
+            mapping[column] = target
+    raw = raw.rename(columns=mapping)
+    if 'Tanggal' not in raw:
+        raise ValueError(f"kolom Tanggal tidak ditemukan (ada: {', '.join(map(str, raw.columns))})")
+    if 'Instrumen' not in raw or 'Harga' not in raw:
+        # One column per instrument
+        raw = raw.melt(id_vars='Tanggal', var_name='Instrumen', value_name='Harga')
+    prices = pd.DataFrame({
+        'Tanggal': importer.parse_dates(raw['Tanggal'].astype(str)),
+        'Instrumen': raw['Instrumen'].astype(str).str.strip(),
+        'Harga': importer.parse_numbers(raw['Harga'].astype(str)),
+    })
+    valid = prices['Tanggal'].notna() & (prices['Harga'] > 0) & (prices['Instrumen'] != '')
+    return prices[valid].reset_index(drop=True)
+
+
+def _forward_fill(matrix):
+    """Carry the last non-NaN value of each column down over the NaN rows below it"""
+    rows = np.where(np.isnan(matrix), 0, np.arange(len(matrix))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return matrix[rows, np.arange(matrix.shape[1])]
+
+
+class PriceStore:
+    """Daily closes as a memory-mapped days x instruments matrix
+
+    Row d holds the closes of start + d days, carried forward over days
+    without a close; NaN before an instrument's first close. The header
+    (start date and instrument names) is in ``harga.json``, and which cells
+    are actual closes rather than carried forward in ``harga.mask.npy``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.header_path = os.path.splitext(path)[0] + '.json'
+        self.mask_path = os.path.splitext(path)[0] + '.mask.npy'
+        self._signature = None
+        self._state = (None, [], {}, np.empty((0, 0)))
+
+    def _load(self):
+        """(start, instruments, {name key: column}, matrix) of the latest saved prices"""
+        signature = fileio.signature(self.header_path)
+        if signature != self._signature:
+            if signature is None:
+                state = (None, [], {}, np.empty((0, 0)))
+            else:
+                with open(self.header_path, encoding='utf-8') as f:
+                    header = json.load(f)
+                matrix = np.load(self.path, mmap_mode='r')
+                names = header['instruments']
+                columns = {_key(name): i for i, name in enumerate(names)}
+                state = (np.datetime64(header['start'], 'D'), names, columns, matrix)
+            self._state, self._signature = state, signature
+        return self._state
+
+    @property
+    def instruments(self):
+        return list(self._load()[1])
+
+    def bounds(self):
+        """First and last date with prices, or None"""
+        start, _, _, matrix = self._load()
+        if start is None:
+            return None
+        return pd.Timestamp(start), pd.Timestamp(start + len(matrix) - 1)
+
+    def matrix(self, instruments, start, days):
+        """Closes of instruments (matched case-insensitively) for `days` days from start
+
+        Dates past the last close get the last close; unknown instruments and
+        dates before the first close are NaN.
+        """
+        first, _, columns, matrix = self._load()
+        result = np.full((days, len(instruments)), np.nan)
+        if first is None or not len(matrix):
+            return result
+        found = [(j, columns[_key(name)]) for j, name in enumerate(instruments) if _key(name) in columns]
+        if not found:
+            return result
+        rows = (np.datetime64(start, 'D') - first).astype('int64') + np.arange(days)
+        inside = rows >= 0
+        targets, sources = map(list, zip(*found))
+        picked = matrix[np.clip(rows[inside], 0, len(matrix) - 1)][:, sources]
+        trace.note(bytes=picked.nbytes)
+        result[np.ix_(np.flatnonzero(inside), targets)] = picked
+        return result
+
+    def price(self, instrument, day):
+        """Close of instrument on day (the last one before it), or None"""
+        first, _, columns, matrix = self._load()
+        column = columns.get(_key(instrument))
+        if column is None:
+            return None
+        row = (np.datetime64(pd.Timestamp(day), 'D') - first).astype('int64')
+        value = matrix[min(row, len(matrix) - 1), column] if row >= 0 else np.nan
+        return None if np.isnan(value) else float(value)
+
+    def _observed(self, matrix):
+        """Which cells of the saved matrix are actual closes
+
+        Stores written before the mask existed are read as having a close
+        wherever the price changes.
+        """
+        try:
+            observed = np.load(self.mask_path)
+        except FileNotFoundError:
+            observed = None
+        if observed is not None and observed.shape == matrix.shape:
+            return observed
+        previous = np.vstack([np.full((1, matrix.shape[1]), np.nan), matrix[:-1]])
+        return ~np.isnan(matrix) & ((matrix != previous) | np.isnan(previous))
+
+    def update(self, prices):
+        """Merge a long frame of closes (see read_prices) into the store
+
+        An imported instrument's prices replace the stored ones over the dates
+        the import covers; other dates and instruments are kept.
+        """
+        if prices.empty:
+            return
+        with fileio.locked(self.header_path):
+            self._signature = None
+            first, names, columns, old = self._load()
+            names, columns = list(names), dict(columns)
+            for name in prices['Instrumen'].unique():
+                if _key(name) not in columns:
+                    columns[_key(name)] = len(names)
+                    names.append(name)
+
+            days = prices['Tanggal'].to_numpy().astype('datetime64[D]')
+            start = days.min() if first is None else min(first, days.min())
+            end = days.max() if first is None else max(first + len(old) - 1, days.max())
+            matrix = np.full(((end - start).astype('int64') + 1, len(names)), np.nan)
+            if first is not None:
+                offset = (first - start).astype('int64')
+                matrix[offset:offset + len(old), :old.shape[1]] = old
+                # Carry the old closes into the rows added after them
+                matrix[:, :old.shape[1]] = _forward_fill(matrix[:, :old.shape[1]])
+
+            new = np.full_like(matrix, np.nan)
+            rows = (days - start).astype('int64')
+            cols = prices['Instrumen'].map(lambda name: columns[_key(name)]).to_numpy()
+            new[rows, cols] = prices['Harga'].to_numpy(dtype='float64')
+            observed = np.zeros(matrix.shape, dtype=bool)
+            if first is not None:
+                observed[offset:offset + len(old), :old.shape[1]] = self._observed(old)
+            for col in np.unique(cols):
+                covered = rows[cols == col]
+                lo, hi = covered.min(), covered.max() + 1
+                observed[lo:hi, col] = False
+                observed[covered, col] = True
+                # The import's last close is carried forward up to the next stored close after it
+                later = np.flatnonzero(observed[hi:, col])
+                stop = hi + later[0] if len(later) else len(matrix)
+                matrix[lo:stop, col] = _forward_fill(new[lo:stop, col:col + 1])[:, 0]
+
+            tmp, mask_tmp = self.path + '.tmp', self.mask_path + '.tmp'
+            with open(tmp, 'wb') as f:
+                np.save(f, matrix)
+            with open(mask_tmp, 'wb') as f:
+                np.save(f, observed)
+            header = {'start': str(start), 'instruments': names}
+            fileio.replace(self.header_path, json.dumps(header, ensure_ascii=False).encode('utf-8'),
+                           renames=[(tmp, self.path), (mask_tmp, self.mask_path)])
+            self._signature = None
+
+
+def price_store(filename):
+    """PriceStore shared by the ledgers in filename's directory"""
+    path = os.path.join(os.path.dirname(os.path.abspath(filename)), PRICE_FILE)
+    with _lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = PriceStore(path)
+        return store
+
+
+# Valuation
+
+class Valuation:
+    """Units, cost, value and growth of each instrument on every day from the first purchase
+
+    All arrays are days x instruments; row d is the end of day start + d.
+    """
+
+    def __init__(self, lots, store, end=None):
+        self.instruments = sorted(lots['Kategori'].unique()) if len(lots) else []
+        if not len(lots):
+            self.days = pd.DatetimeIndex([])
+            self.units = self.cost = self.value = self.price = np.zeros((0, 0))
+            self.flows = self.growth = np.zeros((0, 0))
+            return
+        first = lots['Tanggal'].min().normalize()
+        last = max(lots['Tanggal'].max().normalize(), pd.Timestamp(end or datetime.date.today()))
+        self.days = pd.date_range(first, last, freq='D')
+        shape = (len(self.days), len(self.instruments))
+
+        day = ((lots['Tanggal'] - first).dt.days).to_numpy()
+        inst = pd.Categorical(lots['Kategori'], categories=self.instruments).codes
+        amount = lots['Jumlah'].to_numpy(dtype='float64')
+        closes = store.matrix(self.instruments, first, shape[0])
+
+        # Units not recorded are bought at the close of the purchase date
+        bought = lots['Unit'].to_numpy(dtype='float64')
+        bought = np.where(np.isnan(bought), amount / closes[day, inst], bought)
+        priced = ~np.isnan(bought) & (bought > 0)
+
+        self.flows = np.zeros(shape)
+        np.add.at(self.flows, (day, inst), amount)
+        self.cost = np.cumsum(self.flows, axis=0)
+
+        units = np.zeros(shape)
+        np.add.at(units, (day[priced], inst[priced]), bought[priced])
+        self.units = np.cumsum(units, axis=0)
+
+        # Before an instrument's first close, its latest purchase price stands in
+        paid = np.full(shape, np.nan)
+        paid[day[priced], inst[priced]] = amount[priced] / bought[priced]
+        self.price = np.where(np.isnan(closes), _forward_fill(paid), closes)
+
+        # Purchases that can't be priced are held at cost
+        unpriced = np.zeros(shape)
+        np.add.at(unpriced, (day[~priced], inst[~priced]), amount[~priced])
+        held = np.where(self.units > 0, self.units * np.nan_to_num(self.price), 0.0)
+        self.value = held + np.cumsum(unpriced, axis=0)
+
+        self.growth = _growth(self.value, self.flows)
+
+    def positions(self):
+        """Frame per instrument as of the last day: Instrumen, Unit, Harga, Modal, Nilai, Laba, Return, TWR
+
+        Return is Laba over Modal and TWR the time-weighted return since the
+        first purchase, both in percent.
+        """
+        columns = ['Instrumen', 'Unit', 'Harga', 'Modal', 'Nilai', 'Laba', 'Return', 'TWR']
+        if not len(self.days):
+            return pd.DataFrame(columns=columns)
+        df = pd.DataFrame({
+            'Instrumen': self.instruments,
+            'Unit': self.units[-1],
+            'Harga': self.price[-1],
+            'Modal': self.cost[-1],
+            'Nilai': self.value[-1],
+        }, columns=columns)
+        df['Laba'] = df['Nilai'] - df['Modal']
+        df['Return'] = df['Laba'] / df['Modal'].where(df['Modal'] > 0) * 100
+        df['TWR'] = (np.prod(self.growth, axis=0) - 1) * 100
+        return df.sort_values('Nilai', ascending=False, ignore_index=True)
+
+    def history(self):
+        """Frame of Tanggal, Modal and Nilai of the whole portfolio per day"""
+        return pd.DataFrame({
+            'Tanggal': self.days,
+            'Modal': self.cost.sum(axis=1),
+            'Nilai': self.value.sum(axis=1),
+        }, columns=['Tanggal', 'Modal', 'Nilai'])
+
+    def twr(self, start=None, end=None):
+        """Time-weighted return of the whole portfolio from start to end (dates, inclusive), in percent"""
+        if not len(self.days):
+            return 0.0
+        growth = _growth(self.value.sum(axis=1), self.flows.sum(axis=1))
+        lo = 0 if start is None else self.days.searchsorted(pd.Timestamp(start))
+        hi = len(self.days) if end is None else self.days.searchsorted(pd.Timestamp(end), side='right')
+        return float((np.prod(growth[lo:hi]) - 1) * 100)
+
+
+def _growth(value, flows):
+    """Daily growth factors value / (previous value + purchases), 1 where nothing was held"""
+    previous = np.concatenate([np.zeros_like(value[:1]), value[:-1]])
+    base = previous + flows
+    return np.divide(value, base, out=np.ones_like(value), where=base > 0)
+
+
+def lots(filename):
+    """Purchases of an investment ledger: Tanggal, Kategori (current names), Jumlah and Unit"""
+    df = ledger.load_data(filename)
+    kategori = categories.get(filename).remap(df['Kategori']) if len(df) else df['Kategori']
+    return pd.DataFrame({
+        'Tanggal': df['Tanggal'],
+        'Kategori': kategori.astype(str),
+        'Jumlah': df['Jumlah'],
+        'Unit': df['ID'].map(units(filename)).astype('float64'),
+    })
+
+
+def get(filename, end=None):
+    """Valuation of an investment ledger, rebuilt only when its rows, units or prices change"""
+    end = end or datetime.date.today()
+    frame = ledger.load_data(filename)
+    store = price_store(filename)
+    state = (
+        fileio.signature(units_path(filename)), fileio.signature(store.header_path),
+        categories.get(filename).version, end,
+    )
+    key = os.path.abspath(filename)
+    with _lock:
+        cached = _valuations.get(key)
+        if cached is not None and cached[0] is frame and cached[1] == state:
+            trace.note(hits=1)
+            return cached[2]
+    with trace.span('valuation', os.path.basename(filename)) as span:
+        valuation = Valuation(lots(filename), store, end)
+        span.rows = len(frame)
+        span.misses = 1
+    with _lock:
+        _valuations[key] = (frame, state, valuation)
+    return valuation
+
+
+def invalidate(filename=None):
+    """Drop cached units and valuations of a ledger, or of every ledger"""
+    with _lock:
+        if filename is None:
+            _units.clear()
+            _valuations.clear()
+        else:
+            _units.pop(units_path(filename), None)
+            _valuations.pop(os.path.abspath(filename), None)
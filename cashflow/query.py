@@ -0,0 +1,135 @@
+"""Filtering, sorting and paging of ledger frames for the history views"""
+import threading
+import weakref
+
+import numpy as np
+import pandas as pd
+
+from cashflow import trace
+
+_month_indexes = {}
+_month_lock = threading.Lock()
+
+
+def month_codes(tanggal):
+    """Integer month keys (months since 1970-01) of a datetime Series"""
+    return tanggal.to_numpy().astype('datetime64[M]').astype('int64')
+
+
+def month_code(month):
+    """Integer month key of a 'YYYY-MM' string"""
+    return int(np.datetime64(month, 'M').astype('int64'))
+
+
+def month_label(code):
+    """'YYYY-MM' string of an integer month key"""
+    return str(np.datetime64(int(code), 'M'))
+
+
+class MonthIndex:
+    """Month keys of a ledger frame in date order, for searchsorted month slices
+
+    Ledgers are mostly appended in date order, in which case no sort is
+    needed and a month is a contiguous slice of the frame itself.
+    """
+
+    def __init__(self, df):
+        codes = month_codes(df['Tanggal'])
+        if len(codes) and (np.diff(codes) < 0).any():
+            self.order = np.argsort(codes, kind='stable')
+            codes = codes[self.order]
+        else:
+            self.order = None
+        self.codes = codes
+
+    def months(self):
+        """Months ('YYYY-MM') present, newest first"""
+        if not len(self.codes):
+            return []
+        starts = np.flatnonzero(np.diff(self.codes, prepend=self.codes[0] - 1))
+        return [month_label(code) for code in self.codes[starts][::-1]]
+
+    def bounds(self, month):
+        """Start and end positions of a 'YYYY-MM' month in the sorted keys"""
+        code = month_code(month)
+        return (
+            int(np.searchsorted(self.codes, code, side='left')),
+            int(np.searchsorted(self.codes, code, side='right')),
+        )
+
+    def slice(self, df, month):
+        """Rows of df (the frame this index was built from) in a 'YYYY-MM' month"""
+        start, end = self.bounds(month)
+        if self.order is None:
+            return df.iloc[start:end]
+        return df.iloc[np.sort(self.order[start:end])]
+
+
+def month_index(df):
+    """MonthIndex of a frame, built once per frame object
+
+    Cached frames are shared and never modified in place, so the index stays
+    valid for as long as the frame is alive.
+    """
+    key = id(df)
+    with _month_lock:
+        cached = _month_indexes.get(key)
+        if cached is not None and cached[0]() is df:
+            trace.note(hits=1)
+            return cached[1]
+    with trace.span('month_index') as span:
+        index = MonthIndex(df)
+        span.rows = len(df)
+        span.misses = 1
+    with _month_lock:
+        _month_indexes[key] = (weakref.ref(df, _forget_month_index), index)
+    return index
+
+
+def _forget_month_index(ref):
+    for key, (cached, _) in list(_month_indexes.items()):
+        if cached is ref:
+            _month_indexes.pop(key, None)
+
+
+def month_slice(df, month):
+    """Transactions of df in a 'YYYY-MM' month"""
+    with trace.span('month_filter') as span:
+        rows = month_index(df).slice(df, month)
+        span.rows = len(rows)
+        return rows
+
+
+def filter_ledger(df, start=None, end=None, kategori=None):
+    """Rows dated from start to end (inclusive) whose Kategori is in kategori
+
+    Any criterion left as None (or an empty kategori list) is not applied.
+    """
+    with trace.span('filter_ledger') as span:
+        span.rows = len(df)
+        mask = pd.Series(True, index=df.index)
+        if start is not None:
+            mask &= df['Tanggal'] >= pd.Timestamp(start)
+        if end is not None:
+            mask &= df['Tanggal'] < pd.Timestamp(end) + pd.Timedelta(days=1)
+        if kategori:
+            mask &= df['Kategori'].isin(kategori)
+        return df if mask.all() else df[mask]
+
+
+def page_count(total, page_size):
+    """Number of pages needed for total rows (at least one)"""
+    return max(1, -(-total // page_size))
+
+
+def page(df, page_number, page_size, sort_by='Tanggal', ascending=False):
+    """Rows of 1-based page_number after sorting df by sort_by
+
+    Only the rows up to the end of the requested page are selected (with
+    nsmallest/nlargest), so early pages don't pay for a full sort.
+    """
+    with trace.span('page') as span:
+        span.rows = len(df)
+        n = page_number * page_size
+        top = df.nsmallest(n, sort_by) if ascending else df.nlargest(n, sort_by)
+        return top.iloc[n - page_size:]
@@ -0,0 +1,285 @@
+"""Recurring transactions (salary, electricity, phone credit, ...) written into the ledgers when due
+
+The rules of a folder of ledgers are in ``rutin.json`` next to them, shared by
+every session. A rule repeats every `interval` months, weeks or days from its
+start date, optionally until an end date. Monthly rules keep the day of the
+start date, moved to the last day of shorter months.
+
+materialize() writes the occurrences due up to a day (default today): they are
+computed with numpy over the whole rule table at once, and each ledger gets
+its new rows in a single append. Every occurrence has a fixed ID (uuid5 of the
+rule ID and the date) and every rule counts the occurrences it has written, so
+running it again, from any session or process, never writes a row twice, and
+occurrences deleted from the ledger stay deleted.
+"""
+import datetime
+import hashlib
+import os
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from cashflow import fileio, ledger, trace
+from cashflow.storage import COLUMNS
+
+FREQUENCIES = ('monthly', 'weekly', 'daily')
+
+FILENAME = 'rutin.json'
+
+# Occurrence IDs are uuid5(_NAMESPACE, '<rule ID>/<YYYY-MM-DD>')
+_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, 'cashflow:rutin')
+
+# End date of rules without one
+_FOREVER = np.datetime64('2262-04-11', 'D')
+
+_DAYS = {'monthly': 0, 'weekly': 7, 'daily': 1}
+
+_rules = {}
+_lock = threading.Lock()
+
+
+def _date(value):
+    return pd.Timestamp(value).date().isoformat()
+
+
+def occurrence_id(rule_id, day):
+    """Transaction ID of a rule's occurrence on a day"""
+    return uuid.uuid5(_NAMESPACE, f'{rule_id}/{_date(day)}').hex
+
+
+def _occurrence_ids(rule_ids, days):
+    """occurrence_id() of many occurrences (days as 'YYYY-MM-DD'), setting the uuid5 bits in bulk"""
+    prefix = hashlib.sha1(_NAMESPACE.bytes)
+    digests = bytearray()
+    for rule_id, day in zip(rule_ids, days):
+        digest = prefix.copy()
+        digest.update(f'{rule_id}/{day}'.encode('utf-8'))
+        digests += digest.digest()[:16]
+    raw = np.frombuffer(digests, dtype=np.uint8).reshape(-1, 16).copy()
+    raw[:, 6] = raw[:, 6] & 0x0F | 0x50
+    raw[:, 8] = raw[:, 8] & 0x3F | 0x80
+    text = raw.tobytes().hex()
+    return [text[i:i + 32] for i in range(0, len(text), 32)]
+
+
+class Rules(fileio.JsonStore):
+    """The recurring rules of one folder of ledgers, persisted as JSON
+
+    Each rule is a dict with id, tipe, kategori, jumlah, keterangan,
+    frequency, interval, start, end (or None), active and done, the number of
+    occurrences already written.
+    """
+
+    def __init__(self, path):
+        super().__init__(path, {'rules': []})
+        self.refresh()
+
+    def _set_state(self, state):
+        self._rules = [dict(rule) for rule in state['rules']]
+        self._index()
+
+    def _state(self):
+        return {'rules': [dict(rule) for rule in self._rules]}
+
+    def _index(self):
+        """Columns of the rule table as arrays, for evaluating every rule at once"""
+        rules = self._rules
+        self._ids = [rule['id'] for rule in rules]
+        self._positions = {rule_id: i for i, rule_id in enumerate(self._ids)}
+        self._ids_array = np.array(self._ids, dtype=object)
+        self._tipes = np.array([rule['tipe'] for rule in rules], dtype=object)
+        self._kategori = np.array([rule['kategori'] for rule in rules], dtype=object)
+        self._jumlah = np.array([rule['jumlah'] for rule in rules], dtype=np.int64)
+        self._keterangan = np.array([rule['keterangan'] for rule in rules], dtype=object)
+        self._start = np.array([rule['start'] for rule in rules], dtype='datetime64[D]')
+        self._end = np.array([rule['end'] or _FOREVER for rule in rules], dtype='datetime64[D]')
+        self._interval = np.array([rule['interval'] for rule in rules], dtype=np.int64)
+        # Length of a step in days; 0 for monthly rules, which step in months
+        self._step = np.array([_DAYS[rule['frequency']] for rule in rules], dtype=np.int64) * self._interval
+        self._month = self._start.astype('datetime64[M]').astype(np.int64)
+        self._day = (self._start - self._start.astype('datetime64[M]').astype('datetime64[D]')).astype(np.int64) + 1
+        self._done = np.array([rule['done'] for rule in rules], dtype=np.int64)
+        self._active = np.array([rule['active'] for rule in rules], dtype=bool)
+        upcoming = self._dates(np.arange(len(rules)), self._done)
+        self._next = np.where(self._active & (upcoming <= self._end), upcoming, np.datetime64('NaT'))
+        upcoming = self._next[~np.isnat(self._next)]
+        # Nothing is due before this day, so most calls of materialize() stop here
+        self._first_due = upcoming.min() if len(upcoming) else None
+
+    def __len__(self):
+        return len(self._rules)
+
+    def _dates(self, rules, k):
+        """Date of occurrence k (0 = the start date) of each rule index in rules"""
+        dates = self._start[rules] + k * self._step[rules]
+        monthly = self._step[rules] == 0
+        if monthly.any():
+            month = self._month[rules][monthly] + k[monthly] * self._interval[rules][monthly]
+            first = month.astype('datetime64[M]').astype('datetime64[D]')
+            length = ((month + 1).astype('datetime64[M]').astype('datetime64[D]') - first).astype(np.int64)
+            dates[monthly] = first + np.minimum(self._day[rules][monthly], length) - 1
+        return dates
+
+    def _counts(self, until):
+        """Number of occurrences of each rule on or before until (and its end date)"""
+        limit = np.minimum(self._end, np.datetime64(until, 'D'))
+        rules = np.arange(len(self._rules))
+        counts = np.zeros(len(rules), dtype=np.int64)
+        daily = self._step > 0
+        days = (limit[daily] - self._start[daily]).astype(np.int64)
+        counts[daily] = np.where(days >= 0, days // self._step[daily] + 1, 0)
+        monthly = rules[~daily]
+        months = limit[monthly].astype('datetime64[M]').astype(np.int64) - self._month[monthly]
+        last = months // self._interval[monthly]
+        last -= self._dates(monthly, last) > limit[monthly]
+        counts[monthly] = np.maximum(last + 1, 0)
+        return counts
+
+    def due(self, until=None):
+        """Occurrences not written yet, up to until (default today): Tipe plus the ledger columns"""
+        until = until or datetime.date.today()
+        counts = self._counts(until)
+        new = np.where(self._active, np.maximum(counts - self._done, 0), 0)
+        rules = np.repeat(np.arange(len(self._rules)), new)
+        offsets = np.repeat(np.cumsum(new) - new, new)
+        k = self._done[rules] + np.arange(len(rules)) - offsets
+        dates = self._dates(rules, k)
+        ids = self._ids_array[rules]
+        return pd.DataFrame({
+            'Tipe': self._tipes[rules],
+            'Tanggal': pd.to_datetime(dates),
+            'Kategori': self._kategori[rules],
+            'Jumlah': self._jumlah[rules],
+            'Keterangan': self._keterangan[rules],
+            'ID': _occurrence_ids(ids, np.datetime_as_string(dates, unit='D')),
+            'Rutin': ids,
+        })
+
+    def pending(self, until=None):
+        """Whether any active rule has an occurrence to write on or before until (default today)"""
+        self.refresh()
+        until = np.datetime64(until or datetime.date.today(), 'D')
+        return self._first_due is not None and self._first_due <= until
+
+    def materialize(self, ledgers, until=None):
+        """Write the occurrences due up to until (default today) into ledgers {tipe: filename}
+
+        Each ledger gets a single append. Occurrences whose ID is already in
+        the ledger (written by a run that stopped before saving the rules)
+        are skipped. Returns {tipe: rows written}.
+        """
+        if not self.pending(until):
+            return {}
+
+        def change():
+            due = self.due(until)
+            due = due[due['Tipe'].isin(list(ledgers))]
+            written = {}
+            for tipe, rows in due.groupby('Tipe', sort=False):
+                rows = rows[~rows['ID'].isin(ledger.load_data(ledgers[tipe])['ID'])]
+                if len(rows):
+                    ledger.append_rows(ledgers[tipe], rows[COLUMNS])
+                written[tipe] = len(rows)
+            for rule_id, occurrences in due['Rutin'].value_counts().items():
+                self._rules[self._positions[rule_id]]['done'] += int(occurrences)
+            return written
+
+        with trace.span('recurring', os.path.basename(os.path.dirname(os.path.abspath(self.path)))) as span:
+            written = self._change(change)
+            span.rows = sum(written.values())
+            return written
+
+    def add(self, tipe, kategori, jumlah, start, frequency='monthly', interval=1, end=None, keterangan=''):
+        """Add a rule and return its ID; nothing is written to the ledger until materialize()"""
+        if tipe not in ledger.LEDGERS:
+            raise ValueError(f'Tipe tidak dikenal: {tipe!r}')
+        if frequency not in FREQUENCIES:
+            raise ValueError(f'Frekuensi tidak dikenal: {frequency!r}')
+        kategori = str(kategori).strip()
+        if not kategori:
+            raise ValueError('Kategori tidak boleh kosong')
+        if int(jumlah) <= 0:
+            raise ValueError('Jumlah harus lebih dari 0')
+        if int(interval) < 1:
+            raise ValueError('Interval minimal 1')
+        start = _date(start)
+        end = _date(end) if end is not None else None
+        if end is not None and end < start:
+            raise ValueError('Tanggal selesai tidak boleh sebelum tanggal mulai')
+        rule = {
+            'id': uuid.uuid4().hex, 'tipe': tipe, 'kategori': kategori, 'jumlah': int(jumlah),
+            'keterangan': str(keterangan or ''), 'frequency': frequency, 'interval': int(interval),
+            'start': start, 'end': end, 'active': True, 'done': 0,
+        }
+        self._change(lambda: self._rules.append(rule))
+        return rule['id']
+
+    def _rule(self, rule_id):
+        for rule in self._rules:
+            if rule['id'] == rule_id:
+                return rule
+        raise ValueError(f'Transaksi rutin {rule_id!r} tidak ada')
+
+    def remove(self, rule_id):
+        """Delete a rule; the rows it already wrote stay in the ledger"""
+        self._change(lambda: self._rules.remove(self._rule(rule_id)))
+
+    def set_active(self, rule_id, active):
+        """Pause or resume a rule; a resumed rule skips the occurrences it missed before today"""
+        def change():
+            rule = self._rule(rule_id)
+            if active and not rule['active']:
+                yesterday = datetime.date.today() - datetime.timedelta(days=1)
+                rule['done'] = max(rule['done'], int(self._counts(yesterday)[self._positions[rule_id]]))
+            rule['active'] = bool(active)
+        self._change(change)
+
+    def frame(self, tipe=None):
+        """The rules as a frame (ID, Tipe, Kategori, Jumlah, Keterangan, Frekuensi, Interval, Mulai,
+        Sampai, Aktif, Berikutnya), optionally of one type only"""
+        df = pd.DataFrame({
+            'ID': self._ids,
+            'Tipe': self._tipes,
+            'Kategori': self._kategori,
+            'Jumlah': self._jumlah,
+            'Keterangan': self._keterangan,
+            'Frekuensi': [rule['frequency'] for rule in self._rules],
+            'Interval': self._interval,
+            'Mulai': pd.to_datetime(self._start),
+            'Sampai': pd.to_datetime([rule['end'] for rule in self._rules]),
+            'Aktif': self._active,
+            'Berikutnya': pd.to_datetime(self._next),
+        })
+        return df if tipe is None else df[df['Tipe'] == tipe].reset_index(drop=True)
+
+
+def rules_path(ledgers):
+    """File of the rules for a folder of ledgers {tipe: filename}"""
+    return os.path.join(os.path.dirname(next(iter(ledgers.values()))), FILENAME)
+
+
+def get(ledgers):
+    """Recurring rules of a folder of ledgers, shared by every session and reloaded when their file changes"""
+    key = os.path.abspath(rules_path(ledgers))
+    with _lock:
+        rules = _rules.get(key)
+        if rules is None:
+            rules = _rules[key] = Rules(key)
+    rules.refresh()
+    return rules
+
+
+def materialize(ledgers, until=None):
+    """Write the recurring transactions due up to until (default today); returns {tipe: rows written}"""
+    return get(ledgers).materialize(ledgers, until)
+
+
+def invalidate(ledgers=None):
+    """Forget the loaded rules of a folder of ledgers (or of every folder)"""
+    with _lock:
+        if ledgers is None:
+            _rules.clear()
+        else:
+            _rules.pop(os.path.abspath(rules_path(ledgers)), None)
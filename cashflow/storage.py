@@ -0,0 +1,1270 @@
+"""Storage backends for the ledger files"""
+import contextlib
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from cashflow import fileio, trace
+from cashflow.query import month_index, month_slice
+
+COLUMNS = ['Tanggal', 'Kategori', 'Jumlah', 'Keterangan', 'ID']
+
+HEADER = (','.join(COLUMNS) + '\n').encode('utf-8')
+
+# Bytes kept from just before the parsed offset to detect rewritten files
+FINGERPRINT_SIZE = 64
+
+# File name of one month of a partitioned ledger
+_PARTITION = re.compile(r'(\d{4}-\d{2})\.csv')
+
+
+def new_id():
+    """Unique, persistent transaction ID"""
+    return uuid.uuid4().hex
+
+
+def empty_frame():
+    """Empty ledger with the typed columns"""
+    return typed_frame(pd.DataFrame(columns=COLUMNS))
+
+
+def typed_frame(df):
+    """Cast raw ledger columns to datetime Tanggal, categorical Kategori and int64 Jumlah"""
+    df = df.reindex(columns=COLUMNS)
+    with trace.span('to_datetime') as span:
+        span.rows = len(df)
+        df['Tanggal'] = pd.to_datetime(df['Tanggal'])
+    df['Kategori'] = df['Kategori'].astype('category')
+    df['Jumlah'] = df['Jumlah'].astype('int64')
+    df['Keterangan'] = df['Keterangan'].fillna('').astype(object)
+    df['ID'] = df['ID'].astype(object)
+    return df
+
+
+def with_ids(df):
+    """Fill in missing transaction IDs (rows from ledgers written before IDs existed)"""
+    missing = df['ID'].isna().to_numpy()
+    if missing.any():
+        ids = df['ID'].to_numpy(dtype=object, copy=True)
+        ids[missing] = [new_id() for _ in range(int(missing.sum()))]
+        df = df.assign(ID=ids)
+    return df
+
+
+def concat_frames(df, tail, ignore_index=True):
+    """Concatenate two typed frames, keeping Kategori categorical"""
+    if df.empty:
+        return tail
+    if tail.empty:
+        return df
+    kategori = union_categoricals([df['Kategori'], tail['Kategori']], ignore_order=True)
+    merged = pd.concat([df, tail], ignore_index=ignore_index)
+    merged['Kategori'] = kategori
+    return merged
+
+
+def date_sorted(df):
+    """df in Tanggal order (stable), or df itself if it already is"""
+    if df['Tanggal'].is_monotonic_increasing:
+        return df
+    return df.sort_values('Tanggal', kind='stable', ignore_index=True)
+
+
+def drop_ids(df, ids):
+    """Rows of df whose ID is not in ids"""
+    if not ids or df.empty:
+        return df
+    return df[~df['ID'].isin(ids)]
+
+
+def month_bounds(month):
+    """First day of a 'YYYY-MM' month and of the month after it, as ISO strings"""
+    start = pd.Period(month, freq='M')
+    return start.start_time.strftime('%Y-%m-%d'), (start + 1).start_time.strftime('%Y-%m-%d')
+
+
+def _parse(data, header=True):
+    """Parse CSV bytes into a typed ledger frame and the set of tombstoned IDs
+
+    A tombstone is a row with only the ID filled in; it deletes the earlier
+    row with that ID.
+    """
+    with trace.span('parse_csv') as span:
+        df = pd.read_csv(
+            io.BytesIO(data),
+            header=0 if header else None,
+            names=None if header else COLUMNS,
+            dtype={'Kategori': 'category', 'Keterangan': object, 'ID': object},
+        )
+        span.rows = len(df)
+    df = df.reindex(columns=COLUMNS)
+    dead = df['Tanggal'].isna()
+    if not dead.any():
+        return typed_frame(df), set()
+    return typed_frame(df[~dead]), set(df.loc[dead, 'ID'].dropna())
+
+
+def _complete(data):
+    """Length of the prefix of data that ends on a full line"""
+    return data.rfind(b'\n') + 1
+
+
+def _to_csv(df, header=True):
+    """CSV bytes of a ledger frame, as stored in the ledger files"""
+    return df.reindex(columns=COLUMNS).to_csv(index=False, header=header, date_format='%Y-%m-%d').encode('utf-8')
+
+
+class _Entry:
+    __slots__ = ('signature', 'frame', 'offset', 'fingerprint', 'tombstones')
+
+    def __init__(self, signature, frame, offset, fingerprint, tombstones):
+        self.signature = signature
+        self.frame = frame
+        self.offset = offset
+        self.fingerprint = fingerprint
+        self.tombstones = tombstones
+
+
+class Backend:
+    """Shared cache bookkeeping, change events, background compaction and default month queries"""
+
+    def __init__(self):
+        self._cache = {}
+        self._lock = threading.Lock()
+        # Serializes cache misses so every change is read, and announced, once
+        self._load_lock = threading.RLock()
+        self._write_lock = threading.RLock()
+        # One compaction at a time; it doesn't block saves or loads until its final swap
+        self._compact_lock = threading.Lock()
+        self._compacting = set()
+        self._listeners = []
+        self.stats = {'hits': 0, 'misses': 0, 'compactions': 0}
+
+    def subscribe(self, listener):
+        """Call listener(filename, previous, frame, added, removed) when a cached ledger changes
+
+        added and removed hold the rows appended and deleted between the
+        previous and the new cached frame. Both are None when the ledger was
+        reloaded or rewritten from scratch; frame may then be None as well,
+        meaning the new state is only known after the next load.
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def _notify(self, filename, previous, frame, added=None, removed=None):
+        for listener in list(self._listeners):
+            listener(filename, previous, frame, added, removed)
+
+    def _cached_frame(self, filename):
+        with self._lock:
+            entry = self._cache.get(os.path.abspath(filename))
+        if entry is None:
+            return None
+        return entry.frame if isinstance(entry, _Entry) else entry['frame']
+
+    def write(self, filename, df):
+        """Replace the whole ledger with df"""
+        with self._write_lock, self._load_lock:
+            previous = self._cached_frame(filename)
+            frame = self._write(filename, df)
+            self._notify(filename, previous, frame)
+
+    def months(self, filename):
+        """Months ('YYYY-MM') that have transactions, newest first"""
+        return month_index(self.load(filename)).months()
+
+    def load_month(self, filename, month):
+        """Transactions of one 'YYYY-MM' month"""
+        return month_slice(self.load(filename), month)
+
+    def compact(self, filename):
+        """Rewrite a ledger without its tombstones, in date order
+
+        The new file is written while saves and loads carry on; only the swap
+        holds the load lock. If the rows were out of date order, the sorted
+        frame is announced as a change with no rows added or removed;
+        otherwise the cache keeps the same frame object and no change event
+        is sent, unless other sessions appended or deleted rows meanwhile.
+        """
+        with self._compact_lock:
+            self._compact(filename)
+        with self._lock:
+            self.stats['compactions'] += 1
+
+    def needs_compact(self, filename):
+        """True if compact() would change the cached ledger (tombstones, a delta, rows out of date order)"""
+        return False
+
+    def _schedule_compact(self, filename):
+        """Run compact() in a background thread unless one is already running for filename"""
+        key = os.path.abspath(filename)
+        with self._lock:
+            if key in self._compacting:
+                return
+            self._compacting.add(key)
+
+        def run():
+            try:
+                self.compact(filename)
+            finally:
+                with self._lock:
+                    self._compacting.discard(key)
+
+        threading.Thread(target=run, name=f'compact-{os.path.basename(filename)}', daemon=True).start()
+
+    def invalidate(self, filename=None):
+        """Drop the cached frame for a ledger, or every ledger if no filename is given"""
+        with self._lock:
+            if filename is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(os.path.abspath(filename), None)
+
+    def cache_stats(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._cache))
+
+
+class CsvBackend(Backend):
+    """Plain CSV ledgers, parsed incrementally as rows are appended
+
+    Parsed frames are cached per absolute path and validated against the
+    file's mtime and size. Each entry remembers how many bytes were parsed so
+    appends can be read from that offset instead of from the start of the file.
+    Deletes append tombstone rows; once a file holds ``compact_tombstones`` of
+    them it is rewritten without them in a background thread.
+
+    Writes hold the file's lock (see cashflow.fileio): appends go through its
+    journal and rewrites replace the file atomically, so sessions in other
+    processes can share the ledger. Readers don't lock; a row still being
+    appended is simply not read yet.
+    """
+
+    name = 'csv'
+
+    def __init__(self, compact_tombstones=200):
+        super().__init__()
+        self.compact_tombstones = compact_tombstones
+        self.stats['tail_reads'] = 0
+
+    def path(self, filename):
+        return filename
+
+    def init(self, filename, migrate=True):
+        """Initialize CSV file if it doesn't exist, adding IDs to older ledgers
+
+        The app calls this on every rerun: a ledger that is already set up is
+        only looked at, and the lock is taken just to create or migrate it.
+        """
+        if not self._needs_init(filename):
+            return
+        # In write()'s lock order, then the file's lock
+        with self._write_lock, self._load_lock, fileio.locked(filename):
+            if not os.path.exists(filename):
+                fileio.atomic_write(filename, HEADER)
+                return
+            if self._needs_init(filename):
+                self.write(filename, self.load(filename))
+
+    @staticmethod
+    def _needs_init(filename):
+        """True if the file is missing, or is an older ledger without the ID column"""
+        try:
+            with open(filename, encoding='utf-8') as f:
+                header = f.readline().strip().split(',')
+        except FileNotFoundError:
+            return True
+        return header != [''] and 'ID' not in header
+
+    def load(self, filename):
+        """Load a typed ledger, parsing the CSV only when the file has changed
+
+        Rows appended since the last load are parsed from the remembered byte
+        offset and merged into the cached frame; a file that shrank or was
+        rewritten is parsed again from the start.
+        """
+        return self._load_entry(filename).frame
+
+    def tombstones(self, filename):
+        """IDs deleted by tombstone rows in the file"""
+        return self._load_entry(filename).tombstones
+
+    def _load_entry(self, filename):
+        key = os.path.abspath(filename)
+        signature = fileio.signature(filename)
+        if signature is None or signature[1] == 0:
+            return _Entry(signature, empty_frame(), 0, b'', set())
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry.signature == signature:
+                self.stats['hits'] += 1
+                return entry
+
+        with self._load_lock:
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None and entry.signature == signature:
+                    self.stats['hits'] += 1
+                    return entry
+                self.stats['misses'] += 1
+
+            tail = self._read_tail(filename, entry, signature) if entry is not None else None
+            if tail is not None:
+                new_entry, added, removed = tail
+                with self._lock:
+                    self.stats['tail_reads'] += 1
+            else:
+                new_entry, added, removed = self._read_full(filename, signature), None, None
+            with self._lock:
+                self._cache[key] = new_entry
+            if new_entry.frame is not (entry.frame if entry is not None else None):
+                self._notify(filename, entry.frame if entry is not None else None, new_entry.frame, added, removed)
+        if len(new_entry.tombstones) >= self.compact_tombstones:
+            self._schedule_compact(filename)
+        return new_entry
+
+    def _read_full(self, filename, signature):
+        with open(filename, 'rb') as f:
+            data = f.read()
+        trace.note(bytes=len(data))
+        offset = _complete(data)
+        if offset == 0:
+            return _Entry(signature, empty_frame(), 0, b'', set())
+        frame, tombstones = _parse(data[:offset])
+        fingerprint = data[max(0, offset - FINGERPRINT_SIZE):offset]
+        return _Entry(signature, drop_ids(frame, tombstones), offset, fingerprint, tombstones)
+
+    def _tail_bytes(self, filename, entry):
+        """Bytes appended to the file since entry was read, or None if the file was rewritten
+
+        Appends only make the file longer, so a changed file that didn't grow
+        was rewritten, even if its last bytes still match the fingerprint.
+        """
+        signature = fileio.signature(filename)
+        if entry.offset == 0 or signature is None or signature[1] < entry.offset:
+            return None
+        read_size = entry.signature[1] if entry.signature is not None else entry.offset
+        if signature != entry.signature and signature[1] <= read_size:
+            return None
+        with open(filename, 'rb') as f:
+            f.seek(entry.offset - len(entry.fingerprint))
+            data = f.read()
+        trace.note(bytes=len(data))
+        if not data.startswith(entry.fingerprint):
+            return None
+        return data[len(entry.fingerprint):]
+
+    def _read_tail(self, filename, entry, signature):
+        """Parse only the bytes appended since entry was read
+
+        Only the new bytes are parsed, but the new frame is still a full copy
+        of the cached one plus the new rows (O(n), ~0.2 s per million rows).
+        Returns (entry, added rows, removed rows), or None if the file was rewritten.
+        """
+        data = self._tail_bytes(filename, entry)
+        if data is None:
+            return None
+        offset = _complete(data)
+        if offset == 0:
+            new_entry = _Entry(signature, entry.frame, entry.offset, entry.fingerprint, entry.tombstones)
+            return new_entry, entry.frame.iloc[:0], entry.frame.iloc[:0]
+        tail, tombstones = _parse(data[:offset], header=False)
+        previous = entry.frame
+        if tombstones:
+            dead = previous['ID'].isin(tombstones)
+            removed, kept = previous[dead], previous[~dead]
+        else:
+            removed, kept = previous.iloc[:0], previous
+        added = drop_ids(tail, tombstones)
+        fingerprint = (entry.fingerprint + data[:offset])[-FINGERPRINT_SIZE:]
+        new_entry = _Entry(
+            signature, concat_frames(kept, added), entry.offset + offset, fingerprint,
+            entry.tombstones | tombstones,
+        )
+        return new_entry, added, removed
+
+    def _append_frame(self, filename, df):
+        # Serialize before taking the lock, so it is only held for the write itself
+        data = _to_csv(df, header=False)
+        with self._write_lock, fileio.locked(filename):
+            fileio.append(filename, data, header=HEADER)
+
+    def append(self, filename, rows):
+        """Append rows (a list of dicts) to the CSV file, giving each a new ID"""
+        df = with_ids(pd.DataFrame(rows, columns=COLUMNS))
+        self._append_frame(filename, df)
+        return df['ID'].tolist()
+
+    def _write(self, filename, df):
+        """Rewrite the file from df and cache df as its parsed contents"""
+        df = with_ids(df)
+        data = _to_csv(df)
+        with fileio.locked(filename):
+            fileio.atomic_write(filename, data)
+            signature = fileio.signature(filename)
+        entry = _Entry(signature, df, _complete(data), data[-FINGERPRINT_SIZE:], set())
+        with self._lock:
+            self._cache[os.path.abspath(filename)] = entry
+        return df
+
+    def needs_compact(self, filename):
+        with self._lock:
+            entry = self._cache.get(os.path.abspath(filename))
+        return entry is not None and bool(entry.tombstones or not entry.frame['Tanggal'].is_monotonic_increasing)
+
+    def _compact(self, filename):
+        """Rewrite the file from the cached frame in date order, keeping rows appended meanwhile
+
+        The frame is sorted and serialized without holding any lock; under
+        them, whatever was appended to the file since the frame was read is
+        copied over unparsed, and the next load picks those rows up as a
+        normal tail.
+        """
+        entry = self._load_entry(filename)
+        if entry.offset == 0:
+            return
+        frame = date_sorted(entry.frame)
+        data = _to_csv(frame)
+        key = os.path.abspath(filename)
+        with self._load_lock:
+            with self._lock:
+                if self._cache.get(key) is not entry:
+                    # Reloaded meanwhile; the next compaction starts from the newer rows
+                    return
+            with fileio.locked(filename):
+                tail = self._tail_bytes(filename, entry)
+                if tail is None:
+                    # Rewritten by another process since it was read
+                    return
+                fileio.atomic_write(filename, data + tail)
+                signature = fileio.signature(filename) if not tail else None
+            with self._lock:
+                self._cache[key] = _Entry(signature, frame, len(data), data[-FINGERPRINT_SIZE:], set())
+            if frame is not entry.frame:
+                self._notify(filename, entry.frame, frame, frame.iloc[:0], frame.iloc[:0])
+
+    def delete(self, filename, ids):
+        """Delete rows by ID by appending one tombstone row per ID"""
+        if ids:
+            self._append_frame(filename, pd.DataFrame({'ID': list(ids)}, columns=COLUMNS))
+
+
+class FeatherBackend(Backend):
+    """Arrow IPC (Feather v2) ledgers, memory-mapped on load
+
+    Each ledger is an uncompressed ``.arrow`` base file plus a small
+    ``.delta.csv`` holding rows and tombstones appended since the base was
+    last written. Loading maps the base file without parsing it and only the
+    delta goes through the CSV reader; once the delta grows past
+    ``compact_rows`` entries it is folded into a new base file in a
+    background thread.
+
+    The delta file's lock guards the pair: appends to the delta, and the
+    journaled swap of both files on compaction, happen under it.
+    """
+
+    name = 'feather'
+
+    def __init__(self, compact_rows=1000):
+        try:
+            from pyarrow import feather
+        except ImportError as e:
+            raise ImportError('Feather storage requires pyarrow (pip install pyarrow)') from e
+        super().__init__()
+        self._feather = feather
+        self._delta = CsvBackend(compact_tombstones=float('inf'))
+        self.compact_rows = compact_rows
+        self.stats['base_reads'] = 0
+
+    def path(self, filename):
+        return os.path.splitext(filename)[0] + '.arrow'
+
+    def delta_path(self, filename):
+        return os.path.splitext(filename)[0] + '.delta.csv'
+
+    def init(self, filename, migrate=True):
+        """Create the base file, migrating the CSV ledger if there is one"""
+        path = self.path(filename)
+        delta_path = self.delta_path(filename)
+        if self._has_ids(path):
+            self._delta.init(delta_path)
+            return
+        with fileio.locked(delta_path):
+            if not os.path.exists(path):
+                df = CsvBackend().load(filename) if migrate else empty_frame()
+                fileio.commit(self._stage_base(filename, df), path)
+            elif not self._has_ids(path):
+                fileio.commit(self._stage_base(filename, typed_frame(self._read_base(filename))), path)
+        self._delta.init(delta_path)
+
+    def _has_ids(self, path):
+        """True if the base file exists and has the ID column"""
+        return os.path.exists(path) and 'ID' in self._feather.read_table(path, memory_map=True).column_names
+
+    def _stage_base(self, filename, df):
+        """Write df as a new base file next to the current one and return its path"""
+        # Staged without the lock, so the name must not clash with other sessions'
+        tmp = f'{self.path(filename)}.{uuid.uuid4().hex}.tmp'
+        df = with_ids(df).reindex(columns=COLUMNS).reset_index(drop=True)
+        self._feather.write_feather(df, tmp, compression='uncompressed')
+        return tmp
+
+    def _read_base(self, filename):
+        table = self._feather.read_table(self.path(filename), memory_map=True)
+        return table.to_pandas(split_blocks=True)
+
+    def load(self, filename):
+        """Load the memory-mapped base file plus any rows in the delta file"""
+        key = os.path.abspath(filename)
+        path = self.path(filename)
+        delta_path = self.delta_path(filename)
+        base_signature = fileio.signature(path)
+        if base_signature is None:
+            return empty_frame()
+        signature = (base_signature, fileio.signature(delta_path))
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry['signature'] == signature:
+                self.stats['hits'] += 1
+                return entry['frame']
+
+        with self._load_lock:
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None and entry['signature'] == signature:
+                    self.stats['hits'] += 1
+                    return entry['frame']
+                self.stats['misses'] += 1
+
+            # Compaction replaces both files under the delta's lock; holding it
+            # while mapping the base and reading the (small) delta gives a
+            # matching pair. The base is converted after the lock is released.
+            with fileio.locked(delta_path):
+                base_signature = fileio.signature(path)
+                same_base = entry is not None and entry['signature'][0] == base_signature
+                table = None if same_base else self._feather.read_table(path, memory_map=True)
+                delta = self._delta._load_entry(delta_path)
+            if same_base:
+                base = entry['base']
+            else:
+                trace.note(bytes=base_signature[1])
+                base = table.to_pandas(split_blocks=True)
+                with self._lock:
+                    self.stats['base_reads'] += 1
+            frame = concat_frames(drop_ids(base, delta.tombstones), delta.frame)
+            with self._lock:
+                self._cache[key] = {
+                    'signature': (base_signature, delta.signature), 'base': base, 'frame': frame, 'delta': delta,
+                }
+
+            previous = entry['frame'] if entry is not None else None
+            if same_base:
+                self._notify(filename, previous, frame, *self._delta_change(entry, delta))
+            else:
+                self._notify(filename, previous, frame)
+        return frame
+
+    @staticmethod
+    def _delta_change(entry, delta):
+        """(added, removed) rows between a cache entry and a newer read of the same delta file
+
+        The delta file only grows between compactions, so the change is its
+        new rows and the rows hit by its new tombstones.
+        """
+        previous = entry['frame']
+        added = delta.frame
+        if not added.empty:
+            added = added[~added['ID'].isin(entry['delta'].frame['ID'])]
+        new_tombstones = delta.tombstones - entry['delta'].tombstones
+        removed = previous[previous['ID'].isin(new_tombstones)] if new_tombstones else previous.iloc[:0]
+        return added, removed
+
+    def _delta_size(self, filename):
+        delta_path = self.delta_path(filename)
+        return len(self._delta.load(delta_path)) + len(self._delta.tombstones(delta_path))
+
+    def append(self, filename, rows):
+        """Append rows to the delta file, compacting it into the base when it gets large"""
+        with self._write_lock:
+            ids = self._delta.append(self.delta_path(filename), rows)
+        if self._delta_size(filename) >= self.compact_rows:
+            self._schedule_compact(filename)
+        return ids
+
+    def _write(self, filename, df):
+        """Write df as the new base file, empty the delta file and cache df"""
+        df = with_ids(df).reset_index(drop=True)
+        self._replace(filename, df, self._stage_base(filename, df), b'')
+        return df
+
+    def _replace(self, filename, frame, tmp, tail):
+        """Move the staged base file tmp (holding frame) into place, with a delta file holding only tail
+
+        Both files change in one journaled step under the delta's lock. Call
+        with the load lock held; rows in tail are announced as a change.
+        """
+        delta_path = self.delta_path(filename)
+        with fileio.locked(delta_path):
+            fileio.replace(delta_path, HEADER + tail, renames=[(tmp, self.path(filename))])
+            base_signature = fileio.signature(self.path(filename))
+            self._delta.invalidate(delta_path)
+            delta = self._delta._load_entry(delta_path)
+        new_frame = concat_frames(drop_ids(frame, delta.tombstones), delta.frame)
+        with self._lock:
+            self._cache[os.path.abspath(filename)] = {
+                'signature': (base_signature, delta.signature), 'base': frame, 'frame': new_frame, 'delta': delta,
+            }
+        if new_frame is not frame:
+            self._notify(filename, frame, new_frame, delta.frame, frame[frame['ID'].isin(delta.tombstones)])
+
+    def needs_compact(self, filename):
+        with self._lock:
+            entry = self._cache.get(os.path.abspath(filename))
+        if entry is None:
+            return False
+        delta = entry['delta']
+        return bool(len(delta.frame) or delta.tombstones or not entry['frame']['Tanggal'].is_monotonic_increasing)
+
+    def _compact(self, filename):
+        """Fold the delta file into a new base file, in date order
+
+        The base is written from the cached frame without holding any lock;
+        rows appended to the delta meanwhile are carried over to the new
+        delta file.
+        """
+        frame = self.load(filename)
+        key = os.path.abspath(filename)
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is None or entry['frame'] is not frame:
+            return
+        base = date_sorted(frame)
+        tmp = self._stage_base(filename, base)
+        delta_path = self.delta_path(filename)
+        with self._load_lock, fileio.locked(delta_path):
+            with self._lock:
+                current = self._cache.get(key)
+            tail = self._delta._tail_bytes(delta_path, entry['delta'])
+            if current is not entry or tail is None or fileio.signature(self.path(filename)) != entry['signature'][0]:
+                # Reloaded, or compacted by another process, since it was read
+                os.remove(tmp)
+                return
+            if base is not frame:
+                self._notify(filename, frame, base, base.iloc[:0], base.iloc[:0])
+            self._replace(filename, base, tmp, tail)
+
+    def delete(self, filename, ids):
+        """Delete rows by ID with tombstones in the delta file"""
+        with self._write_lock:
+            self._delta.delete(self.delta_path(filename), ids)
+        if self._delta_size(filename) >= self.compact_rows:
+            self._schedule_compact(filename)
+
+    def invalidate(self, filename=None):
+        super().invalidate(filename)
+        self._delta.invalidate(None if filename is None else self.delta_path(filename))
+
+
+class SqliteBackend(Backend):
+    """Ledgers as tables of a SQLite database in WAL mode (CASHFLOW_DB, or one per data directory)
+
+    Each ledger table is indexed on Tanggal, on (Kategori, Tanggal) and
+    uniquely on ID, so inserts and deletes by ID are O(log n) and month
+    queries are index range scans; deleted rows are removed directly rather
+    than tombstoned. Writes run in ``BEGIN IMMEDIATE`` transactions, which
+    serializes sessions writing to the same file. A ``ledger_versions`` table
+    counts inserts and deletes per ledger so the cached frame is only extended
+    with new rows after inserts and reloaded after other sessions' deletes.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, db_path=None):
+        super().__init__()
+        # Without a fixed database, each data directory has its own cashflow.db
+        self.db_path = db_path or os.environ.get('CASHFLOW_DB')
+        self._local = threading.local()
+        # (database, table) pairs whose schema this process has set up
+        self._initialized = set()
+        self.stats['tail_reads'] = 0
+
+    def database(self, filename):
+        """Database file holding a ledger's table: db_path, or cashflow.db next to the ledger"""
+        return self.db_path or os.path.join(os.path.dirname(filename), 'cashflow.db')
+
+    def path(self, filename):
+        return f'{self.database(filename)}:{self.table(filename)}'
+
+    def table(self, filename):
+        table = os.path.splitext(os.path.basename(filename))[0]
+        if not table.isidentifier():
+            raise ValueError(f'Invalid ledger name: {filename!r}')
+        return table
+
+    def _connect(self, database):
+        """Connection to database for the current thread (sqlite3 connections can't be shared)"""
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = {}
+        key = os.path.abspath(database)
+        conn = conns.get(key)
+        if conn is None:
+            conn = sqlite3.connect(database, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conns[key] = conn
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self, filename, mode='IMMEDIATE'):
+        conn = self._connect(self.database(filename))
+        conn.execute(f'BEGIN {mode}')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def init(self, filename, migrate=True):
+        """Create the ledger table and indexes, migrating the CSV ledger if the table is new
+
+        Runs once per process and table (the app calls it on every rerun),
+        so later calls don't queue for the database's write lock.
+        """
+        table = self.table(filename)
+        database = self.database(filename)
+        key = (os.path.abspath(database), table)
+        with self._lock:
+            if key in self._initialized and os.path.exists(database):
+                return
+        with self._transaction(filename) as conn:
+            created = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone() is None
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" ('
+                'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'Tanggal TEXT NOT NULL, '
+                'Kategori TEXT NOT NULL, '
+                'Jumlah INTEGER NOT NULL, '
+                "Keterangan TEXT NOT NULL DEFAULT '', "
+                'ID TEXT)'
+            )
+            columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{table}")')]
+            if 'seq' not in columns:
+                # Tables created before transaction IDs used 'id' for the row
+                # sequence, which clashes with 'ID' (column names ignore case)
+                conn.execute(f'ALTER TABLE "{table}" RENAME COLUMN id TO seq')
+            if 'ID' not in columns:
+                conn.execute(f'ALTER TABLE "{table}" ADD COLUMN ID TEXT')
+            conn.execute(f'UPDATE "{table}" SET ID = lower(hex(randomblob(16))) WHERE ID IS NULL')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_tanggal" ON "{table}" (Tanggal)')
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_kategori" ON "{table}" (Kategori, Tanggal)')
+            conn.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS "{table}_id" ON "{table}" (ID)')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS ledger_versions ('
+                'ledger TEXT PRIMARY KEY, '
+                'inserts INTEGER NOT NULL DEFAULT 0, '
+                'deletes INTEGER NOT NULL DEFAULT 0)'
+            )
+            conn.execute('INSERT OR IGNORE INTO ledger_versions (ledger) VALUES (?)', (table,))
+        if migrate and created and os.path.exists(filename):
+            df = CsvBackend().load(filename)
+            if not df.empty:
+                self.write(filename, df)
+        with self._lock:
+            self._initialized.add(key)
+
+    def _versions(self, conn, table):
+        return conn.execute(
+            'SELECT inserts, deletes FROM ledger_versions WHERE ledger = ?', (table,)
+        ).fetchone()
+
+    def _bump(self, conn, table, inserts=0, deletes=0):
+        conn.execute(
+            'UPDATE ledger_versions SET inserts = inserts + ?, deletes = deletes + ? WHERE ledger = ?',
+            (inserts, deletes, table),
+        )
+
+    def _select(self, conn, table, where='', params=()):
+        df = pd.read_sql_query(
+            f'SELECT seq, Tanggal, Kategori, Jumlah, Keterangan, ID FROM "{table}" {where} ORDER BY seq',
+            conn, params=params, index_col='seq',
+        )
+        df.index.name = None
+        return typed_frame(df)
+
+    def load(self, filename):
+        """Load a ledger table, fetching only new rows if nothing was deleted since the last load
+
+        An unchanged ledger costs one autocommit read of its versions row; the
+        load lock and a read transaction are only taken to fetch rows.
+        """
+        table = self.table(filename)
+        key = os.path.abspath(filename)
+        with self._lock:
+            entry = self._cache.get(key)
+        if entry is not None:
+            if self._versions(self._connect(self.database(filename)), table) == entry['versions']:
+                with self._lock:
+                    self.stats['hits'] += 1
+                return entry['frame']
+        with self._load_lock, self._transaction(filename, 'DEFERRED') as conn:
+            versions = self._versions(conn, table)
+            if versions is None:
+                return empty_frame()
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None and entry['versions'] == versions:
+                    self.stats['hits'] += 1
+                    return entry['frame']
+                self.stats['misses'] += 1
+
+            previous = entry['frame'] if entry is not None else None
+            if entry is not None and entry['versions'][1] == versions[1]:
+                last_seq = int(previous.index.max()) if not previous.empty else 0
+                tail = self._select(conn, table, 'WHERE seq > ?', (last_seq,))
+                frame = concat_frames(previous, tail, ignore_index=False)
+                with self._lock:
+                    self.stats['tail_reads'] += 1
+                    self._cache[key] = {'versions': versions, 'frame': frame}
+                self._notify(filename, previous, frame, tail, previous.iloc[:0])
+            else:
+                frame = self._select(conn, table)
+                with self._lock:
+                    self._cache[key] = {'versions': versions, 'frame': frame}
+                self._notify(filename, previous, frame)
+        return frame
+
+    def load_month(self, filename, month):
+        """Transactions of one 'YYYY-MM' month, read with a range scan on the Tanggal index"""
+        start, end = month_bounds(month)
+        with self._transaction(filename, 'DEFERRED') as conn:
+            return self._select(conn, self.table(filename), 'WHERE Tanggal >= ? AND Tanggal < ?', (start, end))
+
+    def months(self, filename):
+        """Months ('YYYY-MM') that have transactions, newest first"""
+        table = self.table(filename)
+        with self._transaction(filename, 'DEFERRED') as conn:
+            rows = conn.execute(f'SELECT DISTINCT substr(Tanggal, 1, 7) FROM "{table}" ORDER BY 1 DESC')
+            return [row[0] for row in rows]
+
+    def _records(self, df):
+        df = with_ids(typed_frame(df))
+        return list(zip(
+            df['Tanggal'].dt.strftime('%Y-%m-%d'),
+            df['Kategori'].astype(str),
+            df['Jumlah'].tolist(),
+            df['Keterangan'].astype(str),
+            df['ID'],
+        ))
+
+    def _insert(self, conn, table, records):
+        conn.executemany(
+            f'INSERT INTO "{table}" (Tanggal, Kategori, Jumlah, Keterangan, ID) VALUES (?, ?, ?, ?, ?)',
+            records,
+        )
+
+    def append(self, filename, rows):
+        """Insert rows (a list of dicts) in one transaction, giving each a new ID"""
+        table = self.table(filename)
+        records = self._records(pd.DataFrame(rows, columns=COLUMNS))
+        with self._transaction(filename) as conn:
+            self._insert(conn, table, records)
+            self._bump(conn, table, inserts=len(records))
+        return [record[4] for record in records]
+
+    def _write(self, filename, df):
+        """Replace the whole ledger table with df; the new frame is read on the next load"""
+        table = self.table(filename)
+        records = self._records(df)
+        with self._transaction(filename) as conn:
+            conn.execute(f'DELETE FROM "{table}"')
+            self._insert(conn, table, records)
+            self._bump(conn, table, inserts=len(records), deletes=1)
+        self.invalidate(filename)
+        return None
+
+    def compact(self, filename):
+        """Nothing to compact: SQLite deletes rows in place"""
+
+    def delete(self, filename, ids):
+        """Delete rows by ID in one transaction"""
+        table = self.table(filename)
+        key = os.path.abspath(filename)
+        ids = set(ids)
+        with self._load_lock, self._transaction(filename) as conn:
+            versions = self._versions(conn, table)
+            conn.executemany(f'DELETE FROM "{table}" WHERE ID = ?', [(row_id,) for row_id in ids])
+            self._bump(conn, table, deletes=1)
+            with self._lock:
+                entry = self._cache.pop(key, None)
+            if entry is not None and entry['versions'] == versions:
+                # Our own delete on an up-to-date cache: drop the rows in place
+                previous = entry['frame']
+                dead = previous['ID'].isin(ids)
+                frame = previous[~dead]
+                with self._lock:
+                    self._cache[key] = {'versions': (versions[0], versions[1] + 1), 'frame': frame}
+                self._notify(filename, previous, frame, previous.iloc[:0], previous[dead])
+
+
+def _count_rows(data):
+    """Number of CSV records in data: line ends outside quoted fields
+
+    Keterangan may hold line breaks (it is a text area), so lines and rows
+    only match when there are no quotes.
+    """
+    if b'"' not in data:
+        return data.count(b'\n')
+    raw = np.frombuffer(data, dtype=np.uint8)
+    # A line end is inside a quoted field when an odd number of quotes precede it
+    quoted = np.cumsum(raw == ord('"'), dtype=np.int64) & 1
+    return int(np.count_nonzero((raw == ord('\n')) & (quoted == 0)))
+
+
+def _read_partitions(paths):
+    """Rows of the month files in paths, parsed in one go: (all rows, [rows of each file])
+
+    Lines still being appended are left out. The frames of the files are
+    slices of the frame of all rows, in the order of paths.
+    """
+    bodies = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        trace.note(bytes=len(data))
+        # Month files hold no tombstones, so every line after the header is a row
+        bodies.append(data[:_complete(data)].partition(b'\n')[2])
+    data = b''.join(bodies)
+    if not data:
+        frame = empty_frame()
+        return frame, [frame] * len(paths)
+    frame, _ = _parse(data, header=False)
+    parts, start = [], 0
+    for body in bodies:
+        end = start + _count_rows(body)
+        parts.append(frame.iloc[start:end])
+        start = end
+    return frame, parts
+
+
+def _read_partition(path):
+    """Typed rows of one month file"""
+    return _read_partitions([path])[0]
+
+
+def _concat_all(frames):
+    """Concatenate any number of typed frames, keeping Kategori categorical"""
+    frames = [df for df in frames if not df.empty]
+    if not frames:
+        return empty_frame()
+    merged = pd.concat(frames, ignore_index=True)
+    merged['Kategori'] = union_categoricals([df['Kategori'] for df in frames], ignore_order=True)
+    return merged
+
+
+def _month_labels(df):
+    with trace.span('to_datetime') as span:
+        span.rows = len(df)
+        return pd.to_datetime(df['Tanggal']).dt.strftime('%Y-%m')
+
+
+class PartitionedBackend(Backend):
+    """CSV ledgers split into one file per month, listed in a manifest
+
+    The ledger ``pengeluaran.csv`` is stored as ``pengeluaran/2026-10.csv``,
+    ``pengeluaran/2026-11.csv``, ... plus ``pengeluaran/manifest.json``
+    holding the row count and size of each month. The month list comes from
+    the manifest, a single month is read from its own file, appends go to the
+    file of each row's month and deletes rewrite only the months they touch.
+    On load, only the month files that changed since the last load are
+    parsed again.
+
+    Writers hold the manifest's lock. Appends go through the month file's
+    journal before the manifest is updated; rewrites replace the month files
+    and the manifest in one journaled step. If a writer dies between an
+    append and the manifest update, the next writer recounts that month.
+    """
+
+    name = 'partitioned'
+
+    def __init__(self):
+        super().__init__()
+        self._manifests = {}
+        self.stats['partition_reads'] = 0
+
+    def path(self, filename):
+        return os.path.splitext(filename)[0]
+
+    def partition_path(self, filename, month):
+        return os.path.join(self.path(filename), f'{month}.csv')
+
+    def manifest_path(self, filename):
+        return os.path.join(self.path(filename), 'manifest.json')
+
+    def _manifest(self, filename):
+        """(signature, {month: {'rows': n, 'size': bytes}}) of the manifest, cached until it changes"""
+        path = self.manifest_path(filename)
+        signature = fileio.signature(path)
+        if signature is None:
+            return None, {}
+        with self._lock:
+            cached = self._manifests.get(path)
+        if cached is None or cached[0] != signature:
+            with open(path, encoding='utf-8') as f:
+                cached = (signature, json.load(f)['months'])
+            with self._lock:
+                self._manifests[path] = cached
+        return cached
+
+    @staticmethod
+    def _manifest_bytes(months):
+        return json.dumps({'months': dict(sorted(months.items()))}, indent=1).encode('utf-8')
+
+    @contextlib.contextmanager
+    def _locked(self, filename):
+        """Hold the ledger's write lock and yield a copy of its manifest, checked against the month files"""
+        os.makedirs(self.path(filename), exist_ok=True)
+        with self._write_lock, fileio.locked(self.manifest_path(filename)):
+            months = dict(self._manifest(filename)[1])
+            if self._repair(filename, months):
+                fileio.atomic_write(self.manifest_path(filename), self._manifest_bytes(months))
+            yield months
+
+    def _repair(self, filename, months):
+        """Recount the months whose file doesn't match the manifest (a writer died); True if any did"""
+        directory = self.path(filename)
+        for name in os.listdir(directory):
+            if name.endswith('.csv.journal'):
+                # Taking the month file's lock completes its interrupted append
+                with fileio.locked(os.path.join(directory, name[:-len('.journal')])):
+                    pass
+        sizes = {}
+        for name in os.listdir(directory):
+            match = _PARTITION.fullmatch(name)
+            if match:
+                sizes[match.group(1)] = fileio.size(os.path.join(directory, name))
+        changed = False
+        for month, size in sizes.items():
+            if month not in months or months[month]['size'] != size:
+                rows = len(_read_partition(self.partition_path(filename, month)))
+                months[month] = {'rows': rows, 'size': size}
+                changed = True
+        for month in set(months) - set(sizes):
+            del months[month]
+            changed = True
+        return changed
+
+    def _rewrite(self, filename, months, frames):
+        """Replace the month files in frames ({month: frame}) and the manifest in one journaled step
+
+        Call under _locked(); months is updated. An empty frame deletes the month.
+        """
+        renames = []
+        for month, df in frames.items():
+            data = _to_csv(df)
+            tmp = f'{self.partition_path(filename, month)}.{uuid.uuid4().hex}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            renames.append((tmp, self.partition_path(filename, month)))
+            if df.empty:
+                months.pop(month, None)
+            else:
+                months[month] = {'rows': len(df), 'size': len(data)}
+        fileio.replace(self.manifest_path(filename), self._manifest_bytes(months), renames)
+        # Emptied months were replaced by a bare header first, so a crash
+        # before this point can't bring their rows back
+        for month, df in frames.items():
+            if df.empty:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(self.partition_path(filename, month))
+
+    def _split(self, df):
+        """{month: rows} of a frame"""
+        return {month: rows for month, rows in df.groupby(_month_labels(df), sort=True)}
+
+    def init(self, filename, migrate=True):
+        """Create the ledger directory and manifest, splitting up the CSV ledger if there is one"""
+        if os.path.exists(self.manifest_path(filename)):
+            return
+        df = with_ids(CsvBackend().load(filename)) if migrate else empty_frame()
+        with self._locked(filename) as months:
+            if not os.path.exists(self.manifest_path(filename)):
+                self._rewrite(filename, months, self._split(df))
+
+    def load(self, filename):
+        """Load a ledger from its month files, parsing only the months that changed"""
+        key = os.path.abspath(filename)
+        signature, _ = self._manifest(filename)
+        if signature is None:
+            return empty_frame()
+
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry['signature'] == signature:
+                self.stats['hits'] += 1
+                return entry['frame']
+
+        with self._load_lock:
+            signature, months = self._manifest(filename)
+            with self._lock:
+                entry = self._cache.get(key)
+                if entry is not None and entry['signature'] == signature:
+                    self.stats['hits'] += 1
+                    return entry['frame']
+                self.stats['misses'] += 1
+
+            previous_parts = entry['parts'] if entry is not None else {}
+            parts, changed = {}, []
+            for month in sorted(months):
+                part_signature = fileio.signature(self.partition_path(filename, month))
+                old = previous_parts.get(month)
+                if old is not None and old[0] == part_signature:
+                    parts[month] = old
+                else:
+                    parts[month] = (part_signature, None)
+                    changed.append(month)
+            parsed, added = _read_partitions([self.partition_path(filename, month) for month in changed])
+            for month, part in zip(changed, added):
+                parts[month] = (parts[month][0], part)
+            removed = [old for month, (_, old) in previous_parts.items() if month in changed or month not in parts]
+
+            if entry is not None and not changed and not removed:
+                frame = entry['frame']
+            elif len(changed) == len(parts):
+                # Every month was parsed at once, in month order
+                frame = parsed
+            else:
+                frame = _concat_all(part for _, part in parts.values())
+                # Keep each month as a slice of the ledger frame, so its rows are in memory once
+                start = 0
+                for month, (part_signature, part) in parts.items():
+                    parts[month] = (part_signature, frame.iloc[start:start + len(part)])
+                    start += len(part)
+            with self._lock:
+                self.stats['partition_reads'] += len(added)
+                self._cache[key] = {'signature': signature, 'parts': parts, 'frame': frame}
+
+            previous = entry['frame'] if entry is not None else None
+            if previous is None:
+                self._notify(filename, None, frame)
+            elif frame is not previous:
+                self._notify(filename, previous, frame, _concat_all(added), _concat_all(removed))
+        return frame
+
+    def load_month(self, filename, month):
+        """Transactions of one 'YYYY-MM' month, read from its own file unless the ledger is cached"""
+        signature, months = self._manifest(filename)
+        with self._lock:
+            entry = self._cache.get(os.path.abspath(filename))
+        if entry is not None and entry['signature'] == signature and month in entry['parts']:
+            return entry['parts'][month][1]
+        if month not in months:
+            return empty_frame()
+        with self._lock:
+            self.stats['partition_reads'] += 1
+        return _read_partition(self.partition_path(filename, month))
+
+    def months(self, filename):
+        """Months ('YYYY-MM') that have transactions, newest first, from the manifest"""
+        _, months = self._manifest(filename)
+        return sorted((month for month, info in months.items() if info['rows']), reverse=True)
+
+    def append(self, filename, rows):
+        """Append rows to the file of each row's month, giving each a new ID"""
+        df = with_ids(pd.DataFrame(rows, columns=COLUMNS))
+        df['Tanggal'] = pd.to_datetime(df['Tanggal'])
+        # Serialize before taking the lock, so it is only held for the writes
+        parts = {month: (len(rows), _to_csv(rows, header=False)) for month, rows in self._split(df).items()}
+        with self._locked(filename) as months:
+            for month, (count, data) in parts.items():
+                path = self.partition_path(filename, month)
+                with fileio.locked(path):
+                    fileio.append(path, data, header=HEADER)
+                rows_before = months[month]['rows'] if month in months else 0
+                months[month] = {'rows': rows_before + count, 'size': fileio.size(path)}
+            fileio.atomic_write(self.manifest_path(filename), self._manifest_bytes(months))
+        return df['ID'].tolist()
+
+    def delete(self, filename, ids):
+        """Delete rows by ID, rewriting only the month files that hold them"""
+        ids = set(ids)
+        if not ids:
+            return
+        with self._locked(filename) as months:
+            frame = self.load(filename)
+            touched = set(_month_labels(frame[frame['ID'].isin(ids)]))
+            frames = {
+                month: drop_ids(_read_partition(self.partition_path(filename, month)), ids)
+                for month in sorted(touched)
+            }
+            if frames:
+                self._rewrite(filename, months, frames)
+
+    def _write(self, filename, df):
+        """Replace the whole ledger with df; the new frame is read on the next load"""
+        df = with_ids(df)
+        with self._locked(filename) as months:
+            frames = {month: empty_frame() for month in months}
+            frames.update(self._split(df))
+            self._rewrite(filename, months, frames)
+        self.invalidate(filename)
+        return None
+
+    def needs_compact(self, filename):
+        with self._lock:
+            entry = self._cache.get(os.path.abspath(filename))
+        return entry is not None and not entry['frame']['Tanggal'].is_monotonic_increasing
+
+    def _compact(self, filename):
+        """Rewrite in date order the month files with rows appended out of order
+
+        There are no tombstones to drop: deletes rewrite their month files.
+        """
+        self.load(filename)
+        with self._lock:
+            entry = self._cache.get(os.path.abspath(filename))
+        if entry is None:
+            return
+        frames = {
+            month: date_sorted(part) for month, (_, part) in entry['parts'].items()
+            if not part['Tanggal'].is_monotonic_increasing
+        }
+        if not frames:
+            return
+        with self._locked(filename) as months:
+            if self._manifest(filename)[0] != entry['signature']:
+                # Changed since it was read
+                return
+            self._rewrite(filename, months, frames)
+
+    def invalidate(self, filename=None):
+        super().invalidate(filename)
+        with self._lock:
+            if filename is None:
+                self._manifests.clear()
+            else:
+                self._manifests.pop(self.manifest_path(filename), None)
+
+
+BACKENDS = {
+    'csv': CsvBackend,
+    'feather': FeatherBackend,
+    'sqlite': SqliteBackend,
+    'partitioned': PartitionedBackend,
+}
@@ -0,0 +1,125 @@
+"""Separate ledgers per user, for one server process serving many users
+
+With CASHFLOW_DATA_DIR set, every user (tenant) has a directory of their own
+under it, holding their ledgers, category registries and, with the SQLite
+backend, their own database. Without it there is a single tenant whose
+ledgers are in the current directory, as before.
+
+What the tenants have loaded (cached frames, combined ledger, aggregates,
+registries) shares one memory budget of CASHFLOW_CACHE_MB megabytes. Beyond
+it the least recently active tenants are unloaded; their ledgers are read
+back from disk on their next request.
+"""
+import hashlib
+import os
+import re
+import sys
+import threading
+
+from cashflow import aggregates, budgets, categories, combined, ledger, portfolio, recurring
+from cashflow.lru import LRUCache
+
+DATA_DIR = os.environ.get('CASHFLOW_DATA_DIR')
+
+CACHE_MB = float(os.environ.get('CASHFLOW_CACHE_MB', 512))
+
+_TENANT_ID = re.compile(r'[a-z0-9_]{1,64}')
+
+# Strings sampled per column to estimate the memory of object columns
+_SAMPLE = 100
+
+
+def frame_bytes(df):
+    """Approximate memory of a frame: exact for fixed-width columns, sampled for strings"""
+    total = int(df.memory_usage(index=True, deep=False).sum())
+    for column in df.columns[df.dtypes == object]:
+        values = df[column]
+        if len(values):
+            sample = values.iloc[:: max(1, len(values) // _SAMPLE)]
+            total += len(values) * sum(map(sys.getsizeof, sample)) // len(sample)
+    return total
+
+
+def tenant_id(user):
+    """Directory name for a user name or e-mail address: readable, and distinct per user"""
+    user = str(user).strip().lower()
+    if not user:
+        raise ValueError('Nama pengguna tidak boleh kosong')
+    slug = re.sub(r'[^a-z0-9]+', '_', user).strip('_')[:40]
+    digest = hashlib.sha256(user.encode('utf-8')).hexdigest()[:10]
+    return f'{slug}_{digest}' if slug else digest
+
+
+class Tenant:
+    """One user's ledgers: {tipe: filename} inside their directory"""
+
+    def __init__(self, tenant_id=None, directory=''):
+        self.id = tenant_id
+        self.directory = directory
+        self.ledgers = {tipe: os.path.join(directory, name) for tipe, name in ledger.LEDGERS.items()}
+
+    def __repr__(self):
+        return f'Tenant({self.id!r}, {self.directory!r})'
+
+    def init(self):
+        """Create the directory and ledger storage if they don't exist"""
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        for filename in self.ledgers.values():
+            ledger.init_csv(filename)
+
+    def memory_bytes(self):
+        """Estimated memory held by the tenant's loaded ledgers"""
+        frames = [ledger.cached_frame(filename) for filename in self.ledgers.values()]
+        # The combined ledger's views share these frames' rows
+        return sum(frame_bytes(df) for df in frames if df is not None)
+
+    def unload(self):
+        """Drop everything cached for the tenant; it is read from disk again when needed"""
+        combined.invalidate(self.ledgers)
+        recurring.invalidate(self.ledgers)
+        for filename in self.ledgers.values():
+            aggregates.invalidate(filename)
+            budgets.invalidate(filename)
+            categories.invalidate(filename)
+            portfolio.invalidate(filename)
+            ledger.invalidate(filename)
+
+
+_default = Tenant()
+_tenants = {}
+_lock = threading.Lock()
+_loaded = LRUCache(int(CACHE_MB * 2**20), on_evict=lambda _, tenant: tenant.unload())
+
+
+def get(tenant_id=None):
+    """Tenant by ID; the single tenant in the current directory if CASHFLOW_DATA_DIR isn't set"""
+    if DATA_DIR is None:
+        return _default
+    if tenant_id is None or not _TENANT_ID.fullmatch(tenant_id):
+        raise ValueError(f'ID pengguna tidak valid: {tenant_id!r}')
+    with _lock:
+        tenant = _tenants.get(tenant_id)
+        if tenant is None:
+            tenant = _tenants[tenant_id] = Tenant(tenant_id, os.path.join(DATA_DIR, tenant_id))
+        return tenant
+
+
+def touch(tenant):
+    """Mark tenant as active and account its memory, unloading idle tenants beyond the budget
+
+    Call on every request. A tenant that alone exceeds the budget is unloaded
+    on each of its requests, so CASHFLOW_CACHE_MB should fit the largest user.
+    """
+    if tenant.id is not None:
+        _loaded.put(tenant.id, tenant, size=tenant.memory_bytes())
+
+
+def loaded():
+    """IDs of the tenants in memory, least recently active first"""
+    return _loaded.keys()
+
+
+def cache_stats():
+    """Entries, bytes and evictions of the tenant memory budget"""
+    return _loaded.cache_stats()
@@ -0,0 +1,287 @@
+"""Opt-in timing of the hot paths, collected per app rerun
+
+Loading, saving, date parsing, filtering, aggregation and chart building run
+inside named spans. Spans are only recorded while a Trace is active in the
+current thread (the app starts one per rerun when CASHFLOW_TRACE=1); without
+one, span() costs a context variable lookup.
+
+Each span records its wall time, the rows it touched, the bytes it read from
+disk and the cache hits and misses seen inside it. A finished trace can be
+exported as JSON, and the spans of every finished trace are added up into
+counters exported as Prometheus text. With CASHFLOW_METRICS_FILE set they are
+written there after each trace, for the node exporter's textfile collector.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from cashflow import fileio
+
+ENABLED = os.environ.get('CASHFLOW_TRACE', '0') not in ('', '0')
+
+METRICS_FILE = os.environ.get('CASHFLOW_METRICS_FILE')
+
+# Finished traces kept for history()
+HISTORY = 20
+
+_FIELDS = ('rows', 'bytes', 'hits', 'misses')
+
+_current = contextvars.ContextVar('cashflow_trace', default=None)
+_lock = threading.Lock()
+_history = deque(maxlen=HISTORY)
+# span name -> {'calls', 'seconds', 'rows', 'bytes', 'hits', 'misses'}
+_totals = {}
+_reruns = {'count': 0, 'seconds': 0.0}
+_log = logging.getLogger(__name__)
+
+
+class Span:
+    """One timed call; rows, bytes, hits and misses may be set or added to while it runs"""
+
+    __slots__ = ('name', 'label', 'depth', 'start', 'seconds', 'rows', 'bytes', 'hits', 'misses', '_trace')
+
+    def __init__(self, trace, name, label, depth):
+        self._trace = trace
+        self.name = name
+        self.label = label
+        self.depth = depth
+        self.start = 0.0
+        self.seconds = 0.0
+        self.rows = 0
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __bool__(self):
+        return True
+
+    def __enter__(self):
+        self._trace._stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+        self._trace._stack.pop()
+        return False
+
+    def to_dict(self):
+        return {
+            'name': self.name, 'label': self.label, 'depth': self.depth,
+            'start': round(self.start - self._trace.start, 6), 'seconds': round(self.seconds, 6),
+            'rows': self.rows, 'bytes': self.bytes, 'hits': self.hits, 'misses': self.misses,
+        }
+
+
+class _NullSpan:
+    """Stands in for a Span when nothing is being traced; false, and ignores everything"""
+
+    __slots__ = ()
+
+    def __bool__(self):
+        return False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+    rows = bytes = hits = misses = 0
+
+
+_NULL = _NullSpan()
+
+
+class Trace:
+    """Spans of one app rerun (or any other unit of work), in the order they started"""
+
+    def __init__(self, name, labels=None):
+        self.name = name
+        self.labels = dict(labels or {})
+        self.spans = []
+        self._stack = []
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.seconds = None
+
+    def span(self, name, label=None):
+        span = Span(self, name, label, len(self._stack))
+        self.spans.append(span)
+        return span
+
+    def totals(self):
+        """{span name: {'calls', 'seconds', 'rows', 'bytes', 'hits', 'misses'}} of this trace"""
+        totals = {}
+        for span in self.spans:
+            _add(totals, span)
+        return totals
+
+    def to_dict(self):
+        return {
+            'name': self.name, 'labels': self.labels, 'started_at': self.started_at,
+            'seconds': None if self.seconds is None else round(self.seconds, 6),
+            'spans': [span.to_dict() for span in self.spans],
+        }
+
+    def to_json(self, indent=None):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=indent)
+
+
+def _add(totals, span):
+    total = totals.get(span.name)
+    if total is None:
+        total = totals[span.name] = dict.fromkeys(('calls', 'seconds') + _FIELDS, 0)
+    total['calls'] += 1
+    total['seconds'] += span.seconds
+    for field in _FIELDS:
+        total[field] += getattr(span, field)
+
+
+def current():
+    """The trace active in this thread, or None"""
+    return _current.get()
+
+
+def start(name, labels=None):
+    """Begin tracing the current thread and return the new Trace"""
+    trace = Trace(name, labels)
+    _current.set(trace)
+    return trace
+
+
+def finish(trace=None):
+    """Stop the active trace, add it to the history and counters, and return it"""
+    trace = trace or _current.get()
+    if trace is None:
+        return None
+    _current.set(None)
+    trace.seconds = time.perf_counter() - trace.start
+    with _lock:
+        _history.append(trace)
+        _reruns['count'] += 1
+        _reruns['seconds'] += trace.seconds
+        for span in trace.spans:
+            _add(_totals, span)
+    if METRICS_FILE:
+        write_metrics(METRICS_FILE)
+    return trace
+
+
+def write_metrics(path):
+    """Replace path with the Prometheus counters; failures are logged, never raised
+
+    It runs at the end of every traced rerun, and a metrics file that can't
+    be written must not break the page.
+    """
+    try:
+        data = prometheus().encode('utf-8')
+        with fileio.locked(path):
+            fileio.atomic_write(path, data)
+    except Exception:
+        _log.exception('metrics could not be written to %s', path)
+
+
+def span(name, label=None):
+    """Context manager timing a block as a span of the active trace
+
+    Yields the Span (or a false stand-in when nothing is traced), so the
+    block can record what it touched, e.g. ``s.rows = len(df)``.
+    """
+    trace = _current.get()
+    if trace is None:
+        return _NULL
+    return trace.span(name, label)
+
+
+def traced(name):
+    """Decorator recording every call of a function as a span"""
+    def decorate(func):
+        def wrapper(*args, **kwargs):
+            trace = _current.get()
+            if trace is None:
+                return func(*args, **kwargs)
+            with trace.span(name):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__qualname__ = func.__qualname__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorate
+
+
+def note(rows=0, bytes=0, hits=0, misses=0):
+    """Add counts to the innermost running span, if anything is traced"""
+    trace = _current.get()
+    if trace is None or not trace._stack:
+        return
+    span = trace._stack[-1]
+    span.rows += rows
+    span.bytes += bytes
+    span.hits += hits
+    span.misses += misses
+
+
+def history():
+    """Finished traces, oldest first"""
+    with _lock:
+        return list(_history)
+
+
+def totals():
+    """Counters of every finished trace: {span name: {'calls', 'seconds', ...}}"""
+    with _lock:
+        return {name: dict(total) for name, total in _totals.items()}
+
+
+_METRICS = [
+    ('calls', 'cashflow_span_calls_total', 'Calls of each instrumented phase'),
+    ('seconds', 'cashflow_span_seconds_total', 'Wall time spent in each instrumented phase'),
+    ('rows', 'cashflow_span_rows_total', 'Rows touched by each instrumented phase'),
+    ('bytes', 'cashflow_span_read_bytes_total', 'Bytes read from storage by each instrumented phase'),
+    ('hits', 'cashflow_span_cache_hits_total', 'Cache hits inside each instrumented phase'),
+    ('misses', 'cashflow_span_cache_misses_total', 'Cache misses inside each instrumented phase'),
+]
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus():
+    """Counters of every finished trace in the Prometheus text exposition format"""
+    with _lock:
+        reruns = dict(_reruns)
+        counters = {name: dict(total) for name, total in _totals.items()}
+    lines = [
+        '# HELP cashflow_traces_total Traced reruns',
+        '# TYPE cashflow_traces_total counter',
+        f"cashflow_traces_total {reruns['count']}",
+        '# HELP cashflow_trace_seconds_total Wall time of the traced reruns',
+        '# TYPE cashflow_trace_seconds_total counter',
+        f"cashflow_trace_seconds_total {reruns['seconds']:.6f}",
+    ]
+    for field, metric, help_text in _METRICS:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} counter')
+        for name in sorted(counters):
+            value = counters[name][field]
+            value = f'{value:.6f}' if field == 'seconds' else str(value)
+            lines.append(f'{metric}{{span="{_label(name)}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Forget the history and counters"""
+    with _lock:
+        _history.clear()
+        _totals.clear()
+        _reruns.update(count=0, seconds=0.0)
@@ -0,0 +1,154 @@
+"""Background maintenance of the loaded ledgers
+
+Saves and deletes only append (rows, tombstones, delta rows), so the files
+need an occasional rewrite: dropping tombstones, folding Feather deltas into
+the base file and putting rows saved out of date order back in order. A
+single daemon thread does this every CASHFLOW_COMPACT_INTERVAL seconds
+(default 300; 0 turns it off) for the ledgers the app registered with
+watch(), after writing the recurring transactions that fell due. Afterwards
+it reloads them and refreshes the derived data (month index, aggregates and
+their range sums, the combined ledger), so the next request finds
+everything built.
+
+Only ledgers that are loaded in this process are looked at, so idle users
+unloaded by cashflow.tenants stay unloaded.
+"""
+import os
+import threading
+import time
+
+from cashflow import aggregates, combined, ledger, recurring
+from cashflow.query import month_index
+
+INTERVAL = float(os.environ.get('CASHFLOW_COMPACT_INTERVAL', 300))
+
+
+class Worker:
+    """Thread compacting the watched ledgers and refreshing their aggregates every `interval` seconds"""
+
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self._groups = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._status = {
+            'state': 'stopped', 'runs': 0, 'current': None, 'done': 0, 'total': 0,
+            'compacted': 0, 'last_started': None, 'last_seconds': None, 'last_error': None,
+        }
+
+    def watch(self, ledgers):
+        """Look after the ledgers {tipe: filename} from now on"""
+        key = tuple((tipe, os.path.abspath(filename)) for tipe, filename in ledgers.items())
+        with self._lock:
+            if key not in self._groups:
+                self._groups[key] = dict(ledgers)
+
+    def status(self):
+        """Copy of the worker's state
+
+        state is 'stopped', 'idle' or 'running'; during a run, current is the
+        ledger being worked on and done of total the progress. last_started
+        (epoch seconds), last_seconds and last_error describe the last run.
+        """
+        with self._lock:
+            return dict(self._status)
+
+    def _set(self, **changes):
+        with self._lock:
+            self._status.update(changes)
+
+    def start(self):
+        """Start the thread if it isn't running (and the interval isn't 0)"""
+        with self._lock:
+            if self.interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='cashflow-worker', daemon=True)
+            self._status['state'] = 'idle'
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop the thread after its current run"""
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._set(state='stopped')
+
+    def wake(self):
+        """Run as soon as possible instead of waiting for the interval"""
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self.run_once()
+
+    def run_once(self):
+        """Compact and refresh every watched ledger that is loaded; returns the number compacted"""
+        with self._lock:
+            groups = list(self._groups.values())
+        backend = ledger.get_backend()
+        # Ledgers of idle, unloaded users are skipped rather than read back in
+        groups = [ledgers for ledgers in groups
+                  if any(ledger.cached_frame(filename) is not None for filename in ledgers.values())]
+        start = time.perf_counter()
+        self._set(state='running', last_started=time.time(), current=None, done=0,
+                  total=sum(map(len, groups)), compacted=0)
+        compacted, error = 0, None
+        for ledgers in groups:
+            # A failing ledger is reported and skipped; the others are still looked after
+            try:
+                filename = recurring.rules_path(ledgers)
+                recurring.materialize(ledgers)
+                for filename in ledgers.values():
+                    self._set(current=os.path.basename(filename))
+                    if backend.needs_compact(filename):
+                        backend.compact(filename)
+                        compacted += 1
+                    frame = ledger.load_data(filename)
+                    month_index(frame)
+                    aggregates.get(filename).range_sums()
+                    with self._lock:
+                        self._status['done'] += 1
+                        self._status['compacted'] = compacted
+                combined.load(ledgers)
+            except Exception as e:
+                error = f'{os.path.basename(filename)}: {type(e).__name__}: {e}'
+        with self._lock:
+            self._status.update(
+                state='stopped' if self._stop.is_set() else 'idle', current=None,
+                runs=self._status['runs'] + 1, last_seconds=time.perf_counter() - start, last_error=error,
+            )
+        return compacted
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get():
+    """The process-wide worker, created (not started) on first use"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = Worker()
+        return _worker
+
+
+def watch(ledgers):
+    """Register {tipe: filename} with the process-wide worker and make sure it is running"""
+    worker = get()
+    worker.watch(ledgers)
+    worker.start()
+    return worker
+
+
+def status():
+    return get().status()
@@ -0,0 +1,86 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+from cashflow import aggregates, ledger
+
+
+@pytest.fixture(params=['csv', 'feather', 'sqlite', 'partitioned'])
+def backend(request, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    previous = ledger.get_backend()
+    yield ledger.set_backend(request.param)
+    ledger.set_backend(previous)
+    aggregates.invalidate()
+
+
+def _save(day, kategori, jumlah):
+    return ledger.save_data('pengeluaran.csv', {
+        'Tanggal': pd.Timestamp(day), 'Kategori': kategori, 'Jumlah': jumlah, 'Keterangan': '',
+    })
+
+
+def _cells(grouped):
+    cells = {}
+    for (month, key), (total, count) in zip(grouped.index, grouped.to_numpy()):
+        cells.setdefault(month, {})[key] = [int(total), int(count)]
+    return cells
+
+
+def _assert_matches_groupby(store):
+    df = ledger.load_data('pengeluaran.csv')
+    month = df['Tanggal'].dt.strftime('%Y-%m')
+    by_month = df.groupby([month, df['Kategori'].astype(str)], observed=True)['Jumlah'].agg(['sum', 'count'])
+    by_day = df.groupby([month, df['Tanggal']])['Jumlah'].agg(['sum', 'count'])
+    assert store.by_month == _cells(by_month)
+    assert store.by_day == _cells(by_day)
+    assert store.months() == sorted(set(month), reverse=True)
+
+    for start, end in [('2026-01-01', '2026-12-31'), ('2026-01-15', '2026-02-10'), ('2026-02-01', '2026-02-28')]:
+        rows = df[(df['Tanggal'] >= start) & (df['Tanggal'] <= end)]
+        assert store.total_between(datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)) == rows['Jumlah'].sum()
+        expected = rows.groupby(rows['Kategori'].astype(str))['Jumlah'].sum().to_dict()
+        got = store.by_kategori_between(datetime.date.fromisoformat(start), datetime.date.fromisoformat(end))
+        assert dict(zip(got['Kategori'], got['Jumlah'])) == {k: v for k, v in expected.items() if v}
+
+
+def test_incremental_aggregates_match_a_fresh_groupby(backend):
+    backend.init('pengeluaran.csv')
+    _save('2026-01-10', 'Makan', 100)
+    _save('2026-01-20', 'Pulsa', 50)
+    first = _save('2026-02-05', 'Makan', 70)
+    store = aggregates.get('pengeluaran.csv')
+    _assert_matches_groupby(store)
+
+    _save('2026-02-06', 'Makan', 30)
+    _assert_matches_groupby(aggregates.get('pengeluaran.csv'))
+
+    # Saved out of date order
+    _save('2026-01-15', 'Listrik', 200)
+    _assert_matches_groupby(aggregates.get('pengeluaran.csv'))
+
+    ledger.delete_rows('pengeluaran.csv', [first])
+    _assert_matches_groupby(aggregates.get('pengeluaran.csv'))
+
+    # Deleting the last row of a month drops the month
+    february = ledger.load_data('pengeluaran.csv')
+    ledger.delete_rows('pengeluaran.csv', february.loc[february['Tanggal'] >= '2026-02-01', 'ID'].tolist())
+    store = aggregates.get('pengeluaran.csv')
+    _assert_matches_groupby(store)
+    assert store.months() == ['2026-01']
+
+    ledger.compact('pengeluaran.csv')
+    _assert_matches_groupby(aggregates.get('pengeluaran.csv'))
+    assert aggregates.get('pengeluaran.csv').total('2026-01') == 350
+
+
+def test_saves_update_the_counters_in_place(backend):
+    backend.init('pengeluaran.csv')
+    _save('2026-01-10', 'Makan', 100)
+    store = aggregates.get('pengeluaran.csv')
+    version = store.version('2026-01')
+    _save('2026-01-11', 'Makan', 5)
+    assert aggregates.get('pengeluaran.csv') is store
+    assert store.version('2026-01') > version
+    assert store.total('2026-01') == 105
@@ -0,0 +1,28 @@
+import datetime
+import os
+
+from streamlit.testing.v1 import AppTest
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cashflow-app.py')
+
+
+def _save(at, day, jumlah):
+    [d for d in at.date_input if d.label == '📅 Tanggal'][0].set_value(day)
+    at.number_input[0].set_value(jumlah)
+    [b for b in at.button if 'Simpan Pengeluaran' in b.label][0].click()
+    at.run()
+
+
+def test_history_range_follows_new_rows(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    at = AppTest.from_file(APP, default_timeout=60)
+    at.session_state['menu'] = "📉 Pengeluaran"
+    at.run()
+    _save(at, datetime.date(2026, 1, 5), 10000)
+    _save(at, datetime.date(2026, 1, 5), 20000)
+    _save(at, datetime.date(2026, 3, 5), 30000)
+    assert not at.exception
+
+    history = [d for d in at.date_input if d.label == '📅 Rentang Tanggal'][0]
+    assert history.value == (datetime.date(2026, 1, 5), datetime.date(2026, 3, 5))
+    assert any('Menampilkan 3 dari 3 data' in c.value for c in at.caption)
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+
+from cashflow import categories, combined, ledger
+
+LEDGERS = {'Pemasukan': 'pemasukan.csv', 'Pengeluaran': 'pengeluaran.csv'}
+
+
+def _save(filename, day, kategori, jumlah):
+    ledger.save_data(filename, {'Tanggal': pd.Timestamp(day), 'Kategori': kategori, 'Jumlah': jumlah, 'Keterangan': ''})
+
+
+def test_views_share_the_cached_ledgers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _save('pemasukan.csv', '2026-01-25', 'Gaji Pokok', 9000000)
+    _save('pengeluaran.csv', '2026-01-02', 'Pulsa', 100000)
+    _save('pengeluaran.csv', '2026-01-03', 'Makan', 50000)
+
+    book = combined.load(LEDGERS)
+    view = book.view('Pengeluaran')
+    cached = ledger.load_data('pengeluaran.csv')
+    assert np.shares_memory(view['Jumlah'].to_numpy(), cached['Jumlah'].to_numpy())
+    assert np.shares_memory(view['Tanggal'].to_numpy(), cached['Tanggal'].to_numpy())
+    assert list(view['Tipe'].cat.categories) == ['Pemasukan', 'Pengeluaran']
+    assert set(view['Tipe']) == {'Pengeluaran'}
+    assert book.total('Pengeluaran') == 150000
+    assert combined.load(LEDGERS) is book
+
+
+def test_views_show_current_category_names(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _save('pemasukan.csv', '2026-01-25', 'Gaji Pokok', 9000000)
+    _save('pengeluaran.csv', '2026-01-02', 'Pulsa', 100000)
+    categories.get('pengeluaran.csv').rename('Pulsa', 'Pulsa HP')
+
+    book = combined.load(LEDGERS)
+    assert list(book.view('Pengeluaran')['Kategori']) == ['Pulsa HP']
+    assert list(ledger.load_data('pengeluaran.csv')['Kategori']) == ['Pulsa']
+
+    frame = book.frame
+    assert list(frame['Tipe']) == ['Pemasukan', 'Pengeluaran']
+    assert isinstance(frame['Kategori'].dtype, pd.CategoricalDtype)
+    assert set(frame['Kategori'].cat.categories) >= {'Gaji Pokok', 'Pulsa HP'}
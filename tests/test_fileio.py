@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from cashflow import fileio
+
+
+class Counter(fileio.JsonStore):
+    def __init__(self, path):
+        super().__init__(path, {'count': 0})
+        self.refresh()
+
+    def _set_state(self, state):
+        self.count = state['count']
+
+    def _state(self):
+        return {'count': self.count}
+
+    def add(self, n):
+        def change():
+            self.count += n
+            if self.count < 0:
+                raise ValueError('negatif')
+        self._change(change)
+
+
+def test_json_store_shares_changes_and_rolls_back(tmp_path):
+    path = str(tmp_path / 'counter.json')
+    first, second = Counter(path), Counter(path)
+    first.add(2)
+    second.add(3)
+    assert first.refresh() and first.count == 5
+
+    with pytest.raises(ValueError):
+        first.add(-10)
+    assert first.count == 5
+    assert Counter(path).count == 5
+
+
+def test_json_store_subclass_must_define_its_state(tmp_path):
+    class Incomplete(fileio.JsonStore):
+        def _set_state(self, state):
+            self.state = state
+
+    with pytest.raises(TypeError):
+        Incomplete(str(tmp_path / 'x.json'), {})
+
+
+def test_signature_and_size_of_missing_file(tmp_path):
+    path = str(tmp_path / 'tidak-ada.csv')
+    assert fileio.signature(path) is None
+    assert fileio.size(path) == 0
+
+
+def test_atomic_write_concurrent_writers(tmp_path):
+    path = str(tmp_path / 'data.bin')
+    errors = []
+
+    def write(n):
+        for _ in range(100):
+            try:
+                fileio.atomic_write(path, str(n).encode() * 100)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with open(path, 'rb') as f:
+        assert len(set(f.read())) == 1
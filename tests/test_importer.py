@@ -0,0 +1,39 @@
+import io
+
+from cashflow import importer, ledger
+
+STATEMENT = '''Tanggal;Keterangan;Debet;Kredit
+01/03/2025;Gaji Maret;;8.500.000
+02/03/2025;Belanja bulanan;1.250.000;
+05/03/2025;Bunga tabungan;0;12.345
+06/03/2025;Listrik;350.000;0
+07/03/2025;Tanpa nominal;;
+'''
+
+
+def test_debet_kredit_statement_is_split_by_type(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    income = importer.import_csv(io.StringIO(STATEMENT), 'pemasukan.csv', tipe='Pemasukan', sep=';')
+    expense = importer.import_csv(io.StringIO(STATEMENT), 'pengeluaran.csv', tipe='Pengeluaran', sep=';')
+
+    assert (income.imported, income.skipped, income.rejected) == (2, 2, 1)
+    assert (expense.imported, expense.skipped, expense.rejected) == (2, 2, 1)
+    assert list(income.errors['Baris']) == [6]
+
+    pemasukan = ledger.load_data('pemasukan.csv')
+    pengeluaran = ledger.load_data('pengeluaran.csv')
+    assert sorted(pemasukan['Jumlah']) == [12345, 8500000]
+    assert sorted(pengeluaran['Jumlah']) == [350000, 1250000]
+    assert set(pengeluaran['Keterangan']) == {'Belanja bulanan', 'Listrik'}
+
+
+def test_column_mapping_accepts_either_amount_column():
+    assert importer.column_mapping(['Tgl', 'Kredit']) == {'Tgl': 'Tanggal', 'Kredit': 'Kredit'}
+    mapping = importer.column_mapping(['Date', 'Amount', 'Debit'])
+    assert mapping['Amount'] == 'Jumlah'
+    try:
+        importer.column_mapping(['Tanggal', 'Keterangan'])
+    except ValueError as e:
+        assert 'Debet/Kredit' in str(e)
+    else:
+        raise AssertionError('kolom jumlah wajib ada')
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from cashflow import portfolio
+
+
+def _prices(instrument, start, end, price):
+    days = pd.date_range(start, end)
+    return pd.DataFrame({'Tanggal': days, 'Instrumen': instrument, 'Harga': float(price)})
+
+
+def test_update_refills_the_days_after_an_import(tmp_path):
+    store = portfolio.PriceStore(str(tmp_path / 'harga.npy'))
+    store.update(_prices('BBRI', '2025-01-01', '2025-01-31', 100))
+    store.update(pd.concat([
+        _prices('BBRI', '2025-02-01', '2025-02-28', 200),
+        _prices('GOOG', '2025-01-01', '2025-03-31', 50),
+    ], ignore_index=True))
+    assert store.price('BBRI', '2025-01-15') == 100
+    assert store.price('BBRI', '2025-03-15') == 200
+
+    # Re-importing the middle of a range carries forward only up to the next stored close
+    store.update(_prices('GOOG', '2025-02-01', '2025-02-10', 70))
+    assert store.price('GOOG', '2025-02-05') == 70
+    assert store.price('GOOG', '2025-02-11') == 50
+
+    store.update(pd.DataFrame({'Tanggal': [pd.Timestamp('2025-02-20')], 'Instrumen': ['BBRI'], 'Harga': [300.0]}))
+    assert store.price('BBRI', '2025-02-19') == 200
+    assert store.price('BBRI', '2025-02-21') == 200
+    assert store.price('BBRI', '2025-03-31') == 200
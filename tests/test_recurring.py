@@ -0,0 +1,61 @@
+import datetime
+import json
+
+from cashflow import ledger, recurring
+
+LEDGERS = {'Pemasukan': 'pemasukan.csv', 'Pengeluaran': 'pengeluaran.csv'}
+
+
+def _dates(filename):
+    return [d.date().isoformat() for d in ledger.load_data(filename)['Tanggal']]
+
+
+def test_materialize_is_idempotent(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rules = recurring.get(LEDGERS)
+    rule_id = rules.add('Pengeluaran', 'Listrik', 300000, '2026-01-05')
+    assert recurring.materialize(LEDGERS, datetime.date(2026, 3, 31)) == {'Pengeluaran': 3}
+    assert recurring.materialize(LEDGERS, datetime.date(2026, 3, 31)) == {}
+
+    frame = ledger.load_data('pengeluaran.csv')
+    assert _dates('pengeluaran.csv') == ['2026-01-05', '2026-02-05', '2026-03-05']
+    assert frame['ID'].tolist() == [recurring.occurrence_id(rule_id, d) for d in _dates('pengeluaran.csv')]
+
+    # A run that wrote the rows but died before saving the rules doesn't write them again
+    with open('rutin.json', encoding='utf-8') as f:
+        state = json.load(f)
+    state['rules'][0]['done'] = 1
+    with open('rutin.json', 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    recurring.invalidate()
+    assert recurring.materialize(LEDGERS, datetime.date(2026, 3, 31)) == {'Pengeluaran': 0}
+    assert len(ledger.load_data('pengeluaran.csv')) == 3
+
+    # Deleted occurrences stay deleted
+    ledger.delete_rows('pengeluaran.csv', frame['ID'].tolist()[:1])
+    assert recurring.materialize(LEDGERS, datetime.date(2026, 4, 5)) == {'Pengeluaran': 1}
+    assert _dates('pengeluaran.csv') == ['2026-02-05', '2026-03-05', '2026-04-05']
+
+
+def test_monthly_rules_keep_to_the_last_day_of_short_months(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rules = recurring.get(LEDGERS)
+    rules.add('Pemasukan', 'Gaji Pokok', 9000000, '2024-01-31')
+    rules.add('Pengeluaran', 'Pulsa', 100000, '2024-01-31', interval=3)
+    recurring.materialize(LEDGERS, datetime.date(2024, 7, 31))
+    assert _dates('pemasukan.csv') == [
+        '2024-01-31', '2024-02-29', '2024-03-31', '2024-04-30', '2024-05-31', '2024-06-30', '2024-07-31',
+    ]
+    assert _dates('pengeluaran.csv') == ['2024-01-31', '2024-04-30', '2024-07-31']
+
+
+def test_end_dates_and_weekly_rules(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    rules = recurring.get(LEDGERS)
+    rules.add('Pengeluaran', 'Makan', 50000, '2026-01-01', frequency='weekly', interval=2, end='2026-02-11')
+    rules.add('Pengeluaran', 'Minum', 5000, '2026-01-30', frequency='daily', end='2026-02-02')
+    assert recurring.materialize(LEDGERS, datetime.date(2026, 12, 31)) == {'Pengeluaran': 7}
+    assert sorted(_dates('pengeluaran.csv')) == [
+        '2026-01-01', '2026-01-15', '2026-01-29', '2026-01-30', '2026-01-31', '2026-02-01', '2026-02-02',
+    ]
+    assert not rules.pending(datetime.date(2030, 1, 1))
@@ -0,0 +1,217 @@
+import os
+import sqlite3
+import time
+
+import pandas as pd
+import pytest
+
+from cashflow import storage
+
+
+def test_partitioned_keterangan_with_line_breaks(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    backend = storage.PartitionedBackend()
+    backend.init('pengeluaran.csv')
+    backend.append('pengeluaran.csv', [
+        {'Tanggal': '2026-01-10', 'Kategori': 'Makan', 'Jumlah': 100, 'Keterangan': 'satu'},
+        {'Tanggal': '2026-02-10', 'Kategori': 'Makan', 'Jumlah': 200, 'Keterangan': 'baris 1\nbaris 2'},
+        {'Tanggal': '2026-03-10', 'Kategori': 'Makan', 'Jumlah': 400, 'Keterangan': 'tiga'},
+    ])
+    backend.load('pengeluaran.csv')
+    backend.append('pengeluaran.csv', [
+        {'Tanggal': '2026-02-20', 'Kategori': 'Makan', 'Jumlah': 105, 'Keterangan': 'lagi'},
+    ])
+
+    frame = backend.load('pengeluaran.csv')
+    assert len(frame) == 4
+    assert not frame['ID'].duplicated().any()
+    february = backend.load_month('pengeluaran.csv', '2026-02')
+    assert february['Jumlah'].sum() == 305
+    assert 'baris 1\nbaris 2' in february['Keterangan'].tolist()
+    assert backend.load_month('pengeluaran.csv', '2026-03')['Jumlah'].tolist() == [400]
+
+    # A fresh process reads every month in one parse
+    frame = storage.PartitionedBackend().load('pengeluaran.csv')
+    assert sorted(frame['Jumlah']) == [100, 105, 200, 400]
+    assert frame.groupby(frame['Tanggal'].dt.strftime('%Y-%m'))['Jumlah'].sum().to_dict() == {
+        '2026-01': 100, '2026-02': 305, '2026-03': 400,
+    }
+
+
+def test_count_rows_ignores_quoted_line_breaks():
+    data = storage._to_csv(pd.DataFrame({
+        'Tanggal': ['2026-01-01', '2026-01-02'], 'Kategori': ['A', 'B'], 'Jumlah': [1, 2],
+        'Keterangan': ['kata "kutip"\nlanjut', 'x'], 'ID': ['a', 'b'],
+    }), header=False)
+    assert storage._count_rows(data) == 2
+
+
+def test_sqlite_init_and_cached_load_skip_the_write_lock(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    backend = storage.SqliteBackend()
+    backend.init('pengeluaran.csv')
+    backend.append('pengeluaran.csv', [{'Tanggal': '2026-01-10', 'Kategori': 'Makan', 'Jumlah': 100, 'Keterangan': ''}])
+    frame = backend.load('pengeluaran.csv')
+
+    # Another session holds the write lock: reruns still init and load from the cache
+    other = sqlite3.connect('cashflow.db', isolation_level=None)
+    other.execute('BEGIN IMMEDIATE')
+    try:
+        backend.init('pengeluaran.csv')
+        assert backend.load('pengeluaran.csv') is frame
+    finally:
+        other.execute('ROLLBACK')
+        other.close()
+
+    storage.SqliteBackend().append('pengeluaran.csv', [
+        {'Tanggal': '2026-01-11', 'Kategori': 'Makan', 'Jumlah': 50, 'Keterangan': ''},
+    ])
+    assert backend.load('pengeluaran.csv')['Jumlah'].tolist() == [100, 50]
+
+
+def _rows(*days):
+    return [{'Tanggal': day, 'Kategori': 'Makan', 'Jumlah': int(day[-2:]), 'Keterangan': ''} for day in days]
+
+
+@pytest.mark.parametrize('make', [storage.CsvBackend, storage.FeatherBackend], ids=['csv', 'feather'])
+def test_compaction_keeps_rows_written_while_it_runs(tmp_path, monkeypatch, make):
+    monkeypatch.chdir(tmp_path)
+    backend = make()
+    backend.init('pengeluaran.csv')
+    ids = backend.append('pengeluaran.csv', _rows('2026-01-20', '2026-01-10', '2026-01-15'))
+    backend.delete('pengeluaran.csv', [ids[0]])
+    backend.load('pengeluaran.csv')
+    assert backend.needs_compact('pengeluaran.csv')
+
+    # Another process saves and deletes after compaction read the ledger, before its swap
+    other = make()
+    date_sorted = storage.date_sorted
+
+    def racing(df):
+        other.append('pengeluaran.csv', _rows('2026-01-05'))
+        other.delete('pengeluaran.csv', [ids[1]])
+        return date_sorted(df)
+
+    monkeypatch.setattr(storage, 'date_sorted', racing)
+    backend.compact('pengeluaran.csv')
+    monkeypatch.setattr(storage, 'date_sorted', date_sorted)
+
+    expected = [15, 5]
+    assert backend.load('pengeluaran.csv')['Jumlah'].tolist() == expected
+    assert make().load('pengeluaran.csv')['Jumlah'].tolist() == expected
+    backend.compact('pengeluaran.csv')
+    assert make().load('pengeluaran.csv')['Jumlah'].tolist() == [5, 15]
+    assert not backend.needs_compact('pengeluaran.csv')
+
+
+@pytest.mark.parametrize('make', [storage.CsvBackend, storage.FeatherBackend], ids=['csv', 'feather'])
+def test_deleting_an_unknown_id_changes_nothing(tmp_path, monkeypatch, make):
+    monkeypatch.chdir(tmp_path)
+    backend = make()
+    backend.init('pengeluaran.csv')
+    backend.append('pengeluaran.csv', _rows('2026-01-10', '2026-01-11'))
+    before = backend.load('pengeluaran.csv')
+    backend.delete('pengeluaran.csv', ['tidak-ada'])
+    assert backend.load('pengeluaran.csv')['ID'].tolist() == before['ID'].tolist()
+    backend.compact('pengeluaran.csv')
+    assert make().load('pengeluaran.csv')['ID'].tolist() == before['ID'].tolist()
+
+
+def test_tombstones_trigger_background_compaction(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    backend = storage.CsvBackend(compact_tombstones=2)
+    backend.init('pengeluaran.csv')
+    ids = backend.append('pengeluaran.csv', _rows('2026-01-10', '2026-01-11', '2026-01-12'))
+    backend.delete('pengeluaran.csv', ids[:2])
+    backend.load('pengeluaran.csv')
+    deadline = time.monotonic() + 10
+    while backend.cache_stats()['compactions'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert backend.cache_stats()['compactions'] == 1
+    assert backend.tombstones('pengeluaran.csv') == set()
+    with open('pengeluaran.csv', encoding='utf-8') as f:
+        assert len(f.read().splitlines()) == 2
+
+
+def _touch_later(path):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_csv_tail_read_of_another_process_append(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    backend = storage.CsvBackend()
+    backend.init('pengeluaran.csv')
+    backend.append('pengeluaran.csv', _rows('2026-01-10', '2026-01-11'))
+    first = backend.load('pengeluaran.csv')
+
+    storage.CsvBackend().append('pengeluaran.csv', _rows('2026-01-12'))
+    frame = backend.load('pengeluaran.csv')
+    assert backend.stats['tail_reads'] == 1
+    assert frame['Jumlah'].tolist() == [10, 11, 12]
+    assert frame['ID'].tolist()[:2] == first['ID'].tolist()
+
+
+def test_csv_rewrites_are_read_in_full(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    backend = storage.CsvBackend()
+    backend.init('pengeluaran.csv')
+    backend.append('pengeluaran.csv', _rows('2026-01-10', '2026-01-11', '2026-01-12'))
+    backend.load('pengeluaran.csv')
+
+    # Rewritten in place with the same size: only an early amount changes
+    with open('pengeluaran.csv', 'rb') as f:
+        data = f.read()
+    with open('pengeluaran.csv', 'r+b') as f:
+        f.write(data.replace(b',10,', b',90,', 1))
+    _touch_later('pengeluaran.csv')
+    assert backend.load('pengeluaran.csv')['Jumlah'].tolist() == [90, 11, 12]
+
+    # Truncated to its first row
+    with open('pengeluaran.csv', 'wb') as f:
+        f.write(b''.join(data.splitlines(keepends=True)[:2]))
+    assert backend.load('pengeluaran.csv')['Jumlah'].tolist() == [10]
+    assert backend.stats['tail_reads'] == 0
+
+
+def test_csv_partial_last_line_is_read_once_complete(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    backend = storage.CsvBackend()
+    backend.init('pengeluaran.csv')
+    backend.append('pengeluaran.csv', _rows('2026-01-10'))
+    backend.load('pengeluaran.csv')
+
+    with open('pengeluaran.csv', 'ab') as f:
+        f.write(b'2026-01-11,Makan,11,,abc')
+    assert backend.load('pengeluaran.csv')['Jumlah'].tolist() == [10]
+    with open('pengeluaran.csv', 'ab') as f:
+        f.write(b'def\n')
+    frame = backend.load('pengeluaran.csv')
+    assert frame['Jumlah'].tolist() == [10, 11]
+    assert frame['ID'].tolist()[-1] == 'abcdef'
+    assert backend.stats['tail_reads'] == 2
+
+
+@pytest.mark.parametrize('make', [storage.CsvBackend, storage.FeatherBackend], ids=['csv', 'feather'])
+def test_init_of_a_ready_ledger_takes_no_lock(tmp_path, monkeypatch, make):
+    monkeypatch.chdir(tmp_path)
+    backend = make()
+    backend.init('pengeluaran.csv')
+
+    def locked(path, timeout=None):
+        raise AssertionError(f'{path} locked')
+
+    monkeypatch.setattr(storage.fileio, 'locked', locked)
+    backend.init('pengeluaran.csv')
+    make().init('pengeluaran.csv')
+
+
+def test_csv_init_adds_ids_to_an_older_ledger(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open('pengeluaran.csv', 'w', encoding='utf-8') as f:
+        f.write('Tanggal,Kategori,Jumlah,Keterangan\n2026-01-10,Makan,100,\n')
+    backend = storage.CsvBackend()
+    backend.init('pengeluaran.csv')
+    with open('pengeluaran.csv', encoding='utf-8') as f:
+        assert f.readline().strip() == 'Tanggal,Kategori,Jumlah,Keterangan,ID'
+    assert backend.load('pengeluaran.csv')['Jumlah'].tolist() == [100]
@@ -0,0 +1,37 @@
+import os
+import threading
+
+from cashflow import trace
+
+
+def test_concurrent_reruns_write_the_metrics_file(tmp_path, monkeypatch):
+    path = str(tmp_path / 'cashflow.prom')
+    monkeypatch.setattr(trace, 'METRICS_FILE', path)
+    errors = []
+
+    def rerun():
+        for _ in range(50):
+            try:
+                trace.start('rerun')
+                with trace.span('load_data'):
+                    pass
+                trace.finish()
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=rerun) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with open(path, encoding='utf-8') as f:
+        assert 'cashflow_span_calls_total{span="load_data"}' in f.read()
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_metrics_failure_does_not_break_the_rerun(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(trace, 'METRICS_FILE', str(tmp_path / 'tidak-ada' / 'cashflow.prom'))
+    started = trace.start('rerun')
+    assert trace.finish() is started
+    assert 'metrics could not be written' in caplog.text